@@ -2,4 +2,8 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
-from harness import main as harness_main
+def harness_main():
+    # imported here, so that importing any mcts module doesn't import the
+    # harness and everything it depends on
+    from harness import main
+    return main()
@@ -5,31 +5,27 @@
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import argparse
-import ConfigParser
 import json
 import logging
 import os
 import sys
 import pkg_resources
 import re
-import StringIO
+import shutil
+import tempfile
 import time
 import traceback
 import wait
 
-from py.xml import html
 from zipfile import ZipFile
 
-import fxos_appgen
-import marionette
-import mozdevice
-import moznetwork
-import wptserve
-
 from mozlog.structured import commandline
 
-from omni_analyzer import OmniAnalyzer
-from mcts.utils.device.devicehelper import DeviceHelper
+from results_index import open_index
+
+# fxos_appgen, marionette, mozdevice, moznetwork, wptserve and py.xml are
+# imported by the functions that use them, so that listing the test groups
+# and parsing arguments don't pay for importing them.
 
 """Signalizes whether client has made initial connection to HTTP
 server.
@@ -57,7 +53,6 @@ expected_results_path = '../static/expected_results'
 expected_result_folder = os.path.join('..', 'static', 'expected_results')
 
 
-@wptserve.handlers.handler
 def webapi_results_handler(request, response):
     global headers
     headers = request.headers
@@ -69,7 +64,6 @@ def webapi_results_handler(request, response):
     response.content = "ok"
 
 
-@wptserve.handlers.handler
 def webapi_results_embed_apps_handler(request, response):
     global webapi_results_embed_app
     webapi_results_embed_app = json.loads(request.POST["results"])
@@ -78,7 +72,6 @@ def webapi_results_embed_apps_handler(request, response):
     response.content = "ok"
 
 
-@wptserve.handlers.handler
 def webapi_log_handler(request, response):
     global last_test_started
     global logger
@@ -93,10 +86,13 @@ def webapi_log_handler(request, response):
     response.content = "ok"
 
 
-routes = [("POST", "/webapi_results", webapi_results_handler),
-          ("POST", "/webapi_results_embed_apps", webapi_results_embed_apps_handler),
-          ("POST", "/webapi_log", webapi_log_handler),
-          ("GET", "/*", wptserve.handlers.file_handler)]
+def get_routes():
+    import wptserve
+    handler = wptserve.handlers.handler
+    return [("POST", "/webapi_results", handler(webapi_results_handler)),
+            ("POST", "/webapi_results_embed_apps", handler(webapi_results_embed_apps_handler)),
+            ("POST", "/webapi_log", handler(webapi_log_handler)),
+            ("GET", "/*", wptserve.handlers.file_handler)]
 
 mcts_current_path = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
 static_path = os.path.join(mcts_current_path, "static")
@@ -107,8 +103,7 @@ def read_manifest(app):
     return manifest
 
 
-def package_app(path, extrafiles={}):
-    app_path = 'app.zip'
+def package_app(path, extrafiles={}, app_path='app.zip'):
     with ZipFile(app_path, 'w') as zip_file:
         for root, dirs, files in os.walk(path):
             for f in files:
@@ -120,10 +115,11 @@ def package_app(path, extrafiles={}):
 
 
 def install_app(logger, appname, version, apptype, apppath, all_perms,
-                extrafiles, launch=False):
+                extrafiles, launch=False, marionette=None):
+    import fxos_appgen
 
     logger.debug('uninstalling: %s' % appname)
-    fxos_appgen.uninstall_app(appname)
+    fxos_appgen.uninstall_app(appname, marionette=marionette)
 
     logger.debug('packaging: %s version: %s apptype: %s all_perms: %s' %
         (appname, version, apptype, all_perms))
@@ -132,17 +128,47 @@ def install_app(logger, appname, version, apptype, apppath, all_perms,
     manifest = json.dumps(fxos_appgen.create_manifest(appname, details, apptype, version))
     files = extrafiles.copy()
     files['manifest.webapp'] = manifest
-    package_app(apppath, files)
-
-    logger.debug('installing: %s' % appname)
-    fxos_appgen.install_app(appname, 'app.zip', script_timeout=120000)
+    # several devices may be running this suite from the same directory,
+    # so each install gets its own package
+    package_dir = tempfile.mkdtemp(prefix='mcts_app_')
+    try:
+        app_path = os.path.join(package_dir, 'app.zip')
+        package_app(apppath, files, app_path)
+
+        logger.debug('installing: %s' % appname)
+        fxos_appgen.install_app(appname, app_path, script_timeout=120000,
+                                marionette=marionette)
+    finally:
+        shutil.rmtree(package_dir, ignore_errors=True)
     if launch:
         logger.debug('launching: %s' % appname)
-        fxos_appgen.launch_app(appname)
+        fxos_appgen.launch_app(appname, marionette=marionette)
 
 def test_id(suite, test, subtest):
     return '%s.%s.%s' % (suite, test, subtest)
 
+def filter_groups(test_groups, tests):
+    """Return the test groups that the --test ids select"""
+    selected = set(t.split('.')[1] for t in tests if t.count('.') >= 1)
+    return [x for x in test_groups if x in selected]
+
+def filter_variants(group, tests):
+    """Return the app types (or 'individual' for the individual
+    permissions) of the test group that the --test ids select, or None if
+    they select all of the group. Test names start with their app type,
+    e.g. cert.webapi.privileged-missing-window-functions."""
+    if not tests:
+        return None
+    variants = set()
+    for t in tests:
+        parts = t.split('.', 2)
+        if len(parts) < 2 or parts[1] != group:
+            continue
+        if len(parts) < 3:
+            return None
+        variants.add(parts[2].split('-', 1)[0])
+    return variants
+
 def log_pass(logger, testid, message=''):
     logger.test_end(testid, 'PASS', expected='PASS', message=message)
 
@@ -153,6 +179,8 @@ def log_fail(logger, testid, message=''):
     logger.test_end(testid, 'FAIL', expected='PASS', message=message)
 
 def test_omni_analyzer(logger, report, args):
+    from omni_analyzer import OmniAnalyzer
+
     testid = test_id('cert', 'omni-analyzer', 'check-omni-diff')
     logger.test_start(testid)
     omni_ref_path = pkg_resources.resource_filename(
@@ -164,12 +192,24 @@ def test_omni_analyzer(logger, report, args):
         diff, is_run_success = omni_analyzer.run()
     report["omni_result"] = diff
 
-def test_webapi(logger, report, args, addr):
+def test_webapi(logger, report, args, addr, variants=None):
+    import fxos_appgen
+    from mcts.utils.device.devicehelper import DeviceHelper
+
+    # fxos_appgen would otherwise connect to marionette on the default
+    # port, which is another device's when running on several at once
+    sessions = DeviceHelper.getSessionPool()
+
     errors = False
 
     logger.debug('Running webapi verifier tests')
 
     for apptype in ['web', 'privileged', 'certified']:
+        if variants is not None and apptype not in variants:
+            continue
+
+        m = sessions.content()
+
         global webapi_results
 
         webapi_results = None
@@ -180,7 +220,7 @@ def test_webapi(logger, report, args, addr):
         install_app(logger, appname, args.version, apptype, apppath, True,
                     {'results_uri.js':
                         'RESULTS_URI="http://%s:%s/webapi_results";LOG_URI="http://%s:%s/webapi_log";' % (addr * 2)},
-                    True)
+                    True, marionette=m)
 
         try:
             wait.Wait(timeout=120).until(lambda: webapi_results is not None)
@@ -189,7 +229,7 @@ def test_webapi(logger, report, args, addr):
             errors = True
 
         logger.debug('uninstalling: %s' % appname)
-        fxos_appgen.uninstall_app(appname)
+        fxos_appgen.uninstall_app(appname, marionette=m)
 
         if webapi_results is None:
             continue
@@ -216,29 +256,37 @@ def test_webapi(logger, report, args, addr):
     if errors:
         logger.error('Test webapi with errors')
 
-def test_permissions(logger, report, args, addr):
-    errors = False
+def test_permissions(logger, report, args, addr, variants=None):
+    import fxos_appgen
+    from mcts.utils.device.devicehelper import DeviceHelper
+
+    # All the probing below runs in the pooled marionette session, rather
+    # than starting a session for each script; it is checked again before
+    # each app, as b2g may have dropped it meanwhile
+    sessions = DeviceHelper.getSessionPool()
+    m = sessions.content()
 
     #logger.test_start('permissions')
     logger.debug('Running permissions tests')
 
-    permissions = get_permissions()
+    permissions = get_permissions(marionette=m)
 
     # test default permissions
     for apptype in ['web', 'privileged', 'certified']:
+        if variants is not None and apptype not in variants:
+            continue
+
         logger.debug('Testing default permissions: %s' % apptype)
-        results = {}
         expected_webapi_results = None
+        m = sessions.content()
 
         appname = 'Default Permissions Test App'
-        fxos_appgen.uninstall_app(appname)
+        fxos_appgen.uninstall_app(appname, marionette=m)
         installed_appname = appname.lower().replace(" ", "-")
         fxos_appgen.generate_app(appname, install=True, app_type=apptype,
-                                 all_perm=True)
+                                 all_perm=True, marionette=m)
 
-        for permission in permissions:
-            result = get_permission(permission, installed_appname)
-            results[permission] = result
+        results = get_app_permissions(permissions, installed_appname, marionette=m)
 
         results_folder = 'permissions_ref/'
         results_filename = '%s.json' % apptype
@@ -255,9 +303,16 @@ def test_permissions(logger, report, args, addr):
             parse_permissions_results(file_path, results, '%s-' % apptype,
                 logger, report)
 
-        fxos_appgen.uninstall_app(appname)
+        fxos_appgen.uninstall_app(appname, marionette=m)
+
+    if variants is None or 'individual' in variants:
+        test_individual_permissions(logger, report, args, addr, permissions, sessions)
+
+def test_individual_permissions(logger, report, args, addr, permissions, sessions):
+    import fxos_appgen
 
-    # test individual permissions
+    m = sessions.content()
+    errors = False
     logger.debug('Testing individual permissions')
     results = {}
 
@@ -267,7 +322,7 @@ def test_permissions(logger, report, args, addr):
     apppath = os.path.join(sampleapppath, 'embed-apps-test-app')
     install_app(logger, embed_appname, args.version, 'certified', apppath, True,
                 {'results_uri.js': 'RESULTS_URI="http://%s:%s/webapi_results_embed_apps";' % addr},
-                 False)
+                 False, marionette=m)
 
     appname = 'Permissions Test App'
     installed_appname = appname.lower().replace(" ", "-")
@@ -275,24 +330,26 @@ def test_permissions(logger, report, args, addr):
     apppath = os.path.join(sampleapppath, 'permissions-test-app')
     install_app(logger, appname, args.version, 'web', apppath, False,
             {'results_uri.js':
-                'RESULTS_URI="http://%s:%s/webapi_results";LOG_URI="http://%s:%s/webapi_log";' % (addr * 2)})
+                'RESULTS_URI="http://%s:%s/webapi_results";LOG_URI="http://%s:%s/webapi_log";' % (addr * 2)},
+            marionette=m)
 
     for permission in [None] + permissions:
         global webapi_results
         global webapi_results_embed_app
         webapi_results = None
         webapi_results_embed_app = None
-
-        # if we try to launch after killing too quickly, the app seems
-        # to not fully launch
-        time.sleep(5)
+        m = sessions.content()
 
         if permission is not None:
+            # if we try to launch after killing too quickly, the app seems
+            # to not fully launch; nothing has been killed before the
+            # baseline run
+            time.sleep(5)
             logger.debug('testing permission: %s' % permission)
-            set_permission(permission, u'allow', installed_appname)
+            set_permission(permission, u'allow', installed_appname, marionette=m)
         else:
             logger.debug('testing permission: None')
-        fxos_appgen.launch_app(appname)
+        fxos_appgen.launch_app(appname, marionette=m)
 
         try:
             wait.Wait(timeout=60).until(lambda: webapi_results is not None)
@@ -318,17 +375,18 @@ def test_permissions(logger, report, args, addr):
                 logger.error('Could not get baseline results for permissions. Skipping tests.')
                 break
 
-        kill('app://' + installed_appname)
+        kill('app://' + installed_appname, marionette=m)
         if permission is not None:
-            set_permission(permission, u'deny', installed_appname)
+            set_permission(permission, u'deny', installed_appname, marionette=m)
 
+    m = sessions.content()
     logger.debug('uninstalling: %s' % appname)
-    fxos_appgen.uninstall_app(appname)
+    fxos_appgen.uninstall_app(appname, marionette=m)
 
     # we test open-remote-window separately as opening a remote
     # window might stop the test app
     results['open-remote-window'] = test_open_remote_window(logger,
-                                        args.version, addr)
+                                        args.version, addr, marionette=m)
 
     results_folder = 'permissions_ref/'
     results_filename = 'permissions.json'
@@ -350,8 +408,9 @@ def test_permissions(logger, report, args, addr):
         logger.error('Test individual with errors')
 
     # clean up embed-apps test app
+    m = sessions.content()
     logger.debug('uninstalling: %s' % embed_appname)
-    fxos_appgen.uninstall_app(embed_appname)
+    fxos_appgen.uninstall_app(embed_appname, marionette=m)
 
 def test_crash_reporter(logger, report):
     testid = test_id('cert','crash-reporter', 'crash-report-toggle')
@@ -403,7 +462,9 @@ def test_user_agent(logger, report):
     else:
         log_ok(logger, testid, 'current user-agent string: %s: %s' % (user_agent, message))
 
-def test_open_remote_window(logger, version, addr):
+def test_open_remote_window(logger, version, addr, marionette=None):
+    import fxos_appgen
+
     global webapi_results
 
     results = {}
@@ -417,10 +478,12 @@ def test_open_remote_window(logger, version, addr):
         apppath = os.path.join(sampleapppath, 'open-remote-window-test-app')
         install_app(logger, appname, version, 'web', apppath, False,
             {'results_uri.js':
-                'RESULTS_URI="http://%s:%s/webapi_results";' % addr})
+                'RESULTS_URI="http://%s:%s/webapi_results";' % addr},
+            marionette=marionette)
 
-        set_permission('open-remote-window', value, installed_appname)
-        fxos_appgen.launch_app(appname)
+        set_permission('open-remote-window', value, installed_appname,
+                       marionette=marionette)
+        fxos_appgen.launch_app(appname, marionette=marionette)
         try:
             wait.Wait(timeout=30).until(lambda: webapi_results is not None)
         except wait.TimeoutException:
@@ -431,9 +494,9 @@ def test_open_remote_window(logger, version, addr):
 
         # launching here will force the remote window (if any) to be hidden
         # but will not retrigger the test.
-        fxos_appgen.launch_app(appname)
+        fxos_appgen.launch_app(appname, marionette=marionette)
         logger.debug('uninstalling: %s' % appname)
-        fxos_appgen.uninstall_app(appname)
+        fxos_appgen.uninstall_app(appname, marionette=marionette)
 
         results['open-remote-window-' + value] = result
 
@@ -472,36 +535,20 @@ def log_results(diff, logger, report, test_group, name):
         log_pass(logger, testid)
 
 def parse_webapi_results(expected_results_path, results, prefix, logger, report):
-    with open(expected_results_path) as f:
-        expected_results = json.load(f)
-
-    #compute difference in window functions
-    expected_window = expected_results["windowList"]
-    window = results["windowList"]
+    with open_index(expected_results_path) as expected_results:
+        #compute difference in window functions
+        expected_window = expected_results.window_list
+        window = results["windowList"]
 
-    missing_window = diff_results(window, expected_window)
-    log_results(missing_window, logger, report, 'webapi', prefix + 'missing-window-functions')
+        missing_window = diff_results(window, expected_window)
+        log_results(missing_window, logger, report, 'webapi', prefix + 'missing-window-functions')
 
-    added_window = diff_results(expected_window, window)
-    log_results(added_window, logger, report, 'webapi', prefix + 'added-window-functions')
-
-    # compute differences in WebIDL results
-    expected_webidl = {}
-    for result in expected_results['webIDLResults']:
-        expected_webidl[result['name']] = result
-
-    unexpected_webidl_results = []
-    added_webidl_results = []
-    for result in results['webIDLResults']:
-        try:
-            if expected_webidl[result['name']]['result'] != result['result']:
-                unexpected_webidl_results.append(result)
-            del expected_webidl[result['name']]
-        except KeyError:
-            added_webidl_results.append(result)
+        added_window = diff_results(expected_window, window)
+        log_results(added_window, logger, report, 'webapi', prefix + 'added-window-functions')
 
-    # since we delete found results above, anything here is missing
-    missing_webidl_results = list(expected_webidl.values())
+        # compute differences in WebIDL results
+        unexpected_webidl_results, added_webidl_results, missing_webidl_results = \
+            expected_results.diff(results['webIDLResults'])
 
     log_results(unexpected_webidl_results, logger, report, 'webapi', prefix + 'unexpected-webidl-results')
     log_results(added_webidl_results, logger, report, 'webapi', prefix + 'added-webidl-results')
@@ -517,30 +564,34 @@ def parse_permissions_results(expected_results_path, results, prefix, logger, re
     return not unexpected_results
 
 
-def run_marionette_script(script, chrome=False, async=False, host='localhost', port=2828):
-    """Create a Marionette instance and run the provided script"""
-    m = DeviceHelper.getMarionette(host, port)
-    m.start_session()
+def run_marionette_script(script, chrome=False, async=False, host='localhost', port=None,
+                          marionette=None):
+    """Run the provided script in the given marionette session, or in the
+    pooled session if there is none"""
+    if marionette is None:
+        from mcts.utils.device.devicehelper import DeviceHelper
+        return DeviceHelper.getSessionPool(host, port).run_script(script, chrome, async)
+
     if chrome:
-        m.set_context(marionette.Marionette.CONTEXT_CHROME)
+        marionette.set_context(marionette.CONTEXT_CHROME)
+    else:
+        marionette.set_context(marionette.CONTEXT_CONTENT)
     if not async:
-        result = m.execute_script(script)
+        return marionette.execute_script(script)
     else:
-        result = m.execute_async_script(script)
-    m.delete_session()
-    return result
+        return marionette.execute_async_script(script)
 
 
-def kill(name):
+def kill(name, marionette=None):
     """Kill the specified app"""
     script = """
       let manager = window.wrappedJSObject.appWindowManager || new window.wrappedJSObject.AppWindowManager();
       manager.kill('%s');
     """
-    return run_marionette_script(script % name)
+    return run_marionette_script(script % name, marionette=marionette)
 
 
-def get_permission(permission, app):
+def get_permission(permission, app, marionette=None):
     # The object created to wrap PermissionSettingsModule is to work around
     # an intermittent bug where it will sometimes be undefined.
     script = """
@@ -550,10 +601,31 @@ def get_permission(permission, app):
       return a.b.PermissionSettingsModule.getPermission('%s', '%s/manifest.webapp', '%s', '', false);
     """
     app_url = 'app://' + app
-    return run_marionette_script(script % (permission, app_url, app_url), True)
+    return run_marionette_script(script % (permission, app_url, app_url), True,
+                                 marionette=marionette)
+
+
+def get_app_permissions(permissions, app, marionette=None):
+    """Return a dict of the values of all the given permissions for the
+    specified app, probed in a single script"""
+    script = """
+      const {classes: Cc, interfaces: Ci, utils: Cu, results: Cr} = Components;
+      var a = {b: Cu.import("resource://gre/modules/PermissionSettings.jsm")};
+
+      let permissions = %s;
+      let result = {};
+      for (let permission of permissions) {
+        result[permission] = a.b.PermissionSettingsModule.getPermission(
+          permission, '%s/manifest.webapp', '%s', '', false);
+      }
+      return result;
+    """
+    app_url = 'app://' + app
+    return run_marionette_script(script % (json.dumps(permissions), app_url, app_url),
+                                 True, marionette=marionette)
 
 
-def get_permissions():
+def get_permissions(marionette=None):
     """Return permissions in PermissionsTable.jsm"""
     script = """
       const {classes: Cc, interfaces: Ci, utils: Cu, results: Cr} = Components;
@@ -566,10 +638,10 @@ def get_permissions():
 
       return result;
     """
-    return run_marionette_script(script, True)
+    return run_marionette_script(script, True, marionette=marionette)
 
 
-def set_permission(permission, value, app):
+def set_permission(permission, value, app, marionette=None):
     """Set a permission for the specified app
        Value should be 'deny' or 'allow'
     """
@@ -587,10 +659,13 @@ def set_permission(permission, value, app):
       });
     """
     app_url = 'app://' + app
-    run_marionette_script(script % (permission, app_url, app_url, value), True)
+    run_marionette_script(script % (permission, app_url, app_url, value), True,
+                          marionette=marionette)
 
 
 def make_html_report(path, report):
+    from py.xml import html
+
     def tabelize(value):
         try:
             rows = []
@@ -618,43 +693,6 @@ def make_html_report(path, report):
         f.write(str(doc))
 
 
-def get_application_ini(dm):
-    # application.ini information
-    #appinicontents = dm.pullFile('/system/b2g/application.ini')
-    #sf = StringIO.StringIO(appinicontents)
-    #config = ConfigParser.ConfigParser()
-    #config.readfp(sf)
-    ini_file = '_app.ini'
-    dm.pull('/system/b2g/application.ini', ini_file)
-    config = ConfigParser.RawConfigParser()
-    config.read(ini_file)
-    application_ini = {}
-    for section in config.sections():
-        application_ini[section] = dict(config.items(section))
-    return application_ini
-
-
-def get_buildprop(dm):
-    # get build properties
-    buildprops = {}
-    buildpropoutput = dm.shell_output("cat /system/build.prop")
-    for buildprop in [line for line in buildpropoutput.splitlines() if '=' \
-                          in line]:
-        eq = buildprop.find('=')
-        prop = buildprop[:eq]
-        val = buildprop[eq + 1:]
-        buildprops[prop] = val
-    return buildprops
-
-
-def get_processes_running(dm):
-    return map(lambda p: {'name': p[1], 'user': p[2]}, dm.get_process_list())
-
-
-def get_kernel_version(dm):
-    return dm.shell_output("cat /proc/version")
-
-
 def _run(args, logger):
     # This function is to simply make the cli() function easier to handle
 
@@ -670,8 +708,18 @@ def _run(args, logger):
             print t
         return 0
 
+    import mozdevice
+    import moznetwork
+    import wptserve
+    from mcts.utils.device.devicehelper import DeviceHelper
+    from mcts.utils.device.facts import get_device_facts
+
+    DeviceHelper.marionette_port = args.port
+
     skip_tests = []
     test_groups = set(args.include if args.include else test_groups)
+    if args.test:
+        test_groups = filter_groups(test_groups, args.test)
 
     if args.device_profile:
         skiplist = []
@@ -727,15 +775,14 @@ def _run(args, logger):
         print 'Could not open result file for writing: %s errno: %d' % (result_file_path, e.errno)
         raise
 
-    report['buildprops'] = get_buildprop(dm)
-
-    report['processes_running'] = get_processes_running(dm)
+    facts = get_device_facts(dm)
+    report['buildprops'] = facts.buildprops
+    report['processes_running'] = [{'name': p['name'], 'user': p['user']}
+                                   for p in facts.processes]
+    report['kernel_version'] = facts.kernel_version
+    report['application_ini'] = facts.application_ini
 
-    report['kernel_version'] = get_kernel_version(dm)
-
-    report['application_ini'] = get_application_ini(dm)
-
-    logger.suite_start(tests=[])
+    logger.suite_start(tests=[], device_info=facts.device_info())
 
     # record skipped test to report
     for test in skip_tests:
@@ -749,16 +796,16 @@ def _run(args, logger):
     # start webserver
     if 'webapi' in test_groups or 'permissions' in test_groups:
         httpd = wptserve.server.WebTestHttpd(
-            host=moznetwork.get_ip(), port=8000, routes=routes, doc_root=static_path)
+            host=moznetwork.get_ip(), port=args.http_port, routes=get_routes(), doc_root=static_path)
         httpd.start()
         addr = (httpd.host, httpd.port)
 
     # run webapi and webidl tests
     if 'webapi' in test_groups:
-        test_webapi(logger, report, args, addr)
+        test_webapi(logger, report, args, addr, filter_variants('webapi', args.test))
 
     if 'permissions' in test_groups:
-        test_permissions(logger, report, args, addr)
+        test_permissions(logger, report, args, addr, filter_variants('permissions', args.test))
 
     if 'user-agent' in test_groups:
         test_user_agent(logger, report)
@@ -768,6 +815,11 @@ def _run(args, logger):
 
     logger.suite_end()
 
+    sessions = DeviceHelper.getSessionPool()
+    logger.debug('Marionette sessions: %s' % json.dumps(sessions.stats(), sort_keys=True))
+    sessions.close()
+    dm.close()
+
     with open(result_file_path, "w") as result_file:
         result_file.write(json.dumps(report, indent=2))
     logger.debug('Results have been stored in: %s' % result_file_path)
@@ -800,6 +852,11 @@ def cli():
                         metavar="TEST-GROUP",
                         help="include this test group",
                         action="append")
+    parser.add_argument("--test",
+                        metavar="TEST-ID",
+                        help="only run this test, e.g. cert.webapi.web-missing-window-functions; "
+                             "may be repeated",
+                        action="append", default=[])
     parser.add_argument("--result-file",
                         help="absolute file path to store the resulting json." \
                              "Defaults to results.json on your current path",
@@ -812,6 +869,12 @@ def cli():
                         action="store_true")
     parser.add_argument('-p', "--device-profile", action="store",  type=os.path.abspath,
                         help="specify the device profile file path which could include skipped test case information")
+    parser.add_argument('-P', '--port',
+                        help='Local port forwarded to marionette on the device',
+                        action='store', type=int, default=2828)
+    parser.add_argument("--http-port",
+                        help="Port the results server listens on for the test apps",
+                        action="store", type=int, default=8000)
     commandline.add_logging_group(parser)
 
     args = parser.parse_args()
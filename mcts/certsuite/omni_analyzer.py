@@ -8,23 +8,34 @@ import os
 import sys
 import argparse
 import mozdevice
-import hashlib
+import difflib
 import re
 import json
-import base64
 import subprocess
 import tempfile
 import traceback
 import zipfile
+import zlib
 import shutil
-import pickle
-from diff_py import *
 
+from py.xml import html, raw
 from mozlog.structured import structuredlog
+from mcts.utils.report.results import link_extra
 
 JS_FILES = re.compile('\.jsm*$')
 MANIFEST_FILES = re.compile('\.manifest$')
 
+# number of context lines, as for diff -U 8
+CONTEXT_LINES = 8
+
+DIFF_STYLE = """
+pre { margin: 0; }
+.file { font-weight: bold; }
+.hunk { color: #666; }
+.added { background-color: #dfd; }
+.removed { background-color: #fdd; }
+"""
+
 
 def unzip_omnifile(omnifile, path):
     # The following is the right way to do this in python, however that throws a BadZipFile error
@@ -36,7 +47,8 @@ def unzip_omnifile(omnifile, path):
         omnizip.extractall(path)
     except zipfile.BadZipfile:
         # Then let's try a hack - only works on mac or linux
-        subprocess.call(['unzip', '-d', path, omnifile])
+        # zipfile may have extracted some entries before failing
+        subprocess.call(['unzip', '-o', '-d', path, omnifile])
     except:
         print "Error opening omni.ja file: %s" % (omnifile)
         traceback.print_exc()
@@ -58,6 +70,163 @@ class CleanedTempFolder(object):
         shutil.rmtree(self.folder)
 
 
+class ZipEntries(object):
+    """Entries of an omni.ja, read straight from its central directory."""
+
+    def __init__(self, path):
+        self.zip_file = zipfile.ZipFile(path, 'r')
+        infolist = self.zip_file.infolist()
+        # optimized jars sometimes have local headers zipfile refuses to
+        # read, so check that the first one can be opened; later ones
+        # that can't make read raise BadZipfile
+        if infolist:
+            self.zip_file.open(infolist[0]).close()
+        self.entries = dict((info.filename, (info.CRC, info.file_size))
+                            for info in infolist
+                            if not info.filename.endswith('/'))
+
+    def read(self, name):
+        with self.zip_file.open(name) as f:
+            return f.read()
+
+    def close(self):
+        self.zip_file.close()
+
+
+class DirectoryEntries(object):
+    """Entries of an omni.ja that had to be extracted with unzip."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        for root, dirs, files in os.walk(path):
+            for f in files:
+                full_path = os.path.join(root, f)
+                name = os.path.relpath(full_path, path).replace(os.sep, '/')
+                data = self.read(name)
+                self.entries[name] = (zlib.crc32(data) & 0xffffffff, len(data))
+
+    def read(self, name):
+        with open(os.path.join(self.path, *name.split('/')), 'rb') as f:
+            return f.read()
+
+    def close(self):
+        pass
+
+
+def extract_omnifile(omnifile, workdir):
+    path = tempfile.mkdtemp(dir=workdir)
+    unzip_omnifile(omnifile, path)
+    return DirectoryEntries(path)
+
+
+def open_omnifile(omnifile, workdir):
+    try:
+        return ZipEntries(omnifile)
+    except (zipfile.BadZipfile, zipfile.LargeZipFile, IOError, RuntimeError):
+        return extract_omnifile(omnifile, workdir)
+
+
+def is_binary(data):
+    return '\0' in data[:8000]
+
+
+class OmniDiff(object):
+    """Compare two omni.ja archives entry by entry.
+
+    Entries are first compared by CRC32 and size from the central
+    directories; only entries that differ are decompressed and diffed.
+    The unified text diff and the HTML report are produced in that
+    single pass.
+    """
+
+    def __init__(self, reference, device):
+        self.reference = reference
+        self.device = device
+        self.text = []
+        self.html = []
+
+    def changed_entries(self):
+        names = set(self.reference.entries) | set(self.device.entries)
+        return [name for name in sorted(names)
+                if self.reference.entries.get(name) != self.device.entries.get(name)]
+
+    def read(self, entries, name):
+        if name not in entries.entries:
+            return ''
+        return entries.read(name)
+
+    def add_file(self, name):
+        old = self.read(self.reference, name)
+        new = self.read(self.device, name)
+        header = 'diff -U %d --new-file reference/%s device/%s' % (CONTEXT_LINES, name, name)
+        self.text.append(header + '\n')
+        self.html.append(html.h2(name, class_='file'))
+
+        if is_binary(old) or is_binary(new):
+            line = 'Binary files reference/%s and device/%s differ\n' % (name, name)
+            self.text.append(line)
+            self.html.append(html.pre(line))
+            return
+
+        lines = difflib.unified_diff(old.splitlines(True), new.splitlines(True),
+                                     'reference/%s' % name, 'device/%s' % name,
+                                     n=CONTEXT_LINES)
+        rows = []
+        for line in lines:
+            if not line.endswith('\n'):
+                line += '\n\\ No newline at end of file\n'
+            self.text.append(line)
+            if line.startswith('@@'):
+                class_ = 'hunk'
+            elif line.startswith('+') and not line.startswith('+++'):
+                class_ = 'added'
+            elif line.startswith('-') and not line.startswith('---'):
+                class_ = 'removed'
+            else:
+                class_ = 'context'
+            rows.append(html.pre(line.decode('utf8', 'replace'), class_=class_))
+        self.html.append(html.div(rows))
+
+    def run(self):
+        for name in self.changed_entries():
+            self.add_file(name)
+        return ''.join(self.text)
+
+    def html_report(self):
+        doc = html.html(html.head(html.meta(charset="utf-8"),
+                                  html.title("omni.ja differences"),
+                                  html.style(raw(DIFF_STYLE))),
+                        html.body(self.html))
+        return (u"<!DOCTYPE html>\n" + doc.unicode(indent=2)).encode('utf8')
+
+
+def diff_omnifiles(reference_omnifile, device_omnifile, workdir):
+    """Compare two omni.ja files and return the OmniDiff, after running it.
+
+    The archives are read in process where possible. If an entry of one
+    turns out to be unreadable, the comparison is run again with the
+    archives read in process extracted with unzip instead.
+    """
+    paths = [reference_omnifile, device_omnifile]
+    entries = [open_omnifile(path, workdir) for path in paths]
+    try:
+        try:
+            omni_diff = OmniDiff(*entries)
+            omni_diff.run()
+        except (zipfile.BadZipfile, RuntimeError, zlib.error):
+            for i, path in enumerate(paths):
+                if isinstance(entries[i], ZipEntries):
+                    entries[i].close()
+                    entries[i] = extract_omnifile(path, workdir)
+            omni_diff = OmniDiff(*entries)
+            omni_diff.run()
+        return omni_diff
+    finally:
+        for item in entries:
+            item.close()
+
+
 class OmniAnalyzer(object):
     def __init__(self, reference_omni_ja, logger=None):
         self.reference_omni_ja = reference_omni_ja
@@ -69,7 +238,6 @@ class OmniAnalyzer(object):
 
     def getomni(self, workdir):
         # Get the omni.ja from /system/b2g/omni.ja
-        # Unzip it
         try:
             dm = mozdevice.DeviceManagerADB()
         except mozdevice.DMError as e:
@@ -77,46 +245,42 @@ class OmniAnalyzer(object):
             sys.exit(1)
         omnifile = os.path.join(workdir, 'omni.ja')
         dm.getFile(self.omni_ja_on_device, omnifile)
-        unzip_omnifile(omnifile, os.path.join(workdir, 'device'))
+        return omnifile
 
     def log_pass(self, testid, message=''):
         self.logger.test_end(testid, 'PASS', expected='PASS', message=message)
         
-    def log_ok(self, testid, message=''):
-        self.logger.test_end(testid, 'OK', expected='OK', message=message)
+    def log_ok(self, testid, message='', extra=None):
+        self.logger.test_end(testid, 'OK', expected='OK', message=message, extra=extra)
 
     def run(self, results_file=None, html_format=False):
         testid = '%s.%s.%s' % ('cert', 'omni-analyzer', 'check-omni-diff')
         is_run_success = False
         diff = ''
         with CleanedTempFolder() as workdir:
-            self.getomni(workdir)
-            unzip_omnifile(self.reference_omni_ja, os.path.join(workdir, 'reference'))
-
-            cmd = ['diff', '-U', '8', '--new-file', os.path.join(workdir, 'reference'), os.path.join(workdir, 'device')]
+            omnifile = self.getomni(workdir)
             try:
-                diff = subprocess.check_output(cmd)
-                self.log_pass(testid, 'The %s on device is the same as reference file omni.ja.' % self.omni_ja_on_device)
+                omni_diff = diff_omnifiles(self.reference_omni_ja, omnifile, workdir)
+                diff = ''.join(omni_diff.text)
                 is_run_success = True
-            except subprocess.CalledProcessError as e:
-                if e.returncode == 1:
-                    # return code 1 simply indicates differences were found
-                    diff = e.output
-                    if html_format:
-                        dh = HTMLDiffHelper()
-                        result = dh.diff(os.path.join(workdir, 'reference'), os.path.join(workdir, 'device'))
-                        diff_result = result.unicode(indent=2).encode('utf8')
-                    else:
-                        diff_result = diff
-                    if results_file is not None:
-                        with open(results_file, 'w') as f:
-                            f.write(diff_result)
-                    diff_message = 'The omni.ja on device is different from reference file omni.ja.'
-                    is_run_success = True
-                else:
-                    diff_message = 'error running diff: %s' % e.returncode
-                    self.logger.error(diff_message)
+            except Exception as e:
+                diff_message = 'error comparing omni.ja files: %s' % e
+                self.logger.error(diff_message)
                 self.log_ok(testid, diff_message)
+                return diff, is_run_success
+
+        if not diff:
+            self.log_pass(testid, 'The %s on device is the same as reference file omni.ja.' % self.omni_ja_on_device)
+            return diff, is_run_success
+
+        extra = None
+        if results_file is not None:
+            with open(results_file, 'w') as f:
+                f.write(omni_diff.html_report() if html_format else diff)
+            # the results file ends up next to the subsuite report
+            extra = link_extra('omni.ja differences', os.path.basename(results_file))
+        self.log_ok(testid, 'The omni.ja on device is different from reference file omni.ja.',
+                    extra=extra)
         return diff, is_run_success
 
 
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Compact, indexed form of the expected webapi results.
+
+The expected_webapi_results/<apptype>.json files are a couple of MB each
+and used to be loaded and turned into a name -> result dict on every run.
+compile_index() turns one of them into a .idx file holding
+
+  * a header with the windowList and the distinct webIDL result values,
+  * a table of fixed size records, sorted by test name, pointing into
+  * a blob of utf-8 encoded test names and messages.
+
+ResultsIndex memory maps that file and only decodes the records it is
+asked about, so diffing a result set against it is a single merge pass
+over the sorted table.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+MAGIC = 'MCTSIDX1'
+# magic, header length, number of records
+HEADER = struct.Struct('<8sII')
+# name offset, name length, message offset, message length, result
+RECORD = struct.Struct('<IIIIB')
+# message length of results whose message is null
+NO_MESSAGE = 0xffffffff
+
+
+def compile_index(json_path, index_path):
+    """Compile the expected results in json_path to an index at index_path."""
+    with open(json_path) as f:
+        expected = json.load(f)
+
+    webidl = sorted(((result['name'].encode('utf8'), result)
+                     for result in expected['webIDLResults']),
+                    key=lambda item: item[0])
+    values = sorted(set(result['result'] for _, result in webidl))
+    header = json.dumps({'windowList': expected['windowList'],
+                         'results': values})
+
+    records = []
+    blob = []
+    offset = 0
+    for name, result in webidl:
+        message = result.get('message')
+        if message is None:
+            message = ''
+            message_length = NO_MESSAGE
+        else:
+            message = message.encode('utf8')
+            message_length = len(message)
+        records.append(RECORD.pack(offset, len(name), offset + len(name),
+                                   message_length, values.index(result['result'])))
+        blob.extend([name, message])
+        offset += len(name) + len(message)
+
+    # write to a temporary file first so a concurrent run never sees a
+    # partially written index
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(index_path)))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(header), len(records)))
+        f.write(header)
+        f.write(''.join(records))
+        f.write(''.join(blob))
+    if os.path.exists(index_path):
+        os.unlink(index_path)
+    os.rename(tmp_path, index_path)
+
+
+def open_index(json_path, index_path=None):
+    """Return a ResultsIndex for the expected results in json_path, compiling
+    the index first if it is missing or older than the json file."""
+    if index_path is None:
+        index_path = os.path.splitext(json_path)[0] + '.idx'
+
+    if (not os.path.exists(index_path) or
+        os.path.getmtime(index_path) < os.path.getmtime(json_path)):
+        try:
+            compile_index(json_path, index_path)
+        except (IOError, OSError):
+            # the package directory may not be writable
+            index_path = os.path.join(tempfile.gettempdir(), 'mcts-%s-%d.idx' %
+                                      (os.path.basename(json_path),
+                                       os.path.getmtime(json_path)))
+            if not os.path.exists(index_path):
+                compile_index(json_path, index_path)
+
+    return ResultsIndex(index_path)
+
+
+class ResultsIndex(object):
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, header_length, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not an expected results index' % path)
+
+        self.header_offset = HEADER.size
+        self.header_length = header_length
+        self.records_offset = self.header_offset + header_length
+        self.blob_offset = self.records_offset + self.count * RECORD.size
+        self._header = None
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def header(self):
+        if self._header is None:
+            self._header = json.loads(
+                self.data[self.header_offset:self.header_offset + self.header_length])
+        return self._header
+
+    @property
+    def window_list(self):
+        return self.header['windowList']
+
+    def record(self, i):
+        return RECORD.unpack_from(self.data, self.records_offset + i * RECORD.size)
+
+    def name(self, i):
+        name_offset, name_length, _, _, _ = self.record(i)
+        start = self.blob_offset + name_offset
+        return self.data[start:start + name_length]
+
+    def result(self, i):
+        """Return the expected result i as the dict found in the json file."""
+        name_offset, name_length, message_offset, message_length, value = self.record(i)
+        start = self.blob_offset
+        if message_length == NO_MESSAGE:
+            message = None
+        else:
+            message = self.data[start + message_offset:
+                                start + message_offset + message_length].decode('utf8')
+        return {'name': self.data[start + name_offset:
+                                  start + name_offset + name_length].decode('utf8'),
+                'message': message,
+                'result': self.header['results'][value]}
+
+    def find(self, name):
+        """Return the index of the record for name, or None."""
+        key = name.encode('utf8')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.name(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self.name(lo) == key:
+            return lo
+        return None
+
+    def get(self, name):
+        i = self.find(name)
+        return self.result(i) if i is not None else None
+
+    def __iter__(self):
+        for i in xrange(self.count):
+            yield self.result(i)
+
+    def diff(self, results):
+        """Compare a list of webIDL results against the expected ones.
+
+        Returns a tuple of lists (unexpected, added, missing): results that
+        differ from the expected result, results that aren't expected at
+        all, and expected results that are missing from results.
+        """
+        values = self.header['results']
+        unexpected = []
+        added = []
+        missing = []
+
+        i = 0
+        last_key = None
+        for key, result in sorted(((result['name'].encode('utf8'), result)
+                                   for result in results),
+                                  key=lambda item: item[0]):
+            while i < self.count and self.name(i) < key:
+                missing.append(self.result(i))
+                i += 1
+
+            if i < self.count and key != last_key and self.name(i) == key:
+                if values[self.record(i)[4]] != result['result']:
+                    unexpected.append(result)
+                last_key = key
+                i += 1
+            else:
+                added.append(result)
+
+        while i < self.count:
+            missing.append(self.result(i))
+            i += 1
+
+        return unexpected, added, missing
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Compile expected webapi results to indexed form")
+    parser.add_argument("json_files", nargs="+", metavar="JSON",
+                        help="expected_webapi_results file to compile")
+    args = parser.parse_args(argv[1:])
+
+    for path in args.json_files:
+        index_path = os.path.splitext(path)[0] + '.idx'
+        compile_index(path, index_path)
+        print "%s -> %s" % (path, index_path)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,95 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from omni_analyzer import (DirectoryEntries, OmniDiff, ZipEntries, diff_omnifiles,
+                           extract_omnifile)
+
+reference_entries = {
+    "chrome/same.txt": "unchanged\n",
+    "chrome/app.js": "var a = 1;\nvar b = 2;\nvar c = 3;\n",
+    "chrome/image.png": "\x89PNG\r\n\x1a\n\0\0\0\rIHDR\0\0\0\x01",
+    "chrome/removed.js": "gone\n",
+}
+
+device_entries = dict(reference_entries)
+device_entries.update({
+    "chrome/app.js": "var a = 1;\nvar b = 20;\nvar c = 3;\n",
+    "chrome/image.png": "\x89PNG\r\n\x1a\n\0\0\0\rIHDR\0\0\0\x02",
+    "chrome/added.js": "new",
+})
+del device_entries["chrome/removed.js"]
+
+
+class TestOmniDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.reference_path = self.make_zip("reference.ja", reference_entries)
+        self.device_path = self.make_zip("device.ja", device_entries)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def make_zip(self, name, entries):
+        path = os.path.join(self.temp_dir, name)
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            for entry in sorted(entries):
+                zip_file.writestr(entry, entries[entry])
+        return path
+
+    def check_diff(self, omni_diff):
+        self.assertEquals(["chrome/added.js", "chrome/app.js", "chrome/image.png",
+                           "chrome/removed.js"],
+                          omni_diff.changed_entries())
+        text = "".join(omni_diff.text)
+        self.assertTrue("-var b = 2;\n+var b = 20;\n" in text)
+        self.assertTrue("Binary files reference/chrome/image.png and "
+                        "device/chrome/image.png differ\n" in text)
+        self.assertTrue("+new\n\\ No newline at end of file\n" in text)
+        self.assertTrue("-gone\n" in text)
+        self.assertFalse("same.txt" in text)
+        self.assertTrue("<h2 class=\"file\">chrome/app.js</h2>" in omni_diff.html_report())
+
+    def test_zip_entries(self):
+        reference = ZipEntries(self.reference_path)
+        device = ZipEntries(self.device_path)
+        omni_diff = OmniDiff(reference, device)
+        self.assertEquals(omni_diff.run(), "".join(omni_diff.text))
+        self.check_diff(omni_diff)
+        reference.close()
+        device.close()
+
+    def test_same(self):
+        omni_diff = diff_omnifiles(self.reference_path, self.make_zip("copy.ja", reference_entries),
+                                   self.temp_dir)
+        self.assertEquals([], omni_diff.changed_entries())
+        self.assertEquals([], omni_diff.text)
+
+    def test_directory_entries(self):
+        extracted = extract_omnifile(self.device_path, self.temp_dir)
+        self.assertTrue(isinstance(extracted, DirectoryEntries))
+        self.assertEquals(ZipEntries(self.device_path).entries, extracted.entries)
+        self.check_diff(diff_omnifiles(self.reference_path, self.device_path, self.temp_dir))
+
+    def test_unreadable_entry(self):
+        # a local header that doesn't match the central directory, after a
+        # first entry that can be read
+        with open(self.device_path, "rb") as f:
+            data = f.read()
+        i = data.index("chrome/app.js")
+        with open(self.device_path, "wb") as f:
+            f.write(data[:i] + "chrome/apq.js" + data[i + len("chrome/apq.js"):])
+        self.assertRaises(zipfile.BadZipfile,
+                          ZipEntries(self.device_path).read, "chrome/app.js")
+
+        self.check_diff(diff_omnifiles(self.reference_path, self.device_path, self.temp_dir))
+
+if __name__ == '__main__':
+    unittest.main()
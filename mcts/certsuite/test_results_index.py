@@ -0,0 +1,119 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from results_index import compile_index, open_index, ResultsIndex
+
+expected = {
+    "windowList": {"alert": {}, "navigator": {"mozApps": {}}},
+    "webIDLResults": [
+        {"name": "Navigator interface: attribute mozApps", "result": True, "message": None},
+        {"name": "Window interface: operation alert()", "result": True, "message": None},
+        {"name": "Document interface: attribute title", "result": False,
+         "message": "assert_true: expected true got false"},
+        {"name": u"Event interface: constant \u00e9t\u00e9", "result": True, "message": u"\u2713"},
+        {"name": "Element interface: operation remove()", "result": False, "message": ""},
+    ]
+}
+
+
+def dict_diff(expected_results, results):
+    """The webIDL results diff as cert.py computed it from the json file"""
+    expected_webidl = dict((result['name'], result)
+                           for result in expected_results['webIDLResults'])
+    unexpected = []
+    added = []
+    for result in results:
+        try:
+            if expected_webidl[result['name']]['result'] != result['result']:
+                unexpected.append(result)
+            del expected_webidl[result['name']]
+        except KeyError:
+            added.append(result)
+    return unexpected, added, list(expected_webidl.values())
+
+
+def by_name(results):
+    return sorted(results, key=lambda result: (result['name'], result['result']))
+
+
+class TestResultsIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.json_path = os.path.join(self.temp_dir, "web.json")
+        with open(self.json_path, "w") as f:
+            json.dump(expected, f)
+        self.index_path = os.path.join(self.temp_dir, "web.idx")
+        compile_index(self.json_path, self.index_path)
+        self.index = ResultsIndex(self.index_path)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_contents(self):
+        self.assertEquals(len(expected["webIDLResults"]), len(self.index))
+        self.assertEquals(expected["windowList"], self.index.window_list)
+        self.assertEquals(by_name(expected["webIDLResults"]), list(self.index))
+
+    def test_find(self):
+        for result in expected["webIDLResults"]:
+            self.assertEquals(result, self.index.get(result["name"]))
+        names = [self.index.name(i) for i in range(len(self.index))]
+        self.assertEquals(sorted(names), names)
+        self.assertEquals(None, self.index.find("A interface"))
+        self.assertEquals(None, self.index.find("Document interface"))
+        self.assertEquals(None, self.index.find("Zzz interface"))
+        self.assertEquals(None, self.index.get(u"Event interface: constant ete"))
+
+    def test_diff(self):
+        results = [
+            {"name": "Window interface: operation alert()", "result": True},
+            {"name": "Document interface: attribute title", "result": True},
+            {"name": u"Event interface: constant \u00e9t\u00e9", "result": False},
+            {"name": "Window interface: operation alert()", "result": False},
+            {"name": "Added interface: attribute foo", "result": True},
+        ]
+        unexpected, added, missing = self.index.diff(results)
+        ref_unexpected, ref_added, ref_missing = dict_diff(expected, results)
+
+        self.assertEquals(by_name(ref_unexpected), by_name(unexpected))
+        self.assertEquals(by_name(ref_added), by_name(added))
+        self.assertEquals(by_name(ref_missing), by_name(missing))
+        self.assertEquals(["Document interface: attribute title",
+                           u"Event interface: constant \u00e9t\u00e9"],
+                          [result["name"] for result in by_name(unexpected)])
+
+    def test_diff_empty(self):
+        unexpected, added, missing = self.index.diff([])
+        self.assertEquals(([], []), (unexpected, added))
+        self.assertEquals(by_name(expected["webIDLResults"]), missing)
+
+    def test_open_index(self):
+        index_path = os.path.join(self.temp_dir, "other.idx")
+        with open_index(self.json_path, index_path) as index:
+            self.assertEquals(len(self.index), len(index))
+        self.assertTrue(os.path.exists(index_path))
+
+        # a changed json file is compiled again
+        changed = dict(expected, webIDLResults=expected["webIDLResults"][:2])
+        with open(self.json_path, "w") as f:
+            json.dump(changed, f)
+        os.utime(self.json_path, (os.path.getmtime(index_path) + 10,) * 2)
+        with open_index(self.json_path, index_path) as index:
+            self.assertEquals(2, len(index))
+
+    def test_bad_magic(self):
+        with open(self.index_path, "r+b") as f:
+            f.write("NOTANIDX")
+        self.assertRaises(ValueError, ResultsIndex, self.index_path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,18 +9,21 @@ import argparse
 import json
 import os
 import pkg_resources
+import Queue
 import re
 import shutil
 import socket
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 import traceback
 import zipfile
 import webbrowser
 from cStringIO import StringIO
 from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 
 import marionette
@@ -39,6 +42,8 @@ from mozfile import TemporaryDirectory
 from mozlog.structured import structuredlog, handlers, formatters, set_default_logger
 from webapi_tests.semiauto import environment, server
 
+from mcts.utils.catalog import TestCatalog
+from mcts.utils.device.facts import facts_env, get_device_facts
 from mcts.utils.reportmanager import ReportManager
 from mcts.utils.logger.logmanager import LogManager
 
@@ -53,14 +58,17 @@ DeviceBackup = adb_b2g.DeviceBackup
 _adbflag = False
 _host = 'localhost'
 _port = 2828
+_http_port = 8000
 logger = None
 remove_marionette_after_run = False
 stdio_handler = handlers.StreamHandler(sys.stderr,
                                        formatters.MachFormatter())
-config_path = os.path.abspath(
-    os.path.join(os.path.dirname(__file__), "config.json"))
+mcts_path = os.path.abspath(os.path.dirname(__file__))
+config_path = os.path.join(mcts_path, "config.json")
 
 retry_path = 'retry.json'
+# statuses of the tests that are recorded in the retry plan
+retry_statuses = ('FAIL', 'ERROR', 'TIMEOUT', 'CRASH')
 
 def setup_logging(log_f):
     global logger
@@ -89,25 +97,35 @@ def load_config(path):
     return config
 
 
+def list_test_groups(cmd):
+    try:
+        return subprocess.check_output(cmd).splitlines()
+    except (subprocess.CalledProcessError, OSError) as e:
+        # There's no logger at this point in the code to log this as an exception
+        print >> sys.stderr, "Failed to run command: %s: %s" % (" ".join(cmd), e)
+        sys.exit(1)
+
+
 def iter_test_lists(suites_config, mode='phone'):
     '''
     Query each subharness for the list of test groups it can run and
-    yield a tuple of (subharness, test group) for each one.
+    yield a tuple of (subharness, test group) for each one. The lists are
+    cached in the test catalog, keyed by the subharness command, as long as
+    the "sources" of the suite in the config are unchanged.
     '''
+    catalog = TestCatalog()
     for name, opts in suites_config.iteritems():
-        try:
-            cmd = [opts["cmd"], '--list-test-groups'] + opts.get("common_args", [])
+        cmd = [opts["cmd"], '--list-test-groups'] + opts.get("common_args", [])
 
-            if mode == 'stingray':
-                cmd.append('--mode')
-                cmd.append('stingray')
+        if mode == 'stingray':
+            cmd.append('--mode')
+            cmd.append('stingray')
 
-            for group in subprocess.check_output(cmd).splitlines():
-                yield name, group
-        except (subprocess.CalledProcessError, OSError) as e:
-            # There's no logger at this point in the code to log this as an exception
-            print >> sys.stderr, "Failed to run command: %s: %s" % (" ".join(cmd), e)
-            sys.exit(1)
+        sources = None
+        if "sources" in opts:
+            sources = [os.path.join(mcts_path, item) for item in opts["sources"]]
+        for group in catalog.get(" ".join(cmd), sources, lambda: list_test_groups(cmd)):
+            yield name, group
 
 
 def get_metadata():
@@ -119,16 +137,70 @@ def log_metadata():
     for key in sorted(metadata.keys()):
         logger.info("fxos-certsuite %s: %s" % (key, metadata[key]))
 
+def get_device_serials(devices):
+    '''
+    Resolve the --devices argument, either a comma separated list of adb
+    serials or "all", to the list of device serials to run against.
+    '''
+    if devices != 'all':
+        return [serial for serial in devices.split(',') if serial]
+
+    return [item['device_serial'] for item in mozdevice.ADBHost().devices()
+            if item['state'] == 'device']
+
+
+@contextmanager
+def adb_serial(serial):
+    '''
+    Export serial as ANDROID_SERIAL while the block runs, so that tools we
+    don't control (e.g. marionette_extension) talk to the right device.
+    '''
+    old_serial = os.environ.get('ANDROID_SERIAL')
+    if serial is not None:
+        os.environ['ANDROID_SERIAL'] = serial
+    try:
+        yield
+    finally:
+        if old_serial is None:
+            os.environ.pop('ANDROID_SERIAL', None)
+        else:
+            os.environ['ANDROID_SERIAL'] = old_serial
+
+
+def device_ports(index):
+    """The local marionette and http ports of the index'th device when
+    running on several; these start above the default ports, which any
+    tool that finds its own device forwards to."""
+    return _port + 1 + index, _http_port + 1 + index
+
+
+def retry_results(results):
+    """Return the results, as returned by ReportManager.add_subsuite_report,
+    of the (sub)tests whose status makes them worth retrying."""
+    failed = {}
+    for test, test_data in (results or {}).iteritems():
+        test_failed = dict((subtest, data) for subtest, data in test_data.iteritems()
+                           if data["status"] in retry_statuses)
+        if test_failed:
+            failed[test] = test_failed
+    return failed
+
+
+def shard_name(suite, groups):
+    return suite + ('' if groups == [] else '_' + "_".join(item.replace("/", "-") for item in groups))
+
+
 # Consider upstreaming this to marionette-client:
 class MarionetteSession(object):
-    def __init__(self, device):
+    def __init__(self, device, port=None):
         global _host
         global _port
         self.device = device
-        self.marionette = marionette.Marionette(host=_host, port=_port)
+        self.port = _port if port is None else port
+        self.marionette = marionette.Marionette(host=_host, port=self.port)
 
     def __enter__(self):
-        self.device.forward("tcp:2828", "tcp:2828")
+        self.device.forward("tcp:%d" % self.port, "tcp:2828")
         self.marionette.wait_for_port()
         self.marionette.start_session()
         return self.marionette
@@ -139,11 +211,24 @@ class MarionetteSession(object):
 
 
 class TestRunner(object):
-    def __init__(self, args, config):
+    def __init__(self, args, config, serial=None, port=None, http_port=None):
         self.args = args
         self.config = config
+        self.serial = serial
+        self.port = port
+        self.http_port = http_port
+        # failing test ids by suite, and the fingerprint of the run they
+        # failed in, when retrying from a plan written by generate_retry
+        self.retry_tests = OrderedDict()
+        self.retry_fingerprint = None
         self.retry = self.loadretry()
+        # (suite, results of its tests) of each suite run
         self.regressions = []
+        # builds of the devices the tests ran on, by serial
+        self.fingerprint = {}
+        # the saved DeviceFacts of the device, which the suites read
+        # rather than querying it again
+        self.facts_path = None
 
     def loadretry(self):
         if not self.args.retry_failed:
@@ -155,12 +240,37 @@ class TestRunner(object):
         retrys = None
         try:
             with open(retry_path, 'r') as f:
-                retrys = json.load(f)
+                retrys = json.load(f, object_pairs_hook=OrderedDict)
         except:
             pass
 
+        if isinstance(retrys, dict):
+            # a retry plan, rather than a list of suite:group strings
+            self.retry_tests = retrys.get('tests', OrderedDict())
+            self.retry_fingerprint = retrys.get('fingerprint')
+            return bool(self.retry_tests)
+
         return retrys
 
+    def save_device_facts(self, facts, temp_dir):
+        if facts is None:
+            return
+        self.facts_path = os.path.join(temp_dir, "%s_facts.json" % (facts.serial or "device"))
+        facts.save(self.facts_path)
+
+    def add_fingerprint(self, serial, build):
+        '''
+        Record the build of a device the tests run on, warning when it isn't
+        the build the retried tests failed on.
+        '''
+        self.fingerprint[serial] = build
+        if not self.retry_fingerprint:
+            return
+        builds = self.retry_fingerprint.get('devices', {}).values()
+        if builds and build not in builds:
+            logger.warning("Retrying tests that failed on build %s on build %s" %
+                           (", ".join(sorted(set(builds))), build))
+
     def iter_suites(self):
         '''
         Iterate over test suites and groups of tests that are to be run. Returns
@@ -168,7 +278,12 @@ class TestRunner(object):
         test suite and [test_groups] is a list of group names to run in that suite,
         or the empty list to indicate all tests.
         '''
-        if self.retry:
+        if self.retry_tests:
+            # the failing tests are passed to the suites with --test
+            for suite in self.retry_tests:
+                yield suite, []
+            return
+        elif self.retry:
             tests = self.retry
         elif not self.args.tests:
             default_tests = self.config["suites"].keys()
@@ -195,6 +310,22 @@ class TestRunner(object):
         for suite, groups in d.iteritems():
             yield suite, groups
 
+    def iter_shards(self):
+        '''
+        Like iter_suites, but yield one (suite, [test_group]) tuple per test
+        group, so that the groups of a suite can be spread across devices.
+        When retrying failed tests, each suite is a single shard.
+        '''
+        for suite, groups in self.iter_suites():
+            if self.retry_tests:
+                yield suite, groups
+                continue
+            if not groups:
+                suites = {suite: self.config["suites"][suite]}
+                groups = [group for _, group in iter_test_lists(suites, self.args.mode)]
+            for group in groups:
+                yield suite, [group]
+
     def test_string(self, test_id):
         if isinstance(test_id, unicode):
             return test_id
@@ -210,37 +341,51 @@ class TestRunner(object):
         return test_name
 
     def generate_retry(self):
-        test_map = {'certsuite' : 'cert',
-                    'webapi' : 'webapi',
-                    'securitysuite' : 'security',
-                    'web-platform-tests':'web-platform-tests'}
-
-        failed = []
-        for regressions in self.regressions:
+        '''
+        Write the retry plan used by --retry-failed: the ids of the tests
+        that failed in each suite, as accepted by the --test option of the
+        suite's harness, along with the builds of the devices they ran on.
+        Failing subtests are recorded as <test id>.<subtest>.
+        '''
+        failed = OrderedDict()
+        for suite, regressions in self.regressions:
             if not regressions:
                 continue
-            tests = sorted(regressions.keys())
-            for i, test in enumerate(tests):
+            for test in sorted(regressions.keys()):
                 test_data = regressions[test]
                 for subtest in sorted(test_data.keys()):
-                    subtest_data = test_data[subtest]
-                    subsuite = self.get_test_name(test, test_data)
-                    if subtest_data["status"] == 'FAIL':
-                        failed.append("%s:%s" %
-                            (test_map[subtest_data['source']], subsuite))
-                        break
+                    if test_data[subtest]["status"] not in retry_statuses:
+                        continue
+                    test_id = self.test_string(test)
+                    if subtest != KEY_MAIN:
+                        test_id = "%s.%s" % (test_id, subtest)
+                    tests = failed.setdefault(suite, [])
+                    if test_id not in tests:
+                        tests.append(test_id)
+
+        plan = OrderedDict([('format', 2),
+                            ('fingerprint', {'version': self.config['version'],
+                                             'devices': self.fingerprint}),
+                            ('tests', failed)])
         try:
             if failed:
                 with open(retry_path, 'w') as f:
-                    json.dump(failed, f)
+                    json.dump(plan, f, indent=2)
         except:
             logger.error("Error generate retry.json file : %s" % traceback.format_exc())
 
     def run_suite(self, suite, groups, log_manager, report_manager):
         with TemporaryDirectory() as temp_dir:
-            result_files, structured_path = self.run_test(suite, groups, temp_dir)
+            result_files, structured_path, results = self.run_test(suite, groups, temp_dir)
 
-            self.regressions.append(report_manager.add_subsuite_report(structured_path, result_files))
+            # several shards of the same suite end up in one report when
+            # running on devices, so name them after their groups
+            name = shard_name(suite, groups) if self.serial else None
+            results = report_manager.add_subsuite_report(structured_path, result_files, name,
+                                                         results=results)
+            # only the failures are needed for the retry plan, so the rest
+            # isn't kept for the whole run
+            self.regressions.append((suite, retry_results(results)))
 
     def run_test(self, suite, groups, temp_dir):
         logger.info('Running suite %s' % suite)
@@ -268,14 +413,23 @@ class TestRunner(object):
 
             env = dict(os.environ)
             env['PYTHONUNBUFFERED'] = '1'
+            if self.serial:
+                env['ANDROID_SERIAL'] = self.serial
+            if self.facts_path:
+                env[facts_env] = self.facts_path
             proc = mozprocess.ProcessHandler(cmd, env=env, processOutputLine=on_output)
             logger.debug("Process '%s' is running" % " ".join(cmd))
             #TODO: move timeout handling to here instead of each test?
             with open(structured_path, "w") as structured_log:
-                sub_logger = structuredlog.StructuredLogger(suite)
+                sub_logger = structuredlog.StructuredLogger(
+                    suite if not self.serial else "%s-%s" % (suite, self.serial))
                 sub_logger.add_handler(stdio_handler)
                 sub_logger.add_handler(handlers.StreamHandler(structured_log,
                                                               formatters.JSONFormatter()))
+                # collect the results while the suite runs, rather than
+                # parsing its log again afterwards
+                results_handler = mcts.utils.report.results.LogHandler()
+                sub_logger.add_handler(results_handler)
                 proc.run()
                 proc.wait()
             logger.debug("Process finished")
@@ -289,7 +443,7 @@ class TestRunner(object):
             except:
                 pass
 
-        return output_files, structured_path
+        return output_files, structured_path, results_handler.results
 
     def build_command(self, suite, groups, temp_dir):
         suite_opts = self.config["suites"][suite]
@@ -300,12 +454,12 @@ class TestRunner(object):
 
         cmd = [suite_opts['cmd']]
 
-        subtests = '' if groups == [] else '_' + "_".join(item.replace("/", "-") for item in groups)
-        log_name = os.sep.join([temp_dir,"%s_structured%s.log" % (suite, subtests)])
+        log_name = os.sep.join([temp_dir, "%s_structured%s.log" % (suite, shard_name('', groups))])
         cmd.extend(["--log-raw=-"])
 
         if groups:
             cmd.extend('--include=%s' % g for g in groups)
+        cmd.extend('--test=%s' % t for t in self.retry_tests.get(suite, []))
 
         cmd.extend(item % subn for item in suite_opts.get("run_args", []))
         cmd.extend(item % subn for item in suite_opts.get("common_args", []))
@@ -324,20 +478,70 @@ class TestRunner(object):
 
         if self.args.mode == 'stingray' and (suite == 'webapi' or suite == 'security'):
             cmd.extend([u'--host=%s' % _host, u'--port=%s' % _port, u'--mode=stingray'])
+        elif self.port is not None:
+            cmd.append(u'--port=%s' % self.port)
+            if suite == 'cert':
+                cmd.append(u'--http-port=%s' % self.http_port)
 
         return cmd, output_files, log_name
 
 
+class DeviceWorker(threading.Thread):
+    '''
+    Thread that takes (suite, groups) shards off a shared queue and runs them
+    against a single device. Each worker has its own marionette port forward,
+    device backup and report sub-zip, merged into the main report afterwards.
+    '''
+    def __init__(self, args, config, serial, index, tasks, temp_dir):
+        threading.Thread.__init__(self, name="device-%s" % serial)
+        self.args = args
+        self.serial = serial
+        self.tasks = tasks
+        self.zip_path = os.path.join(temp_dir, "%s.zip" % serial)
+        self.report_manager = ReportManager(inline=args.inline_report)
+        port, http_port = device_ports(index)
+        self.runner = TestRunner(args, config, serial=serial,
+                                 port=port, http_port=http_port)
+        self.error = False
+
+    def run(self):
+        try:
+            with zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file, \
+                    DeviceBackup(device_serial=self.serial,
+                                 cache_root=self.args.backup_cache) as backup:
+                self.report_manager.setup_report(self.args.device_profile, zip_file)
+                try:
+                    while True:
+                        try:
+                            suite, groups = self.tasks.get_nowait()
+                        except Queue.Empty:
+                            break
+                        try:
+                            self.runner.run_suite(suite, groups, None, self.report_manager)
+                        except:
+                            logger.error("Encountered error on device %s:\n%s" %
+                                         (self.serial, traceback.format_exc()))
+                            self.error = True
+                finally:
+                    backup.restore()
+        except:
+            logger.error("Encountered error on device %s:\n%s" %
+                         (self.serial, traceback.format_exc()))
+            self.error = True
+
+
 def log_result(results, result):
     results[result.test_name] = {'status': 'PASS' if result.passed else 'FAIL',
                                  'failures': result.failures,
                                  'errors': result.errors}
 
 
-def check_preconditions(config):
+def check_preconditions(config, serial=None, port=None, http_port=None):
     check_marionette_installed = lambda device: install_marionette(device, config['version'])
+    check_settings = lambda device: ensure_settings(device, port)
+    check_host_server = lambda device: check_server(device, http_port)
 
-    device = check_adb()
+    device = check_adb(serial)
 
     logger.info('run adbd as root')
     device.root()
@@ -347,9 +551,9 @@ def check_preconditions(config):
 
     for precondition in [check_root,
                          check_marionette_installed,
-                         ensure_settings,
+                         check_settings,
                          check_network,
-                         check_server]:
+                         check_host_server]:
         try:
             passed = precondition(device)
         except:
@@ -359,8 +563,21 @@ def check_preconditions(config):
             sys.exit(1)
 
     logger.info("Passed precondition checks")
+    return device
+
+
+def collect_device_facts(device):
+    if _adbflag:
+        return None
+    try:
+        return get_device_facts(device)
+    except (mozdevice.ADBError, mozdevice.ADBTimeoutError):
+        logger.warning("Failed to get the build information of the device")
+        return None
 
 class NoADBDeviceBackup():
+    def __init__(self, *args, **kwargs):
+        pass
     def __enter__(self):
         self.device = NoADB()
         return self
@@ -387,14 +604,16 @@ class NoADB():
         pass
     def devices(self, timeout=None):
         pass
+    def close(self):
+        pass
 
-def check_adb():
+def check_adb(serial=None):
     try:
         logger.info("Testing ADB connection")
         if _adbflag:
             logger.debug('Dummy ADB, please remember install Marionette and Cert Test App to device ')
             return NoADB()
-        return adb_b2g.ADBB2G()
+        return adb_b2g.ADBB2G(device=serial)
     except (mozdevice.ADBError, mozdevice.ADBTimeoutError) as e:
         logger.critical('Error connecting to device via adb (error: %s). Please be ' \
                         'sure device is connected and "remote debugging" is enabled.' % \
@@ -453,12 +672,12 @@ def check_network(device):
         return False
 
 
-def ensure_settings(device):
+def ensure_settings(device, port=None):
     test_settings = {"screen.automatic-brightness": False,
                      "screen.brightness": 1.0,
                      "screen.timeout": 0.0}
     logger.info("Setting up device for testing")
-    with MarionetteSession(device) as marionette:
+    with MarionetteSession(device, port) as marionette:
         settings = gaiautils.Settings(marionette)
         for k, v in test_settings.iteritems():
             settings.set(k, v)
@@ -476,7 +695,7 @@ def wait_for_homescreen(marionette, timeout):
         By.CSS_SELECTOR, '#homescreen[loading-state=false]'))
 
 
-def check_server(device):
+def check_server(device, http_port=None):
     logger.info("Checking access to host machine")
 
     if _adbflag:
@@ -486,7 +705,11 @@ def check_server(device):
 
     host_ip = moznetwork.get_ip()
 
-    for port in [8000, 8001]:
+    ports = [8000, 8001]
+    if http_port is not None and http_port not in ports:
+        ports.append(http_port)
+
+    for port in ports:
         try:
             server = wptserve.WebTestHttpd(host=host_ip, port=port, routes=routes)
             server.start()
@@ -615,12 +838,47 @@ def prepare_device_profile(edit_profile, profile_path, suites):
 
     return profile_object
 
+def run_on_device(args, config, log_manager, report_manager):
+    error = False
+    device = check_preconditions(config)
+    runner = TestRunner(args, config)
+    serial = getattr(device, '_device_serial', None) or ''
+    facts = collect_device_facts(device)
+    # the backup below has its own connection to the device
+    device.close()
+    runner.add_fingerprint(serial, facts and facts.fingerprint)
+    report_manager.add_device_facts(serial, facts)
+
+    with TemporaryDirectory() as temp_dir, \
+            DeviceBackup(cache_root=args.backup_cache) as backup:
+        runner.save_device_facts(facts, temp_dir)
+        device = backup.device
+        try:
+            for suite, groups in runner.iter_suites():
+                try:
+                    runner.run_suite(suite, groups, log_manager, report_manager)
+                except:
+                    logger.error("Encountered error:\n%s" %
+                                 traceback.format_exc())
+                    error = True
+        finally:
+            runner.generate_retry()
+            if remove_marionette_after_run:
+                marionette_uninstall()
+            backup.restore()
+            if not args.debug:
+                device.reboot()
+
+    return error
+
+
 def run_tests(args, config):
     error = False
     output_zipfile = None
 
     try:
-        with LogManager() as log_manager, ReportManager() as report_manager:
+        with LogManager() as log_manager, \
+                ReportManager(inline=args.inline_report) as report_manager:
             output_zipfile = log_manager.zip_path
             setup_logging(log_manager.structured_file)
 
@@ -632,26 +890,10 @@ def run_tests(args, config):
 
             log_metadata()
 
-            check_preconditions(config)
-
-            with DeviceBackup() as backup:
-                device = backup.device
-                runner = TestRunner(args, config)
-                try:
-                    for suite, groups in runner.iter_suites():
-                        try:
-                            runner.run_suite(suite, groups, log_manager, report_manager)
-                        except:
-                            logger.error("Encountered error:\n%s" %
-                                         traceback.format_exc())
-                            error = True
-                finally:
-                    runner.generate_retry()
-                    if remove_marionette_after_run:
-                        marionette_uninstall()
-                    backup.restore()
-                    if not args.debug:
-                        device.reboot()
+            if args.devices:
+                error = run_on_devices(args, config, report_manager)
+            else:
+                error = run_on_device(args, config, log_manager, report_manager)
 
             if error:
                 logger.critical("Encountered errors during run")
@@ -665,6 +907,59 @@ def run_tests(args, config):
     return error
 
 
+def run_on_devices(args, config, report_manager):
+    '''
+    Shard the test groups to run across all devices given by --devices and
+    run them in parallel, one DeviceWorker per device.
+    '''
+    serials = get_device_serials(args.devices)
+    if not serials:
+        logger.critical("No devices found to run tests on")
+        return True
+    logger.info("Running tests on devices: %s" % ", ".join(serials))
+
+    retry_runner = TestRunner(args, config)
+    facts = {}
+    for index, serial in enumerate(serials):
+        with adb_serial(serial):
+            device = check_preconditions(config, serial, *device_ports(index))
+            facts[serial] = collect_device_facts(device)
+            device.close()
+            retry_runner.add_fingerprint(serial, facts[serial] and facts[serial].fingerprint)
+            report_manager.add_device_facts(serial, facts[serial])
+
+    error = False
+    with TemporaryDirectory() as temp_dir:
+        tasks = Queue.Queue()
+        for shard in retry_runner.iter_shards():
+            tasks.put(shard)
+
+        workers = [DeviceWorker(args, config, serial, index, tasks, temp_dir)
+                   for index, serial in enumerate(serials)]
+        for worker in workers:
+            worker.runner.save_device_facts(facts[worker.serial], temp_dir)
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        for worker in workers:
+            error = error or worker.error
+            retry_runner.regressions.extend(worker.runner.regressions)
+            report_manager.add_device_report(worker.serial, worker.report_manager,
+                                             worker.zip_path)
+        retry_runner.generate_retry()
+
+    for serial in serials:
+        with adb_serial(serial):
+            if remove_marionette_after_run:
+                marionette_uninstall()
+            if not args.debug:
+                with adb_b2g.ADBB2G(device=serial) as device:
+                    device.reboot()
+
+    return error
+
+
 def get_parser():
     parser = argparse.ArgumentParser()
     #TODO make this more robust
@@ -695,6 +990,22 @@ def get_parser():
     parser.add_argument('-m', '--mode',
                         help='Test mode (stingray, phone) default (phone)',
                         action='store', default='phone')
+    parser.add_argument('-D', '--devices',
+                        help='Comma separated adb serials of devices to run tests on '
+                             'in parallel, or "all" for every attached device',
+                        action='store', default=None)
+    parser.add_argument('--inline-report',
+                        help='Embed the subsuite reports and logs in the summary report.html, '
+                             'so it can be viewed without extracting the result zip',
+                        action='store_true', default=False)
+    parser.add_argument('--backup-cache',
+                        help='Directory to keep the backups of device state in between runs '
+                             '(default ~/.fxos-certsuite/backup); they include the device\'s '
+                             'profile',
+                        type=os.path.abspath, action='store', default=None)
+    parser.add_argument('--clear-backup-cache',
+                        help='Delete the backups of device state kept between runs, and exit',
+                        action='store_true', default=False)
     parser.add_argument('tests',
                         metavar='TEST',
                         help='Tests to run',
@@ -715,9 +1026,17 @@ def main():
     _port = int(args.port)
 
     if args.mode == 'stingray':
+        if args.devices:
+            parser.error("--devices is not supported in stingray mode")
         _adbflag = True
         DeviceBackup = NoADBDeviceBackup
 
+    if args.clear_backup_cache:
+        if adb_b2g.clear_backup_cache(args.backup_cache):
+            print "Deleted the device backups in %s" % (args.backup_cache or
+                                                        adb_b2g.default_backup_cache)
+        return True
+
     if args.list_tests:
         return list_tests(args, config)
 
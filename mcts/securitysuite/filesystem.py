@@ -8,115 +8,190 @@ import re
 import os
 import sys
 import subprocess
+import threading
 import mozdevice
+from collections import namedtuple
 
 # getter for shared logger instance
-from mozlog.structured import get_default_logger
+from suite import get_default_logger
 from mcts.utils.device.devicehelper import DeviceHelper
-from mozdevice.adb import ADBError
+from mozdevice.adb import ADBError, ADBTimeoutError
 
 
 # ######################################################################################################################
 # shared module functions
 #########################
 
+# assumed ls -lR line format:
+# -rw-r--r-- root     shell           0 2013-07-05 02:26 tasks
+# drwxr-xr-x root     root              2013-07-05 02:26 log
+# brw------- root     root     179,   0 2013-07-05 02:26 mmcblk0
+# lrwxrwxrwx root     root              2013-07-05 02:34 subsystem -> ../class/bdi
+
+# CAVE: format may change through versions.
+# TODO: implement plausibility test.
+
+_mode = r'^(.)'
+_field = r'([^ ]+) +'
+_dev = r'(\d+), +(\d+) '
+_date = r'(\d{4}\-\d{2}\-\d{2} \d{2}:\d{2}) '
+_name = r'(.+)$'
+_link = r'(.+) -> (.+)$'
+
+# regexps by first character of the mode, along with the record fields
+# their groups fill in
+_ls_formats = [
+    ('dsp', re.compile(_mode + _field * 3 + _date + _name),  # directory, socket, pipe
+     ('mode', 'perm', 'uid', 'gid', 'date', 'name')),
+    ('l', re.compile(_mode + _field * 3 + _date + _link),  # symbolic link
+     ('mode', 'perm', 'uid', 'gid', 'date', 'name', 'link')),
+    ('cb', re.compile(_mode + _field * 3 + _dev + _date + _name),  # device
+     ('mode', 'perm', 'uid', 'gid', 'major', 'minor', 'date', 'name')),
+]
+# rest
+_ls_default = (re.compile(_mode + _field * 4 + _date + _name),
+               ('mode', 'perm', 'uid', 'gid', 'size', 'date', 'name'))
+_ls_by_mode = dict((c, (regexp, fields)) for modes, regexp, fields in _ls_formats for c in modes)
+
+# One entry of the filesystem. Fields that don't apply to the entry's type
+# are None; context is the SELinux context, only known for scans that
+# asked ls for it.
+FileRecord = namedtuple('FileRecord', ['mode', 'perm', 'uid', 'gid', 'size', 'major',
+                                       'minor', 'date', 'name', 'link', 'context'])
+_empty_record = FileRecord(*([None] * len(FileRecord._fields)))
+
+
+def _abspath(dirname, name):
+    return '/' + os.path.relpath("%s/%s" % (dirname, name), '/')
+
+
+def parse_ls_line(line, dirname):
+    """
+    Parse a single line of ls -l output for an entry of dirname.
+    Returns a FileRecord, or None if the line can't be parsed.
+    """
+    regexp, fields = _ls_by_mode.get(line[:1], _ls_default)
+    m = regexp.match(line)
+    if m is None:
+        get_default_logger().error("parse error on %s" % line)
+        return None
+
+    specs = dict(zip(fields, m.groups()))
+    # uids, gids and dates repeat a lot, so share the strings
+    for key in ('uid', 'gid', 'date'):
+        specs[key] = intern(specs[key])
+    specs['name'] = _abspath(dirname, specs['name'])
+    if 'link' in specs:
+        specs['link'] = _abspath(dirname, specs['link'])
+    return _empty_record._replace(**specs)
+
+
+def iter_ls(lines):
+    """
+    Incremental parser for Android's ls -lR output.
+    Takes an iterable of lines, yields a FileRecord per entry as soon as
+    its line has been read.
+    """
+    dirname = '/'
+    header = True
+    for line in lines:
+        # adb returns newline as \r\n
+        line = line.rstrip('\r\n')
+        if not line:
+            # a blank line separates the listing of one directory from the next
+            header = True
+            continue
+        if header and line.endswith(':'):
+            dirname = line[:-1]
+            header = False
+            continue
+        header = False
+        if (line.startswith("opendir failed") or line.startswith("total ") or
+            line.endswith(": No such file or directory") or
+            line.endswith(": Permission denied")):
+            continue
+
+        record = parse_ls_line(line, dirname)
+        if record is not None:
+            yield record
+
+
 def parse_ls(out):
     """
     Parser for Android's ls -lR output.
     Takes a string, returns parsed structure.
     """
+    for record in iter_ls(out.splitlines()):
+        yield dict((k, v) for k, v in record._asdict().iteritems() if v is not None)
 
-    # assumed ls -lR line format:
-    # -rw-r--r-- root     shell           0 2013-07-05 02:26 tasks
-    # drwxr-xr-x root     root              2013-07-05 02:26 log
-    # brw------- root     root     179,   0 2013-07-05 02:26 mmcblk0
-    # lrwxrwxrwx root     root              2013-07-05 02:34 subsystem -> ../class/bdi
-
-    # CAVE: format may change through versions.
-    # TODO: implement plausibility test.
-
-    mode = r'^(.)'
-    field = r'([^ ]+) +'
-    dev = r'(\d+), +(\d+) '
-    date = r'(\d{4}\-\d{2}\-\d{2} \d{2}:\d{2}) '
-    name = r'(.+)$'
-    link = r'(.+) -> (.+)$'
-
-    logger = get_default_logger()
-
-    # adb returns newline as \r\n
-    # but mozdevice uses \n
-    for dirstr in out[2:-2].split('\r\n\r\n'):
-        lines = dirstr.split('\r\n')
-        dirname = lines[0][:-1]
-        if len(lines) == 2 and lines[1].startswith("opendir failed"):
-            continue
-        for filestr in lines[1:]:
-            if filestr.endswith(": No such file or directory"):
-                continue
-            if filestr.endswith(": Permission denied"):
-                continue
-            specs = None
-            if filestr[0] in 'dsp':  # directory, socket, pipe
-                regexp = mode + field * 3 + date + name
-                m = re.search(regexp, filestr)
-                specs = {
-                'mode': m.group(1),
-                'perm': m.group(2),
-                'uid': m.group(3),
-                'gid': m.group(4),
-                'date': m.group(5),
-                'name': m.group(6)
-                }
-            elif filestr[0] == 'l':  # symbolic link
-                regexp = mode + field * 3 + date + link
-                m = re.search(regexp, filestr)
-                specs = {
-                'mode': m.group(1),
-                'perm': m.group(2),
-                'uid': m.group(3),
-                'gid': m.group(4),
-                'date': m.group(5),
-                'name': m.group(6),
-                'link': m.group(7)
-                }
-            elif filestr[0] in 'cb':  # device
-                regexp = mode + field * 3 + dev + date + name
-                m = re.search(regexp, filestr)
-                specs = {
-                'mode': m.group(1),
-                'perm': m.group(2),
-                'uid': m.group(3),
-                'gid': m.group(4),
-                'major': m.group(5),
-                'minor': m.group(6),
-                'date': m.group(7),
-                'name': m.group(8)
-                }
-            else:  # rest
-                try:
-                    regexp = mode + field * 4 + date + name
-                    m = re.search(regexp, filestr)
-                    specs = {
-                    'mode': m.group(1),
-                    'perm': m.group(2),
-                    'uid': m.group(3),
-                    'gid': m.group(4),
-                    'size': m.group(5),
-                    'date': m.group(6),
-                    'name': m.group(7)
-                    }
-                except:
-                    logger.error("parse error on %s" % filestr)
-
-            try:
-                specs['name'] = '/' + os.path.relpath("%s/%s" % (dirname, specs['name']), '/')
-                if 'link' in specs.keys():
-                    specs['link'] = '/' + os.path.relpath("%s/%s" % (dirname, specs['link']), '/')
-            except:
-                logger.warning("no name from %s" % filestr)
-
-            yield specs
+
+def is_world_writable(f):
+    return f.perm[7] == 'w' and f.mode != 'l'
+
+
+def is_suid_root(f):
+    return f.perm[2] == 's' and f.uid == 'root'
+
+
+class FilesystemSnapshot(object):
+    """
+    Parsed listing of the whole device filesystem, shared by all checks
+    of a run so the device is only scanned once.
+    Checks select the entries they are interested in with a predicate
+    over FileRecords.
+    """
+
+    command = 'ls -alR /'
+    _current = None
+    # filesystem tests run concurrently and share one scan
+    _lock = threading.Lock()
+
+    def __init__(self, records):
+        self.records = records
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def select(self, predicate):
+        return [f for f in self.records if predicate(f)]
+
+    @classmethod
+    def scan(cls, device):
+        """
+        Scan the device filesystem. The listing is spooled to a temporary
+        file by adb and parsed line by line from there, so it is never held
+        in memory as a whole.
+        """
+        adb_process = device.shell(cls.command, root=True)
+        try:
+            if adb_process.timedout:
+                raise ADBTimeoutError("%s timed out" % cls.command)
+            elif adb_process.exitcode:
+                raise ADBError("%s failed with exit code %s" %
+                               (cls.command, adb_process.exitcode))
+            return cls(list(iter_ls(adb_process.stdout_file)))
+        finally:
+            adb_process.stdout_file.close()
+            adb_process.stderr_file.close()
+
+    @classmethod
+    def get(cls, device=None):
+        """
+        Return the snapshot of this run, scanning the device on first use.
+        """
+        with cls._lock:
+            if cls._current is None:
+                if device is None:
+                    device = DeviceHelper.getDevice()
+                cls._current = cls.scan(device)
+            return cls._current
+
+    @classmethod
+    def invalidate(cls):
+        cls._current = None
 
 
 #######################################################################################################################
@@ -137,6 +212,7 @@ class worldwritable_info(ExtraTest):
 
     group = "filesystem"
     module = sys.modules[__name__]
+    resources = ()
 
     whitelist = {
     'ok': [
@@ -165,13 +241,6 @@ class worldwritable_info(ExtraTest):
     ]
     }
 
-    @classmethod
-    def whitelist_check(cls, name, flag='ok', whitelist=None):
-        if whitelist is None:
-            whitelist = cls.whitelist
-        r = re.compile('|'.join(whitelist[flag]))
-        return r.match(name) is not None
-
     @classmethod
     def run(cls, version=None):
         logger = get_default_logger()
@@ -185,16 +254,16 @@ class worldwritable_info(ExtraTest):
             raise
 
         try:
-            out = device.shell_output('ls -alR /', root=True)
+            snapshot = FilesystemSnapshot.get(device)
         except ADBError as e:
             cls.log_status('FAIL', 'Failed to gather filesystem information from device via adb: %s' % e.msg)
             return False
 
         found = []
-        for f in parse_ls(out):
-            if f['perm'][7] == 'w' and f['mode'] != 'l':
-                if not cls.whitelist_check(f['name']):
-                    found.append(f['name'])
+        for f in snapshot.select(is_world_writable):
+            if not cls.whitelist_check(f.name):
+                found.append(f.name)
+        cls.log_unused_whitelist()
         if len(found) > 0:
             cls.log_status('PASS',
                            'Please ensure that the following world-writable files will not pose a security risk:\n%s' % '\n'.join(
@@ -215,6 +284,7 @@ class suidroot_info(ExtraTest):
 
     group = "filesystem"
     module = sys.modules[__name__]
+    resources = ()
 
     whitelist = {
     'ok': [
@@ -225,13 +295,6 @@ class suidroot_info(ExtraTest):
     ]
     }
 
-    @classmethod
-    def whitelist_check(cls, name, flag='ok', whitelist=None):
-        if whitelist is None:
-            whitelist = cls.whitelist
-        r = re.compile('|'.join(whitelist[flag]))
-        return r.match(name) is not None
-
     @classmethod
     def run(cls, version=None):
         logger = get_default_logger()
@@ -245,16 +308,16 @@ class suidroot_info(ExtraTest):
             raise
 
         try:
-            out = device.shell_output('ls -alR /', root=True)
+            snapshot = FilesystemSnapshot.get(device)
         except ADBError as e:
             cls.log_status('FAIL', 'Failed to gather filesystem information from device via adb: %s' % e.msg)
             return False
 
         found = []
-        for f in parse_ls(out):
-            if f['perm'][2] == 's' and f['uid'] == 'root':
-                if not cls.whitelist_check(f['name']):
-                    found.append(f['name'])
+        for f in snapshot.select(is_suid_root):
+            if not cls.whitelist_check(f.name):
+                found.append(f.name)
+        cls.log_unused_whitelist()
         if len(found) > 0:
             cls.log_status('PASS',
                            'Please ensure that the following suid root files are no security risk:\n%s' % '\n'.join(
@@ -8,7 +8,7 @@ import sys
 import mozdevice
 
 # getter for shared logger instance
-from mozlog.structured import get_default_logger
+from suite import get_default_logger
 
 from mcts.utils.device.devicehelper import DeviceHelper
 from mozdevice.adb import ADBError
@@ -127,6 +127,7 @@ class seccomp(ExtraTest):
 
     group = "kernel"
     module = sys.modules[__name__]
+    resources = ()
 
     @classmethod
     def run(cls, version=None):
@@ -5,11 +5,9 @@
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import sys
-import mozdevice
-import marionette
 
 # getter for shared logger instance
-from mozlog.structured import get_default_logger
+from suite import get_default_logger
 
 from mcts.certsuite.cert import run_marionette_script
 from mcts.utils.device.devicehelper import DeviceHelper
@@ -106,6 +104,7 @@ class certdb_info(ExtraTest):
 
     group = "ssl"
     module = sys.modules[__name__]
+    resources = ('marionette',)
 
     @classmethod
     def run(cls, version=None):
@@ -134,6 +133,7 @@ class nssversion(ExtraTest):
 
     group = "ssl"
     module = sys.modules[__name__]
+    resources = ('marionette',)
 
     # TODO: This list's tail must be maintained regularly.
     b2g_version_to_hginfo = {
@@ -4,15 +4,271 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import re
 import sys
+import Queue
 import logging
 import argparse
+import threading
 import traceback
 from mozdevice import DeviceManagerADB, DMError, ADBError
-from mozlog.structured import commandline, get_default_logger
+from mozlog.structured import commandline
+from mozlog.structured import get_default_logger as _get_default_logger
+from mozlog.structured import structuredlog
 from time import sleep
 from mcts.utils.device.devicehelper import DeviceHelper
-from mozdevice.adb import ADBError
+from mcts.utils.device.facts import get_device_facts
+from mozdevice.adb import ADBError, ADBTimeoutError
+
+# ######################################################################################################################
+# Logging
+#########
+
+_local = threading.local()
+
+
+def get_default_logger(component=None):
+    """
+    Returns mozlog's default logger, or, in a thread the scheduler runs a
+    test in, the logger buffering that test's output.
+    """
+    logger = getattr(_local, 'logger', None)
+    if logger is not None:
+        return logger
+    return _get_default_logger(component)
+
+
+# ######################################################################################################################
+# Whitelist matching
+####################
+
+_regex_meta = set('.^$*+?{}[]|()')
+
+
+def _literal(pattern):
+    """
+    Returns the string pattern matches literally, or None if pattern
+    contains regular expression syntax.
+    """
+    chars = []
+    escaped = False
+    for c in pattern:
+        if escaped:
+            if c.isalnum():  # \d, \w and friends
+                return None
+            chars.append(c)
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        elif c in _regex_meta:
+            return None
+        else:
+            chars.append(c)
+    if escaped:
+        return None
+    return ''.join(chars)
+
+
+class WhitelistMatcher(object):
+    """
+    Matches names against a list of whitelist regexps, as re.match would.
+    Patterns that are anchored literals ('^/dev/null$') are looked up in a
+    set and anchored literal prefixes ('^/proc/.*$') in a trie, so only the
+    remaining, true regexps are tried one by one.
+    Counts the hits of each pattern, so stale entries can be found.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.hits = dict((p, 0) for p in self.patterns)
+        self.literals = {}
+        self.prefixes = {}
+        self.regexps = []
+
+        for p in self.patterns:
+            body = p[1:] if p.startswith('^') else p
+            if body.endswith('.*$'):
+                prefix = _literal(body[:-3])
+                if prefix is not None:
+                    self._add_prefix(prefix, p)
+                    continue
+            elif body.endswith('$') and not body.endswith('\\$'):
+                literal = _literal(body[:-1])
+                if literal is not None:
+                    self.literals.setdefault(literal, p)
+                    continue
+            else:
+                prefix = _literal(body)
+                if prefix is not None:
+                    self._add_prefix(prefix, p)
+                    continue
+            self.regexps.append((re.compile(p), p))
+
+    def _add_prefix(self, prefix, pattern):
+        node = self.prefixes
+        for c in prefix:
+            node = node.setdefault(c, {})
+        # the empty key marks the end of a prefix
+        node.setdefault('', pattern)
+
+    def _match_prefix(self, name):
+        node = self.prefixes
+        if '' in node:
+            return node['']
+        for c in name:
+            node = node.get(c)
+            if node is None:
+                return None
+            if '' in node:
+                return node['']
+        return None
+
+    def match(self, name):
+        """
+        Returns the pattern that matches name, or None.
+        """
+        pattern = self.literals.get(name)
+        if pattern is None:
+            pattern = self._match_prefix(name)
+        if pattern is None:
+            for r, p in self.regexps:
+                if r.match(name) is not None:
+                    pattern = p
+                    break
+        if pattern is not None:
+            self.hits[pattern] += 1
+        return pattern
+
+    def unused(self):
+        """
+        Returns the patterns that haven't matched anything so far.
+        """
+        return [p for p in self.patterns if self.hits[p] == 0]
+
+
+# ######################################################################################################################
+# Concurrent test scheduling
+############################
+
+class TestTask(object):
+    """
+    A single ExtraTest subclass scheduled for a run, along with the log
+    output it produced.
+    """
+
+    def __init__(self, group, test, version=None):
+        self.group = group
+        self.test = test
+        self.version = version
+        self.log = []
+        self.exc_info = None
+
+    def conflicts(self, other):
+        if self.test.resources is None or other.test.resources is None:
+            return True
+        return bool(set(self.test.resources) & set(other.test.resources))
+
+    def run(self):
+        # buffer the test's output under its own logger, so it can be
+        # replayed in order once the test is done
+        logger = structuredlog.StructuredLogger('%s:%s.%s' % (_get_default_logger().name,
+                                                self.group, self.test.__name__))
+        logger.add_handler(self.log.append)
+        logger.suite_start(tests=[self.group])
+        logger.test_start(self.group)
+        _local.logger = logger
+        try:
+            self.test.run(version=self.version)
+        except:
+            self.exc_info = sys.exc_info()
+        finally:
+            _local.logger = None
+
+    def replay(self, logger):
+        for data in self.log:
+            if data['action'] in ('suite_start', 'test_start'):
+                continue
+            data = dict(data, source=logger.name)
+            logger.log_raw(data)
+
+
+class TestScheduler(object):
+    """
+    Runs ExtraTest subclasses on a pool of threads. Tests run concurrently
+    unless they declare a common device resource; a test that doesn't
+    declare its resources runs on its own.
+    The log output of each test is buffered and written in the order the
+    tests would have run in sequentially, with one test_start/test_end per
+    group.
+    """
+
+    def __init__(self, groups, version=None, jobs=4, tests=None):
+        self.tasks = [TestTask(g, t, version)
+                      for g in groups for t in ExtraTest.test_list(g)
+                      if tests is None or g in tests or "%s.%s" % (g, t.__name__) in tests]
+        self.groups = groups
+        self.jobs = max(1, jobs)
+
+    def run(self):
+        logger = _get_default_logger()
+        finished = Queue.Queue()
+        pending = list(self.tasks)
+        running = []
+        done = set()
+        emitted = 0
+        failed = None
+
+        def worker(task):
+            try:
+                task.run()
+            finally:
+                finished.put(task)
+
+        while pending or running:
+            for task in list(pending):
+                if failed is not None or len(running) >= self.jobs:
+                    break
+                if any(task.conflicts(other) for other in running):
+                    continue
+                pending.remove(task)
+                running.append(task)
+                logger.debug("running securitysuite test %s.%s" % (task.group, task.test.__name__))
+                t = threading.Thread(target=worker, args=(task,),
+                                     name="%s.%s" % (task.group, task.test.__name__))
+                t.daemon = True
+                t.start()
+
+            task = finished.get()
+            running.remove(task)
+            done.add(task)
+
+            while failed is None and emitted < len(self.tasks) and self.tasks[emitted] in done:
+                task = self.tasks[emitted]
+                emitted += 1
+                first = emitted == 1 or self.tasks[emitted - 2].group != task.group
+                last = emitted == len(self.tasks) or self.tasks[emitted].group != task.group
+                if first:
+                    logger.debug("running securitysuite test group %s" % task.group)
+                    logger.test_start(task.group)
+                task.replay(logger)
+                if task.exc_info is not None:
+                    logger.critical(''.join(traceback.format_exception(*task.exc_info)))
+                    logger.test_end(task.group, 'FAIL')
+                    failed = task
+                    # let the tests that are running finish, but start no more
+                    del pending[:]
+                elif last:
+                    logger.test_end(task.group, 'OK')
+
+        # groups without any tests
+        for g in self.groups:
+            if failed is None and not any(task.group == g for task in self.tasks):
+                logger.test_start(g)
+                logger.test_end(g, 'OK')
+
+        if failed is not None:
+            raise failed.exc_info[0], failed.exc_info[1], failed.exc_info[2]
+
 
 # ######################################################################################################################
 # Test class that all test must be derived from
@@ -23,8 +279,13 @@ class ExtraTest(object):
     Parent class for all tests in this suite.
     Every child must set its .group string and implement
     its .run() method.
+    Children should declare the device resources they can't share with
+    concurrently running tests in .resources, e.g. ('marionette',), or ()
+    if they share everything. Tests leaving it at None run on their own.
     """
 
+    resources = None
+
     @classmethod
     def groupname(cls):
         """
@@ -65,7 +326,13 @@ class ExtraTest(object):
             return tests
 
     @staticmethod
-    def run_groups(groups=[], version=None, host='localhost', port=2828, mode='phone'):
+    def run_groups(groups=[], version=None, host='localhost', port=2828, mode='phone', jobs=4,
+                   tests=None):
+        """
+        Runs the tests of the given groups, or of all groups. tests
+        optionally restricts the run to the given groups or group.test
+        names.
+        """
         hasadb = mode == 'phone'
         logger = get_default_logger()
         if groups is None or len(groups) == 0:  # run all groups
@@ -73,25 +340,60 @@ class ExtraTest(object):
             groups = ExtraTest.group_list(mode=mode)
         else:
             logger.debug('running securitysuite tests for groups %s' % str(groups))
-        logger.suite_start(tests=groups)
-        
+        if tests:
+            groups = [g for g in groups if any(t == g or t.startswith(g + '.') for t in tests)]
+            logger.debug('running securitysuite tests %s' % str(tests))
+        else:
+            tests = None
         # setup marionette before any test
         marionette = DeviceHelper.getMarionette(host=host, port=port)
         # setup device before any test
         device = DeviceHelper.getDevice()
 
-        for g in groups:
-            logger.debug("running securitysuite test group %s" % g)
-            logger.test_start(g)
+        device_info = None
+        if hasadb:
             try:
-                ExtraTest.run(g, version=version)
-                logger.test_end(g, 'OK')
-            except:
-                logger.critical(traceback.format_exc())
-                logger.test_end(g, 'FAIL')
-                raise
+                device_info = get_device_facts(device).device_info()
+            except (ADBError, ADBTimeoutError) as e:
+                logger.warning("Failed to get the build information of the device: %s" % e)
+        logger.suite_start(tests=groups, device_info=device_info)
+
+        TestScheduler(groups, version=version, jobs=jobs, tests=tests).run()
         logger.suite_end()
 
+        sessions = DeviceHelper.getSessionPool()
+        logger.debug('marionette sessions: %s' % str(sessions.stats()))
+        sessions.close()
+
+    @classmethod
+    def whitelist_matcher(cls, flag='ok'):
+        """
+        Returns the matcher for the class's whitelist[flag], compiled on
+        first use.
+        """
+        matchers = cls.__dict__.get('_whitelist_matchers')
+        if matchers is None:
+            matchers = {}
+            setattr(cls, '_whitelist_matchers', matchers)
+        if flag not in matchers:
+            matchers[flag] = WhitelistMatcher(cls.whitelist[flag])
+        return matchers[flag]
+
+    @classmethod
+    def whitelist_check(cls, name, flag='ok', whitelist=None):
+        if whitelist is None:
+            matcher = cls.whitelist_matcher(flag)
+        else:
+            matcher = WhitelistMatcher(whitelist[flag])
+        return matcher.match(name) is not None
+
+    @classmethod
+    def log_unused_whitelist(cls, flag='ok'):
+        unused = cls.whitelist_matcher(flag).unused()
+        if unused:
+            get_default_logger().debug('%s: whitelist entries without hits: %s' %
+                                       (cls.__name__, ', '.join(unused)))
+
     @classmethod
     def run(cls, group=None, version=None):
         """
@@ -150,6 +452,9 @@ def securitycli():
     parser.add_argument("-i", "--include", metavar="GROUP", action="append", default=[],
                         help="Only include specified group(s) in run, include several "
                              "groups by repeating flag")
+    parser.add_argument("-t", "--test", metavar="TEST", action="append", default=[],
+                        help="Only run the specified group.test, e.g. filesystem.suidroot_info, "
+                             "run several tests by repeating flag")
     parser.add_argument("--version", action="store", dest="version",
                         help="B2G version")
     parser.add_argument("--ipython", dest="ipython", action="store_true",
@@ -163,6 +468,8 @@ def securitycli():
     parser.add_argument('-m', '--mode',
                         help='Test mode (stingray, phone) default (phone)',
                         action='store', default='phone')
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+                        help='Number of tests to run concurrently (default 4)')
     parser.add_argument("-v", dest="verbose", action="store_true",
                         help="Verbose output")
 
@@ -189,13 +496,15 @@ def securitycli():
             ExtraTest.run_groups(args.include,
                                  version=args.version,
                                  host=args.host, port=int(args.port),
-                                 mode=args.mode)
+                                 mode=args.mode, jobs=args.jobs, tests=args.test)
         else:
             logger.debug("security cli runnng with args %s" % args)
+            DeviceHelper.marionette_port = int(args.port)
             wait_for_adb_device()
             if not adb_has_root():
                 logger.warning("adb has no root. Results will be incomplete.")
-            ExtraTest.run_groups(args.include, version=args.version)
+            ExtraTest.run_groups(args.include, version=args.version, port=int(args.port),
+                                 jobs=args.jobs, tests=args.test)
 
     except:
         logger.critical(traceback.format_exc())
@@ -0,0 +1,91 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import itertools
+import re
+import unittest
+
+from mcts.securitysuite.suite import WhitelistMatcher, _literal
+
+patterns = [
+    '^/proc/.*$',
+    '^/dev/null$',
+    '^/dev/socket/keystore$',
+    '^/dev/log/.*$',
+    '/data/local/tmp',
+    '^/proc/.*/net/xt_qtaguid/ctrl$',
+    r'^/dev/pts/\d+$',
+    '^/dev/tty.$',
+    r'^/data/a\.b$',
+    r'^/price\$$',
+    '^$',
+]
+
+names = ['/proc/1/maps', '/proc', '/proc/', '/dev/null', '/dev/null2', '/dev/nul',
+         '/dev/socket/keystore', '/dev/socket', '/dev/log/main', '/dev/log',
+         '/data/local/tmp', '/data/local/tmp/x', '/data/local/tm', '/dev/pts/12',
+         '/dev/pts/', '/dev/pts/x', '/dev/tty1', '/dev/tty', '/dev/tty12',
+         '/data/a.b', '/data/axb', '/price$', '/price', '', 'x']
+
+
+def regex_match(patterns, name):
+    """The patterns of patterns that re.match name"""
+    return [p for p in patterns if re.match(p, name) is not None]
+
+
+class TestWhitelistMatcher(unittest.TestCase):
+
+    def test_literal(self):
+        self.assertEquals('/dev/null', _literal('/dev/null'))
+        self.assertEquals('/data/a.b', _literal(r'/data/a\.b'))
+        self.assertEquals(None, _literal('/data/a.b'))
+        self.assertEquals(None, _literal(r'/dev/pts/\d'))
+        self.assertEquals(None, _literal('/dev/(a|b)'))
+        self.assertEquals(None, _literal('trailing\\'))
+
+    def test_kinds(self):
+        matcher = WhitelistMatcher(patterns)
+        self.assertEquals(['', '/data/a.b', '/dev/null', '/dev/socket/keystore', '/price$'],
+                          sorted(matcher.literals))
+        self.assertEquals(['^/dev/pts/\\d+$', '^/dev/tty.$', '^/proc/.*/net/xt_qtaguid/ctrl$'],
+                          sorted(p for r, p in matcher.regexps))
+
+    def test_match(self):
+        matcher = WhitelistMatcher(patterns)
+        for name in names:
+            matches = regex_match(patterns, name)
+            pattern = matcher.match(name)
+            if matches:
+                self.assertTrue(pattern in matches, "%r: %r" % (name, pattern))
+            else:
+                self.assertEquals(None, pattern, repr(name))
+
+    def test_match_orders(self):
+        # the matcher agrees with re.match whichever order the patterns are in
+        for order in itertools.islice(itertools.permutations(patterns[:6]), 0, None, 7):
+            matcher = WhitelistMatcher(order)
+            for name in names:
+                self.assertEquals(bool(regex_match(order, name)),
+                                  matcher.match(name) is not None,
+                                  "%r %r" % (order, name))
+
+    def test_empty_prefix(self):
+        matcher = WhitelistMatcher(['^.*$'])
+        self.assertEquals('^.*$', matcher.match('anything'))
+        self.assertEquals('^.*$', matcher.match(''))
+        self.assertEquals(None, WhitelistMatcher([]).match('anything'))
+
+    def test_hits(self):
+        matcher = WhitelistMatcher(patterns)
+        for name in ['/dev/null', '/dev/null', '/proc/1/maps', '/dev/pts/1', '/nothing']:
+            matcher.match(name)
+        self.assertEquals(2, matcher.hits['^/dev/null$'])
+        self.assertEquals(1, matcher.hits['^/proc/.*$'])
+        self.assertEquals(1, matcher.hits[r'^/dev/pts/\d+$'])
+        self.assertEquals([p for p in patterns
+                           if p not in ('^/dev/null$', '^/proc/.*$', r'^/dev/pts/\d+$')],
+                          matcher.unused())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# The harness starts these entry points as subprocesses, to list their test
+# groups and to run them, so their startup time is paid several times a run.
+entry_points = [
+    ("cert", "mcts.certsuite", "certcli"),
+    ("webapirunner", "mcts.webapi_tests.runner", "main"),
+    ("securityrunner", "mcts.securitysuite", "securitycli"),
+]
+
+# modules that mustn't be imported just to list the tests; mozdevice (and
+# moznetwork, which it imports) is left out, as the securitysuite tests
+# catch its exceptions
+heavy_modules = ["fxos_appgen", "gaiatest", "marionette", "marionette_driver",
+                 "py.xml", "tornado", "wptserve"]
+
+script = """
+import sys, time, json
+start = time.time()
+from %(module)s import %(func)s
+imported = time.time()
+sys.argv = [%(name)r, '--list-test-groups']
+stdout = sys.stdout
+sys.stdout = open('%(devnull)s', 'w')
+try:
+    %(func)s()
+except SystemExit:
+    pass
+sys.stdout = stdout
+print json.dumps({'import': imported - start, 'list': time.time() - imported,
+                  'heavy': [m for m in %(heavy)r if m in sys.modules]})
+"""
+
+
+def measure(name, module, func, root):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([root] + filter(None, [env.get('PYTHONPATH')]))
+    code = script % {'name': name, 'module': module, 'func': func,
+                     'devnull': os.devnull.replace('\\', '\\\\'), 'heavy': heavy_modules}
+    start = time.time()
+    output = subprocess.check_output([sys.executable, '-c', code], env=env)
+    result = json.loads(output.splitlines()[-1])
+    result['total'] = time.time() - start
+    return result
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main(argv):
+    """
+    Measure the time it takes each suite entry point to start and list its
+    test groups, and check that it doesn't import modules it only needs to
+    run the tests.
+
+    usage: startup_benchmark.py [-n RUNS] [--save FILE] [--baseline FILE]
+
+    With --baseline, exits with an error if an entry point got slower than
+    the saved baseline by more than --tolerance.
+    """
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("-n", "--runs", type=int, default=5,
+                           help="number of runs per entry point, the median is reported")
+    argparser.add_argument("--save", metavar="FILE",
+                           help="save the results as a baseline")
+    argparser.add_argument("--baseline", metavar="FILE",
+                           help="compare the results against a saved baseline")
+    argparser.add_argument("--tolerance", type=float, default=0.25,
+                           help="allowed slowdown relative to the baseline (default 0.25)")
+    args = argparser.parse_args(argv[1:])
+
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+    results = {}
+    failed = False
+    print "%-16s %10s %10s %10s" % ("entry point", "import", "list", "total")
+    for name, module, func in entry_points:
+        runs = [measure(name, module, func, root) for i in range(args.runs)]
+        results[name] = dict((key, median([run[key] for run in runs]))
+                             for key in ('import', 'list', 'total'))
+        print "%-16s %9.3fs %9.3fs %9.3fs" % (name, results[name]['import'],
+                                             results[name]['list'], results[name]['total'])
+        heavy = runs[-1]['heavy']
+        if heavy:
+            print "  imports %s to list its tests" % ", ".join(heavy)
+            failed = True
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for name in sorted(results):
+            if name not in baseline:
+                continue
+            limit = baseline[name]['total'] * (1 + args.tolerance)
+            if results[name]['total'] > limit:
+                print "%s regressed: %.3fs, baseline %.3fs" % (name, results[name]['total'],
+                                                              baseline[name]['total'])
+                failed = True
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
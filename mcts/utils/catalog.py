@@ -0,0 +1,103 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import os
+import tempfile
+
+import pkg_resources
+
+default_path = os.path.join(os.path.expanduser('~'), '.fxos-certsuite', 'test-catalog.json')
+
+
+def package_version():
+    try:
+        return pkg_resources.get_distribution("fxos-certsuite").version
+    except pkg_resources.DistributionNotFound:
+        return None
+
+
+def source_signature(paths):
+    '''
+    Return a summary of the files under paths that changes whenever one of
+    them is added, removed or modified: their number, latest mtime and
+    total size.
+    '''
+    count = 0
+    mtime = 0
+    size = 0
+    for path in paths:
+        for root, dirs, files in os.walk(path, followlinks=True):
+            for name in files:
+                if name.endswith(('.pyc', '.pyo')):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                count += 1
+                mtime = max(mtime, st.st_mtime)
+                size += st.st_size
+    return [count, mtime, size]
+
+
+class TestCatalog(object):
+    '''
+    Listings of the tests the subharnesses can run, cached on disk so that
+    they needn't be started, and their test modules imported, every time
+    the tests are listed. An entry is used as long as the installed
+    fxos-certsuite version and the files it was listed from are unchanged.
+    '''
+
+    def __init__(self, path=default_path):
+        self.path = path
+        self.entries = None
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                return entries
+        except (IOError, ValueError):
+            pass
+        return {}
+
+    def save(self):
+        # the cache is only an optimisation, so failing to write it is fine
+        try:
+            dirname = os.path.dirname(self.path)
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+            fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.entries, f)
+            if os.path.exists(self.path):
+                # os.rename doesn't replace files on Windows
+                os.remove(self.path)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError):
+            pass
+
+    def get(self, key, sources, compute):
+        '''
+        Return the listing cached under key, or compute() it and cache it.
+        sources are the paths of the files the listing depends on; if None
+        the listing isn't cached.
+        '''
+        if sources is None:
+            return compute()
+
+        if self.entries is None:
+            self.entries = self.load()
+        signature = {'version': package_version(),
+                     'sources': source_signature(sources)}
+        entry = self.entries.get(key)
+        if entry is not None and entry.get('signature') == signature:
+            return entry['value']
+
+        value = compute()
+        self.entries[key] = {'signature': signature, 'value': value}
+        self.save()
+        return value
@@ -2,12 +2,144 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import socket
+import time
+
 from mcts.utils.handlers.adb_b2g import ADBB2G
-from marionette import Marionette
+# marionette is imported on first use, as most runs of the suites' entry
+# points that import this module (listing tests, say) never need it
+
+
+class SessionPool(object):
+    """Long-lived sessions on the shared Marionette instance.
+
+    Scripts run through the pool reuse one session and only switch it to
+    the content or chrome context they need, instead of paying for a
+    connect/newSession/deleteSession handshake per script. A session whose
+    connection died (e.g. after a reboot) is replaced transparently.
+    """
+
+    # seconds a session has to answer a liveness check in
+    ping_timeout = 5
+
+    def __init__(self, host='localhost', port=None):
+        self.host = host
+        self.port = port
+        self.counters = {'sessions': 0,
+                         'reconnects': 0,
+                         'pings': 0,
+                         'scripts': 0,
+                         'session_time': 0.0,
+                         'script_time': 0.0}
+
+    @property
+    def marionette(self):
+        return DeviceHelper.getMarionette(self.host, self.port)
+
+    def is_alive(self, marionette=None):
+        """Return whether the session answers a trivial script within
+        ping_timeout. Its connection looking open isn't enough, as the
+        device or a restart of b2g may have dropped it since."""
+        from marionette_driver import errors
+        m = marionette or self.marionette
+        if m.session is None or m.client.sock is None:
+            return False
+        self.counters['pings'] += 1
+        socket_timeout = m.client.socket_timeout
+        m.client.socket_timeout = self.ping_timeout
+        try:
+            m.execute_script("return 1;")
+            return True
+        except (IOError, socket.error, errors.MarionetteException):
+            return False
+        finally:
+            m.client.socket_timeout = socket_timeout
+
+    def _start(self, m):
+        start = time.time()
+        m.start_session()
+        self.counters['sessions'] += 1
+        self.counters['session_time'] += time.time() - start
+
+    def _reset(self, m):
+        # the connection is gone, so there is no session left to delete
+        m.session = None
+        m.session_id = None
+        m.window = None
+        m.client.close()
+
+    def get(self, chrome=False, verify=True):
+        """Return the pooled Marionette instance with a live session in the
+        content, or chrome, context.
+
+        :param verify: Check that the session still answers, and replace it
+                       if it doesn't. Callers that retry on a dead session
+                       themselves can skip the round trip this costs.
+        """
+        m = self.marionette
+        if m.session is None:
+            self._start(m)
+        elif m.client.sock is None or (verify and not self.is_alive(m)):
+            self._reset(m)
+            self.counters['reconnects'] += 1
+            self._start(m)
+        m.set_context(m.CONTEXT_CHROME if chrome else m.CONTEXT_CONTENT)
+        return m
+
+    def content(self):
+        return self.get(chrome=False)
+
+    def chrome(self):
+        return self.get(chrome=True)
+
+    def run_script(self, script, chrome=False, async=False, **kwargs):
+        """Run a script in a pooled session, reconnecting once if the
+        session turns out to be dead."""
+        from marionette_driver import errors
+        for attempt in range(2):
+            try:
+                m = self.get(chrome, verify=False)
+                start = time.time()
+                if async:
+                    result = m.execute_async_script(script, **kwargs)
+                else:
+                    result = m.execute_script(script, **kwargs)
+                self.counters['scripts'] += 1
+                self.counters['script_time'] += time.time() - start
+                return result
+            except (IOError, socket.error, errors.InvalidSessionIdException):
+                if attempt:
+                    raise
+                self._reset(self.marionette)
+                self.counters['reconnects'] += 1
+
+    def close(self):
+        from marionette_driver import errors
+        m = DeviceHelper.marionette
+        if m is not None and m.session is not None:
+            try:
+                m.delete_session()
+            except (IOError, socket.error, errors.MarionetteException):
+                self._reset(m)
+
+    def stats(self):
+        """Return a copy of the counters, with the average cost of starting
+        a session and of running a script."""
+        stats = dict(self.counters)
+        stats['avg_session_time'] = (stats['session_time'] / stats['sessions']
+                                     if stats['sessions'] else 0.0)
+        stats['avg_script_time'] = (stats['script_time'] / stats['scripts']
+                                    if stats['scripts'] else 0.0)
+        return stats
+
 
 class DeviceHelper(object):
     device = None
     marionette = None
+    sessions = None
+    # local port forwarded to marionette on the device; runners set this
+    # from their --port argument so several devices can be driven at once
+    marionette_port = 2828
 
     @staticmethod
     def getDevice(DeviceManager=ADBB2G, **kwargs):
@@ -17,13 +149,24 @@ class DeviceHelper(object):
             # forward only once after creating the device manager object
             hasadb = kwargs.pop('hasadb', True)
             if hasadb:
-                DeviceHelper.device.forward("tcp:2828", "tcp:2828")
+                DeviceHelper.device.forward("tcp:%d" % DeviceHelper.marionette_port,
+                                            "tcp:2828")
 
         return DeviceHelper.device
     
     @staticmethod
-    def getMarionette(host='localhost', port=2828):
+    def getMarionette(host='localhost', port=None):
+        if port is None:
+            port = DeviceHelper.marionette_port
         if not DeviceHelper.marionette:
+            from marionette import Marionette
             DeviceHelper.marionette = Marionette(host, port)
             
         return DeviceHelper.marionette
+
+    @staticmethod
+    def getSessionPool(host='localhost', port=None):
+        if not DeviceHelper.sessions:
+            DeviceHelper.sessions = SessionPool(host, port)
+
+        return DeviceHelper.sessions
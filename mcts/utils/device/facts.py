@@ -0,0 +1,185 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import ConfigParser
+import json
+import os
+import threading
+import time
+from cStringIO import StringIO
+
+# the harness saves the facts of the device it runs the suites on to the
+# file named by this environment variable, so that they needn't query it
+# again
+facts_env = "MCTS_DEVICE_FACTS"
+
+# one shell command gathers all the facts, their outputs separated by
+# marker lines; stderr is dropped as adb may mix it into stdout
+sections = [
+    ("buildprops", "cat /system/build.prop"),
+    ("kernel_version", "cat /proc/version"),
+    ("application_ini", "cat /system/b2g/application.ini"),
+    ("processes", "ps"),
+]
+marker = "__mcts_facts__"
+
+
+def parse_buildprops(output):
+    buildprops = {}
+    for line in output.splitlines():
+        if '=' in line:
+            prop, val = line.split('=', 1)
+            buildprops[prop] = val
+    return buildprops
+
+
+def parse_application_ini(output):
+    config = ConfigParser.RawConfigParser()
+    try:
+        config.readfp(StringIO(output))
+    except ConfigParser.Error:
+        return {}
+    application_ini = {}
+    for section in config.sections():
+        application_ini[section] = dict(config.items(section))
+    return application_ini
+
+
+def parse_processes(output):
+    """Parse the output of ps like ADBDevice.get_process_list, into a list
+    of {'pid', 'name', 'user'} dicts."""
+    lines = [line for line in output.splitlines() if line.strip()]
+    if not lines:
+        return []
+    header = [item.lower() for item in lines[0].split()]
+    if 'pid' not in header or 'user' not in header:
+        return []
+    pid_i = header.index('pid')
+    user_i = header.index('user')
+    processes = []
+    for line in lines[1:]:
+        els = line.split()
+        if len(els) <= max(pid_i, user_i):
+            continue
+        try:
+            pid = int(els[pid_i])
+        except ValueError:
+            continue
+        processes.append({'pid': pid, 'name': els[-1], 'user': els[user_i]})
+    return processes
+
+
+class DeviceFacts(object):
+    """Facts about a device that don't change while the suites run on it:
+
+    serial -- the adb serial of the device (str or None)
+    buildprops -- the properties from /system/build.prop (dict of str)
+    kernel_version -- the contents of /proc/version (str)
+    application_ini -- the sections of /system/b2g/application.ini (dict
+                       of dicts of str)
+    processes -- the processes running when the facts were collected
+                 (list of {'pid': int, 'name': str, 'user': str})
+    collected -- when the facts were collected (seconds since the epoch)
+    """
+
+    def __init__(self, serial=None, buildprops=None, kernel_version="",
+                 application_ini=None, processes=None, collected=None):
+        self.serial = serial
+        self.buildprops = buildprops or {}
+        self.kernel_version = kernel_version
+        self.application_ini = application_ini or {}
+        self.processes = processes or []
+        self.collected = collected if collected is not None else time.time()
+
+    @classmethod
+    def collect(cls, device):
+        """Query device for its facts, with a single shell command.
+
+        :raises: ADBError, ADBTimeoutError
+        """
+        cmd = "; ".join("%s 2>/dev/null; echo; echo %s" % (command, marker)
+                        for _, command in sections)
+        output = device.shell_output(cmd).replace('\r', '')
+        parts = dict(zip([name for name, _ in sections],
+                         (part.strip('\n') for part in
+                          output.split("\n%s\n" % marker))))
+        return cls(serial=getattr(device, '_device_serial', None),
+                   buildprops=parse_buildprops(parts.get('buildprops', '')),
+                   kernel_version=parts.get('kernel_version', '').strip(),
+                   application_ini=parse_application_ini(parts.get('application_ini', '')),
+                   processes=parse_processes(parts.get('processes', '')))
+
+    @property
+    def fingerprint(self):
+        return self.buildprops.get('ro.build.fingerprint')
+
+    @property
+    def gecko_version(self):
+        return self.application_ini.get('App', {}).get('version')
+
+    @property
+    def gecko_build_id(self):
+        return self.application_ini.get('App', {}).get('buildid')
+
+    def device_info(self):
+        """A summary of the facts, as logged with suite_start and shown in
+        the reports."""
+        return {'serial': self.serial or '',
+                'fingerprint': self.fingerprint or '',
+                'display_id': self.buildprops.get('ro.build.display.id', ''),
+                'kernel_version': self.kernel_version,
+                'gecko_version': self.gecko_version or '',
+                'gecko_build_id': self.gecko_build_id or ''}
+
+    def to_json(self):
+        return {'serial': self.serial,
+                'buildprops': self.buildprops,
+                'kernel_version': self.kernel_version,
+                'application_ini': self.application_ini,
+                'processes': self.processes,
+                'collected': self.collected}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(**dict((str(key), value) for key, value in data.iteritems()))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_json(json.load(f))
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_device_facts(device, refresh=False):
+    """Return the DeviceFacts of device, collected once per process and
+    serial. If the harness passed the facts of the same device in the
+    environment, they are used rather than querying the device.
+
+    :raises: ADBError, ADBTimeoutError
+    """
+    serial = getattr(device, '_device_serial', None)
+    with _cache_lock:
+        if not refresh and serial in _cache:
+            return _cache[serial]
+
+        facts = None
+        path = os.environ.get(facts_env)
+        if not refresh and path:
+            try:
+                facts = DeviceFacts.load(path)
+            except (IOError, ValueError, TypeError):
+                facts = None
+            if facts is not None and facts.serial != serial:
+                facts = None
+        if facts is None:
+            facts = DeviceFacts.collect(device)
+        _cache[serial] = facts
+        return facts
@@ -0,0 +1,163 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import facts
+from facts import (DeviceFacts, get_device_facts, parse_application_ini,
+                   parse_buildprops, parse_processes)
+
+buildprop = """
+# begin build properties
+ro.build.display.id=build-1
+ro.build.fingerprint=vendor/device:4.4/KOT49H/1:user/release-keys
+ro.build.description=a=b
+"""
+
+application_ini = """[App]
+Vendor=Mozilla
+Name=B2G
+Version=32.0
+BuildID=20140923175406
+
+[Gecko]
+MinVersion=32.0
+"""
+
+ps = """USER     PID   PPID  VSIZE  RSS     WCHAN    PC         NAME
+root      1     0     640    496   c00bd520 00019fb8 S /init
+root      2     0     0      0     c00335a0 00000000 S kthreadd
+u0_a1     300   120   88276  31136 ffffffff b6f0b8c4 S /system/b2g/b2g
+"""
+
+kernel = "Linux version 3.4.0 (build@host) #1 PREEMPT"
+
+
+class FakeDevice(object):
+    """Answers the facts command with the output of a device with each
+    section's output as given, counting the commands it runs."""
+
+    def __init__(self, serial, outputs):
+        self._device_serial = serial
+        self.outputs = outputs
+        self.commands = 0
+
+    def shell_output(self, cmd):
+        self.commands += 1
+        # adb turns the device's line endings into \r\n
+        return "".join("%s\n%s\n" % (output, facts.marker)
+                       for output in self.outputs).replace("\n", "\r\n")
+
+
+class TestParsers(unittest.TestCase):
+
+    def test_parse_buildprops(self):
+        props = parse_buildprops(buildprop)
+        self.assertEquals("build-1", props["ro.build.display.id"])
+        self.assertEquals("a=b", props["ro.build.description"])
+        self.assertEquals(3, len(props))
+        self.assertEquals({}, parse_buildprops(""))
+
+    def test_parse_application_ini(self):
+        ini = parse_application_ini(application_ini)
+        self.assertEquals(["App", "Gecko"], sorted(ini))
+        self.assertEquals("32.0", ini["App"]["version"])
+        self.assertEquals("20140923175406", ini["App"]["buildid"])
+        self.assertEquals({}, parse_application_ini(""))
+        self.assertEquals({}, parse_application_ini("not an ini file"))
+
+    def test_parse_processes(self):
+        self.assertEquals([{"pid": 1, "name": "/init", "user": "root"},
+                           {"pid": 2, "name": "kthreadd", "user": "root"},
+                           {"pid": 300, "name": "/system/b2g/b2g", "user": "u0_a1"}],
+                          parse_processes(ps))
+        self.assertEquals([], parse_processes(""))
+        self.assertEquals([], parse_processes("/system/bin/sh: ps: not found"))
+        self.assertEquals([{"pid": 1, "name": "/init", "user": "root"}],
+                          parse_processes(ps.splitlines()[0] + "\nroot x\nroot 1 0 /init\n"))
+
+
+class TestDeviceFacts(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        facts._cache.clear()
+        self.environ = os.environ.pop(facts.facts_env, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        facts._cache.clear()
+        os.environ.pop(facts.facts_env, None)
+        if self.environ is not None:
+            os.environ[facts.facts_env] = self.environ
+
+    def device(self, serial="0123"):
+        return FakeDevice(serial, [buildprop, kernel, application_ini, ps])
+
+    def test_collect(self):
+        device_facts = DeviceFacts.collect(self.device())
+        self.assertEquals("0123", device_facts.serial)
+        self.assertEquals("build-1", device_facts.buildprops["ro.build.display.id"])
+        self.assertEquals(kernel, device_facts.kernel_version)
+        self.assertEquals("32.0", device_facts.gecko_version)
+        self.assertEquals(3, len(device_facts.processes))
+        self.assertEquals({"serial": "0123",
+                           "fingerprint": "vendor/device:4.4/KOT49H/1:user/release-keys",
+                           "display_id": "build-1",
+                           "kernel_version": kernel,
+                           "gecko_version": "32.0",
+                           "gecko_build_id": "20140923175406"},
+                          device_facts.device_info())
+
+    def test_collect_missing(self):
+        device_facts = DeviceFacts.collect(FakeDevice(None, ["", "", "", ""]))
+        self.assertEquals({"serial": "", "fingerprint": "", "display_id": "",
+                           "kernel_version": "", "gecko_version": "",
+                           "gecko_build_id": ""},
+                          device_facts.device_info())
+        self.assertEquals([], device_facts.processes)
+
+    def test_save_load(self):
+        device_facts = DeviceFacts.collect(self.device())
+        path = os.path.join(self.temp_dir, "facts.json")
+        device_facts.save(path)
+        loaded = DeviceFacts.load(path)
+        self.assertEquals(device_facts.to_json(), loaded.to_json())
+        self.assertEquals(device_facts.device_info(), loaded.device_info())
+        self.assertEquals(device_facts.collected, loaded.collected)
+
+    def test_get_device_facts(self):
+        device = self.device()
+        device_facts = get_device_facts(device)
+        self.assertTrue(get_device_facts(device) is device_facts)
+        self.assertEquals(1, device.commands)
+        get_device_facts(device, refresh=True)
+        self.assertEquals(2, device.commands)
+
+    def test_get_device_facts_environment(self):
+        path = os.path.join(self.temp_dir, "facts.json")
+        DeviceFacts.collect(self.device()).save(path)
+        os.environ[facts.facts_env] = path
+
+        device = self.device()
+        self.assertEquals("build-1", get_device_facts(device).device_info()["display_id"])
+        self.assertEquals(0, device.commands)
+
+        # the facts of another device aren't used
+        other = self.device("4567")
+        self.assertEquals("4567", get_device_facts(other).serial)
+        self.assertEquals(1, other.commands)
+
+        # nor are unreadable ones
+        facts._cache.clear()
+        with open(path, "w") as f:
+            f.write("not json")
+        get_device_facts(device)
+        self.assertEquals(1, device.commands)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,14 @@
 import ConfigParser
 import datetime
+import json
 import os
 import posixpath
+import Queue
 import re
 import shutil
+import subprocess
 import tempfile
+import threading
 import time
 import traceback
 
@@ -18,9 +22,51 @@ class WaitTimeout(Exception):
     pass
 
 
+class ShellUnavailableError(adb.ADBError):
+    """A persistent shell went away before a command was sent to it, so
+    the command didn't run."""
+    pass
+
+
+default_backup_cache = os.path.join(os.path.expanduser("~"), ".fxos-certsuite", "backup")
+
+
+def clear_backup_cache(cache_root=None):
+    """Delete the device backups kept in cache_root, by default
+    ~/.fxos-certsuite/backup. Return whether there was anything to
+    delete."""
+    if cache_root is None:
+        cache_root = default_backup_cache
+    if not os.path.exists(cache_root):
+        return False
+    shutil.rmtree(cache_root)
+    return True
+
+
 class DeviceBackup(object):
-    def __init__(self, backup_dirs=None, backup_files=None):
-        self.device = ADBB2G()
+    """Back up device state before a run and restore it afterwards.
+
+    The backup is kept in a local cache per device serial, together with a
+    manifest of the directories and the md5 digests of the files backed up,
+    computed on the device. The next backup of the same device only pulls
+    files whose digest changed, and restore only pushes back files that
+    changed during the run, recreates directories that were removed and
+    removes files and directories that were added. If the device can't
+    hash its files, whole directories are pulled and pushed as before.
+
+    The cache holds a copy of the device's profile, including its cookies
+    and stored passwords, and is kept after the run until it is deleted
+    with clear_backup_cache; it is only readable by the user.
+    """
+
+    # above this many changed files transferring whole directories is faster
+    max_file_transfers = 100
+
+    def __init__(self, backup_dirs=None, backup_files=None, device_serial=None,
+                 cache_root=None, device=None):
+        if device is None:
+            device = ADBB2G(device=device_serial)
+        self.device = device
         self.logger = self.device._logger
 
         if backup_dirs is None:
@@ -32,6 +78,13 @@ class DeviceBackup(object):
             backup_files = ["/system/etc/hosts"]
         self.backup_files = backup_files
 
+        if cache_root is None:
+            cache_root = default_backup_cache
+        self.cache_root = cache_root
+        self.backup_path = os.path.join(cache_root, self.device._device_serial or "default")
+        self.manifest_path = os.path.join(self.backup_path, "manifest.json")
+        self.manifest = {}
+
     def local_dir(self, remote):
         return os.path.join(self.backup_path, remote.lstrip("/"))
 
@@ -42,23 +95,102 @@ class DeviceBackup(object):
     def __exit__(self, *args, **kwargs):
         self.cleanup()
 
+    def scan(self, remote_dir):
+        """Return the directories below remote_dir and a dict mapping each
+        file below it to its md5 digest, computed on the device, as
+        {"dirs": [...], "files": {...}}; or None if that isn't possible."""
+        # remote_dir is absolute, so the directories are the lines starting
+        # with / rather than with a digest
+        try:
+            output = self.device.shell_output(
+                "find %s -type d && find %s -type f -exec md5sum {} +" %
+                (remote_dir, remote_dir))
+        except adb.ADBError:
+            return None
+
+        dirs = []
+        digests = {}
+        for line in output.splitlines():
+            line = line.strip()
+            if line.startswith("/"):
+                dirs.append(line)
+                continue
+            digest, _, path = line.partition(" ")
+            path = path.strip()
+            if len(digest) == 32 and path:
+                digests[path] = digest
+        if not digests:
+            return None
+        return {"dirs": sorted(dirs), "files": digests}
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def pull_dir(self, remote_path):
+        local_path = self.local_dir(remote_path)
+        if os.path.exists(local_path):
+            shutil.rmtree(local_path)
+        os.makedirs(local_path)
+        self.device.pull(remote_path, local_path)
+
+    def pull_file(self, remote_path):
+        local_path = self.local_dir(remote_path)
+        local_dir = os.path.dirname(local_path)
+        if not os.path.exists(local_dir):
+            os.makedirs(local_dir)
+        self.device.pull(remote_path, local_path)
+
     def backup(self):
         self.logger.info("Backing up device")
-        self.backup_path = tempfile.mkdtemp()
-
+        if not os.path.exists(self.cache_root):
+            os.makedirs(self.cache_root)
+        # the backups hold the device's profile, so keep them private
+        os.chmod(self.cache_root, 0700)
+        if not os.path.exists(self.backup_path):
+            os.makedirs(self.backup_path)
+
+        cached = self.load_manifest()
+        # The cache is inconsistent until the backup completes
+        if os.path.exists(self.manifest_path):
+            os.unlink(self.manifest_path)
+
+        self.manifest = {}
         for remote_path in self.backup_dirs:
-            local_path = self.local_dir(remote_path)
-            if not os.path.exists(local_path):
-                os.makedirs(local_path)
-            self.device.pull(remote_path, local_path)
+            contents = self.scan(remote_path)
+            self.manifest[remote_path] = contents
+            # caches written before directories were recorded are ignored
+            cached_contents = cached.get(remote_path) or {}
+            cached_digests = cached_contents.get("files") if "dirs" in cached_contents else None
+
+            if contents is None or not cached_digests:
+                self.pull_dir(remote_path)
+                continue
+
+            digests = contents["files"]
+
+            for path in set(cached_digests) - set(digests):
+                if os.path.exists(self.local_dir(path)):
+                    os.unlink(self.local_dir(path))
+
+            changed = [path for path, digest in digests.iteritems()
+                       if cached_digests.get(path) != digest]
+            self.logger.debug("%d of %d files in %s changed since the last backup" %
+                              (len(changed), len(digests), remote_path))
+            if len(changed) > self.max_file_transfers:
+                self.pull_dir(remote_path)
+            else:
+                for path in changed:
+                    self.pull_file(path)
 
         for remote_path in self.backup_files:
-            remote_dir, filename = remote_path.rsplit("/", 1)
-            local_dir = self.local_dir(remote_dir)
-            local_path = os.path.join(local_dir, filename)
-            if not os.path.exists(local_dir):
-                os.makedirs(local_dir)
-            self.device.pull(remote_path, local_path)
+            self.pull_file(remote_path)
+
+        with open(self.manifest_path, "w") as f:
+            json.dump(self.manifest, f)
 
         return self
 
@@ -67,18 +199,72 @@ class DeviceBackup(object):
         self.device.remount()
 
         for remote_path in self.backup_files:
-            remote_dir, filename = remote_path.rsplit("/", 1)
-            local_path = os.path.join(self.local_dir(remote_dir), filename)
             self.device.rm(remote_path)
-            self.device.push(local_path, remote_path)
+            self.device.push(self.local_dir(remote_path), remote_path)
 
         for remote_path in self.backup_dirs:
-            local_path = self.local_dir(remote_path)
-            self.device.rm(remote_path, recursive=True)
-            self.device.push(local_path, remote_path)
+            backed_up = self.manifest.get(remote_path)
+            contents = self.scan(remote_path) if backed_up else None
+
+            if contents is not None:
+                digests = contents["files"]
+                changed = [path for path, digest in backed_up["files"].iteritems()
+                           if digests.get(path) != digest]
+                added = [path for path in digests if path not in backed_up["files"]]
+                added_dirs = self.outermost(set(contents["dirs"]) - set(backed_up["dirs"]))
+                removed_dirs = sorted(set(backed_up["dirs"]) - set(contents["dirs"]))
+                self.logger.debug("%d files changed, %d files and %d directories added and "
+                                  "%d directories removed in %s during the run" %
+                                  (len(changed), len(added), len(added_dirs),
+                                   len(removed_dirs), remote_path))
+
+            if (contents is None or
+                    len(changed) + len(added) + len(removed_dirs) > self.max_file_transfers):
+                self.device.rm(remote_path, recursive=True)
+                self.device.push(self.local_dir(remote_path), remote_path)
+                continue
+
+            for path in added_dirs:
+                self.device.rm(path, recursive=True, force=True)
+            for path in added:
+                if not any(path.startswith(dir_path + "/") for dir_path in added_dirs):
+                    self.device.rm(path, force=True)
+            # pushing a file creates its directory, but empty ones have to
+            # be made again
+            for path in self.innermost(removed_dirs):
+                self.device.mkdir(path, parents=True)
+            for path in changed:
+                self.device.push(self.local_dir(path), path)
+
+    @staticmethod
+    def ancestors(path):
+        """Return the directories path is below"""
+        rv = []
+        path = posixpath.dirname(path)
+        while path not in ("/", ""):
+            rv.append(path)
+            path = posixpath.dirname(path)
+        return rv
+
+    @classmethod
+    def outermost(cls, dirs):
+        """Return the directories of dirs that aren't below another one"""
+        dirs = set(dirs)
+        return sorted(path for path in dirs
+                      if not any(parent in dirs for parent in cls.ancestors(path)))
+
+    @classmethod
+    def innermost(cls, dirs):
+        """Return the directories of dirs that haven't another one below
+        them"""
+        parents = set()
+        for path in dirs:
+            parents.update(cls.ancestors(path))
+        return sorted(set(dirs) - parents)
 
     def cleanup(self):
-        shutil.rmtree(self.backup_path)
+        # The backup is kept as the cache for the next run on this device
+        self.device.close()
 
 class PushFile(object):
     """Context manager that installs a file onto the device, and removes it again"""
@@ -118,6 +304,355 @@ def poll_wait(func, polling_interval=1.0, timeout=30, after_first=None):
     raise WaitTimeout()
 
 
+class ShellSession(object):
+    """A long-lived adb shell on a device, that runs one command at a time
+    without spawning an adb process per command.
+
+    Each command is framed by markers echoed before and after it, the
+    latter carrying its exit code, so its output can be told apart from
+    the shell's prompt and echo of its input.
+    """
+
+    # a marker, possibly preceded by the last line of the command's output
+    # if that didn't end with a newline
+    _marker = re.compile(r"^(.*?)__mcts_shell_(\d+)_(start|\d+)$")
+
+    def __init__(self, device):
+        args = [device._adb_path]
+        if device._adb_host:
+            args.extend(['-H', device._adb_host])
+        if device._adb_port:
+            args.extend(['-P', str(device._adb_port)])
+        if device._device_serial:
+            args.extend(['-s', device._device_serial])
+        args.extend(["wait-for-device", "shell"])
+
+        self.proc = subprocess.Popen(args, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT)
+        self.lines = Queue.Queue()
+        self.closed = False
+        self.count = 0
+        reader = threading.Thread(target=self._read)
+        reader.daemon = True
+        reader.start()
+
+    def _read(self):
+        for line in iter(self.proc.stdout.readline, ''):
+            self.lines.put(line)
+        self.lines.put(None)
+
+    @property
+    def alive(self):
+        return not self.closed and self.proc.poll() is None
+
+    def run_to(self, cmd, write, timeout):
+        """Run cmd in the shell, passing each line of its output (without
+        line ending) to write, and return its exit code.
+
+        :raises: * ADBTimeoutError if it doesn't finish within timeout
+                 * ShellUnavailableError if the shell had gone away before
+                   cmd was sent
+                 * ADBError if the shell went away after cmd was sent
+        """
+        self.count += 1
+        count = str(self.count)
+        try:
+            # the quotes keep the markers out of the shell's echo of the
+            # line; the command runs in a subshell, so that exit, cd or
+            # export don't affect the next ones, and mustn't read what
+            # follows it on stdin
+            self.proc.stdin.write('echo "__mcts_shell_%s""_start"; ( %s\n) </dev/null; '
+                                  'echo "__mcts_shell_%s""_$?"\n' %
+                                  (count, cmd.rstrip().rstrip(';'), count))
+            self.proc.stdin.flush()
+        except (IOError, OSError) as e:
+            self.closed = True
+            raise ShellUnavailableError("adb shell has exited: %s" % e)
+
+        deadline = time.time() + timeout
+        started = False
+        while True:
+            try:
+                line = self.lines.get(timeout=max(deadline - time.time(), 0))
+            except Queue.Empty:
+                raise adb.ADBTimeoutError("%s timed out" % cmd)
+            if line is None:
+                self.closed = True
+                raise adb.ADBError("adb shell has exited")
+            line = line.rstrip('\r\n')
+            m = self._marker.match(line)
+            if m is None or m.group(2) != count:
+                if started:
+                    write(line)
+            elif m.group(3) == "start":
+                started = True
+            elif started:
+                if m.group(1):
+                    write(m.group(1))
+                return int(m.group(3))
+
+    def run(self, cmd, timeout):
+        """Run cmd in the shell and return its (exit code, output lines)."""
+        output = []
+        status = self.run_to(cmd, output.append, timeout)
+        return status, output
+
+    def close(self):
+        self.closed = True
+        if not self.proc.stdin.closed:
+            try:
+                self.proc.stdin.write("exit\n")
+                self.proc.stdin.close()
+            except (IOError, OSError):
+                pass
+        if self.proc.poll() is None:
+            try:
+                self.proc.kill()
+            except OSError:
+                pass
+
+
+class ShellProcess(object):
+    """The result of a command run over a ShellChannel, with the attributes
+    of the mozdevice ADBProcess that ADBDevice.shell returns."""
+
+    def __init__(self, args):
+        self.args = args
+        self.stdout_file = tempfile.TemporaryFile()
+        self.stderr_file = tempfile.TemporaryFile()
+        self.timedout = None
+        self.exitcode = None
+        self.proc = None
+
+    @property
+    def stdout(self):
+        if not self.stdout_file or self.stdout_file.closed:
+            return ""
+        self.stdout_file.seek(0, os.SEEK_SET)
+        return self.stdout_file.read().rstrip()
+
+    @property
+    def stderr(self):
+        """Always empty: the shell's stderr is merged into its stdout, so
+        any error output is part of stdout."""
+        return ""
+
+    def __str__(self):
+        return ('args: %s, exitcode: %s, stdout: %s' % (
+            ' '.join(self.args), self.exitcode, self.stdout))
+
+
+class ShellChannel(object):
+    """Runs the shell commands of an ADBB2G over a few long-lived adb shells
+    instead of an adb process per command.
+
+    Commands from several threads are spread over up to max_sessions
+    shells, so a long running command doesn't hold up the others; idle
+    shells are kept open for the next commands. A shell that dies, e.g.
+    when the device reboots, is dropped and replaced on demand.
+    """
+
+    def __init__(self, device, max_sessions=4):
+        self.device = device
+        self.max_sessions = max_sessions
+        self.idle = []
+        self.open_sessions = 0
+        self.lock = threading.Condition()
+        self.closed = False
+        self.counters = {'commands': 0,
+                         'sessions': 0,
+                         'timeouts': 0,
+                         'command_time': 0.0}
+
+    def acquire(self):
+        with self.lock:
+            while True:
+                while self.idle:
+                    session = self.idle.pop()
+                    if session.alive:
+                        return session
+                    session.close()
+                    self.open_sessions -= 1
+                if self.open_sessions < self.max_sessions:
+                    self.open_sessions += 1
+                    self.counters['sessions'] += 1
+                    break
+                self.lock.wait()
+        try:
+            return ShellSession(self.device)
+        except (OSError, ValueError) as e:
+            with self.lock:
+                self.open_sessions -= 1
+                self.lock.notify()
+            raise ShellUnavailableError("Couldn't start adb shell: %s" % e)
+
+    def release(self, session):
+        with self.lock:
+            if session.alive and not self.closed:
+                self.idle.append(session)
+            else:
+                session.close()
+                self.open_sessions -= 1
+            self.lock.notify()
+
+    def shell(self, cmd, timeout):
+        """Run cmd and return a ShellProcess holding its output and exit
+        code, or marked as timed out.
+
+        :raises: * ShellUnavailableError if no shell could be started, or it
+                   went away before the command was sent; the command
+                   didn't run.
+                 * ADBError if the shell went away after the command was
+                   sent; the command may or may not have run.
+        """
+        process = ShellProcess(["shell", cmd])
+        session = self.acquire()
+        start = time.time()
+        try:
+            process.exitcode = session.run_to(
+                cmd, lambda line: process.stdout_file.write(line + "\n"), timeout)
+            process.timedout = False
+        except adb.ADBTimeoutError:
+            # the command is still running, so the shell can't be reused
+            session.close()
+            process.timedout = True
+            with self.lock:
+                self.counters['timeouts'] += 1
+        except:
+            process.stdout_file.close()
+            process.stderr_file.close()
+            raise
+        finally:
+            self.release(session)
+            with self.lock:
+                self.counters['commands'] += 1
+                self.counters['command_time'] += time.time() - start
+        process.stdout_file.seek(0, os.SEEK_SET)
+        return process
+
+    def drop_idle(self):
+        """Close the idle shells, e.g. because adbd restarted under them."""
+        with self.lock:
+            for session in self.idle:
+                session.close()
+                self.open_sessions -= 1
+            self.idle = []
+
+    def close(self):
+        """Close the idle shells; shells still running a command are closed
+        when it finishes."""
+        with self.lock:
+            self.closed = True
+            self.drop_idle()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats['avg_command_time'] = (stats['command_time'] / stats['commands']
+                                     if stats['commands'] else 0.0)
+        return stats
+
+
+class ReadinessWatcher(object):
+    """Waits for b2g on a device to become ready, i.e. to write prefs.js
+    once it has (re)started.
+
+    The modification time of prefs.js is polled over a single long-lived
+    adb shell, reopened if the device goes away, e.g. while rebooting.
+    Polls start min_interval apart and back off towards max_interval; once
+    earlier waits on the device show when readiness is to be expected,
+    polling speeds up again around that time.
+    The time it took to become ready of each wait is kept per device.
+    """
+
+    min_interval = 0.05
+    backoff = 1.5
+    # number of waits per device the expected time to ready is derived from
+    history_size = 10
+    history = {}
+
+    def __init__(self, device, path, max_interval=1.0):
+        self.device = device
+        self.path = path
+        self.max_interval = max(max_interval, self.min_interval)
+        self.session = None
+        self.metrics = {'polls': 0, 'reconnects': 0, 'time_to_ready': None}
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def expected_time_to_ready(self):
+        times = sorted(self.history.get(self.device._device_serial, []))
+        if not times:
+            return None
+        return times[len(times) // 2]
+
+    def poll(self, timeout):
+        """Return the modification time of the watched file as listed by ls,
+        or None if it couldn't be read."""
+        if self.session is not None and not self.session.alive:
+            self.session.close()
+            self.session = None
+            self.metrics['reconnects'] += 1
+        if self.session is None:
+            self.session = ShellSession(self.device)
+
+        self.metrics['polls'] += 1
+        try:
+            status, lines = self.session.run("ls -l %s" % self.path, max(timeout, 0))
+        except adb.ADBTimeoutError:
+            # the device is probably restarting; start over with a new shell
+            self.session.close()
+            return None
+        except adb.ADBError:
+            return None
+        if status != 0 or not lines:
+            return None
+        try:
+            mode, user, group, size, date, clock, name = lines[-1].split(None, 6)
+        except ValueError:
+            return None
+        return "%s %s" % (date, clock)
+
+    def wait(self, timeout, after_first=None):
+        """Wait until the watched file is modified and return the time it
+        took to become ready, counted from after_first being called."""
+        deadline = time.time() + timeout
+        reference = self.poll(timeout)
+        if after_first is not None:
+            after_first()
+        started = time.time()
+        expected = self.expected_time_to_ready()
+        interval = self.min_interval
+
+        while True:
+            modified = self.poll(deadline - time.time())
+            if modified is not None:
+                if reference is None:
+                    reference = modified
+                elif modified != reference:
+                    break
+
+            now = time.time()
+            if now >= deadline:
+                raise WaitTimeout()
+            if expected is not None and now - started >= 0.75 * expected:
+                interval = self.min_interval
+            else:
+                interval = min(interval * self.backoff, self.max_interval)
+            time.sleep(min(interval, deadline - now))
+
+        time_to_ready = time.time() - started
+        self.metrics['time_to_ready'] = time_to_ready
+        times = self.history.setdefault(self.device._device_serial, [])
+        times.append(time_to_ready)
+        del times[:-self.history_size]
+        return time_to_ready
+
+
 class ADBB2G(adb.ADBDevice):
     def __init__(self, *args, **kwargs):
 
@@ -126,7 +661,112 @@ class ADBB2G(adb.ADBDevice):
         else:
             self._wait_polling_interval = 1.0
 
+        # Honour ANDROID_SERIAL like adb itself does, so that subharnesses
+        # started for one of several attached devices talk to the right one.
+        if not args and kwargs.get("device") is None:
+            kwargs["device"] = os.environ.get("ANDROID_SERIAL")
+
+        # shell commands run over long-lived adb shells, unless disabled
+        # with persistent_shell=False or MCTS_PERSISTENT_SHELL=0
+        persistent_shell = kwargs.pop("persistent_shell",
+                                      os.environ.get("MCTS_PERSISTENT_SHELL", "1") != "0")
+        # ADBDevice runs shell commands while it is set up, before the
+        # channel exists
+        self.shell_channel = None
         adb.ADBDevice.__init__(self, *args, **kwargs)
+        if persistent_shell:
+            self.shell_channel = ShellChannel(self)
+        if self.shell_channel is not None and self._root_detection() is None:
+            self._logger.warning("mozdevice has no _have_root_shell, _have_su and "
+                                 "_have_android_su; root shell commands won't use "
+                                 "the persistent shell")
+        # metrics of each wait_for_device_ready
+        self.readiness_metrics = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+    def close(self):
+        """Close the persistent shells; later shell commands start an adb
+        process each."""
+        if self.shell_channel is not None:
+            self.shell_channel.close()
+            self.shell_channel = None
+
+    def _root_detection(self):
+        """Return how ADBDevice found it can run commands as root, which
+        commands run over the channel are wrapped by, or None if mozdevice
+        no longer keeps it where 0.46 does; root commands are then left
+        to ADBDevice.shell."""
+        have = tuple(getattr(self, name, None) for name in
+                     ('_have_root_shell', '_have_su', '_have_android_su'))
+        if None in have:
+            return None
+        return have
+
+    def _shell_command(self, cmd, env=None, cwd=None, root=False):
+        """Return cmd wrapped to run as root, in cwd and with env set, the
+        way ADBDevice.shell of mozdevice 0.46 (the version pinned in
+        requirements.txt) wraps it; this relies on the root detection
+        attributes of that version.
+
+        :raises: * ADBRootError
+                 * ShellUnavailableError if root is requested and this
+                   version of mozdevice doesn't have those attributes, so
+                   that the command is left to ADBDevice.shell
+        """
+        if root:
+            root_detection = self._root_detection()
+            if root_detection is None:
+                raise ShellUnavailableError("mozdevice doesn't detect root the way 0.46 does")
+            have_root_shell, have_su, have_android_su = root_detection
+            ld_library_path = 'LD_LIBRARY_PATH=/vendor/lib:/system/lib'
+            cmd = '%s %s' % (ld_library_path, cmd)
+            if have_root_shell:
+                pass
+            elif have_su:
+                cmd = "su -c \"%s\"" % cmd
+            elif have_android_su:
+                cmd = "su 0 \"%s\"" % cmd
+            else:
+                raise adb.ADBRootError('Can not run command %s as root!' % cmd)
+        if cwd:
+            cmd = "cd %s && %s" % (cwd, cmd)
+        if env:
+            envstr = '&& '.join(map(lambda x: 'export %s=%s' %
+                                    (x[0], x[1]), env.iteritems()))
+            cmd = envstr + "&& " + cmd
+        return cmd
+
+    def shell(self, cmd, env=None, cwd=None, timeout=None, root=False):
+        """Executes a shell command on the device, like ADBDevice.shell, but
+        over the persistent shell channel if there is one. Falls back to
+        a new adb process if the channel has no shell to send the command
+        to, e.g. because the device is rebooting. A shell that goes away
+        after the command was sent isn't retried, as the command may
+        already have run.
+
+        :returns: :class:`ShellProcess`, or :class:`mozdevice.ADBProcess`
+        :raises: * ADBRootError
+                 * ADBError if the channel's shell went away while running
+                   the command
+        """
+        if self.shell_channel is None:
+            return adb.ADBDevice.shell(self, cmd, env=env, cwd=cwd,
+                                       timeout=timeout, root=root)
+
+        if timeout is None:
+            timeout = self._timeout
+        try:
+            channel_cmd = self._shell_command(cmd, env=env, cwd=cwd, root=root)
+            return self.shell_channel.shell(channel_cmd, timeout)
+        except ShellUnavailableError as e:
+            self._logger.debug("persistent shell failed (%s), running %s with adb" % (e, cmd))
+            return adb.ADBDevice.shell(self, cmd, env=env, cwd=cwd,
+                                       timeout=timeout, root=root)
 
     def wait_for_device_ready(self, timeout=None, wait_polling_interval=None, after_first=None):
         """Wait for the device to become ready for reliable interaction via adb.
@@ -137,6 +777,9 @@ class ADBB2G(adb.ADBDevice):
         :param after_first: A function to run after first polling for device
                             readiness. This allows use cases such as stopping b2g
                             setting the unready state, and then restarting b2g.
+        :returns: The metrics of the wait: the time it took the device to
+                  become ready after after_first, and the number of polls and
+                  of reconnects of the shell watching it.
         """
 
         if timeout is None:
@@ -164,29 +807,18 @@ class ADBB2G(adb.ADBDevice):
                               (set_date.strftime('%Y%m%d.%H%M%S'),
                               prefs_file))
 
-        def prefs_modified():
-            times = [None, None]
-
-            def inner():
-                try:
-                    listing = self.shell_output("ls -l %s" % (prefs_file))
-                    mode, user, group, size, date, time, name = listing.split(None, 6)
-                    mtime = "%s %s" % (date, time)
-                except:
-                    return False
-                if times[0] is None:
-                    times[0] = mtime
-                else:
-                    times[1] = mtime
-                    if times[1] != times[0]:
-                        return True
-
-                return False
-
-            return inner
+        watcher = ReadinessWatcher(self, prefs_file, max_interval=wait_polling_interval)
+        try:
+            watcher.wait(timeout, after_first=after_first)
+        finally:
+            watcher.close()
 
-        poll_wait(prefs_modified(), timeout=timeout,
-                  polling_interval=wait_polling_interval, after_first=after_first)
+        metrics = watcher.metrics
+        self.readiness_metrics.append(metrics)
+        self._logger.info("Device ready after %.2fs (%d polls, %d reconnects)" %
+                          (metrics['time_to_ready'], metrics['polls'],
+                           metrics['reconnects']))
+        return metrics
 
     def wait_for_net(self, timeout=None, wait_polling_interval=None):
         """Wait for the device to be assigned an IP address.
@@ -254,14 +886,23 @@ class ADBB2G(adb.ADBDevice):
         if wait_polling_interval is None:
             wait_polling_interval = self._wait_polling_interval
 
+        def reboot():
+            self.command_output(["reboot"])
+            self._drop_shells()
+
         self._logger.info("Rebooting device")
-        self.wait_for_device_ready(timeout,
-                                   after_first=lambda:self.command_output(["reboot"]))
+        self.wait_for_device_ready(timeout, after_first=reboot)
 
     def root(self, timeout=None, wait_polling_interval=None):
         """run adbd as root. 
         """
         self.command_output(["root"])
+        self._drop_shells()
+
+    def _drop_shells(self):
+        # adbd restarts, taking the persistent shells with it
+        if self.shell_channel is not None:
+            self.shell_channel.drop_idle()
 
     def get_profiles(self, profile_base="/data/b2g/mozilla", timeout=None):
         """Return a list of paths to gecko profiles on the device,
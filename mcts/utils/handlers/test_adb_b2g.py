@@ -0,0 +1,443 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import stat
+import tempfile
+import unittest
+
+from mozdevice import adb
+
+from adb_b2g import (ADBB2G, DeviceBackup, ShellChannel, ShellSession,
+                     ShellUnavailableError, clear_backup_cache)
+
+# stands in for adb: ignores its arguments and runs a shell that echoes
+# its input, as the shell adb connects to does
+fake_adb = """#!/bin/sh
+exec /bin/sh -v
+"""
+
+
+class FakeDevice(object):
+    """The attributes of an ADBDevice that ShellSession uses"""
+
+    def __init__(self, adb_path):
+        self._adb_path = adb_path
+        self._adb_host = None
+        self._adb_port = None
+        self._device_serial = None
+
+
+class ShellTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.adb_path = os.path.join(self.temp_dir, "adb")
+        with open(self.adb_path, "w") as f:
+            f.write(fake_adb)
+        os.chmod(self.adb_path, stat.S_IRWXU)
+        self.device = FakeDevice(self.adb_path)
+        self.sessions = []
+
+    def tearDown(self):
+        for session in self.sessions:
+            session.close()
+        shutil.rmtree(self.temp_dir)
+
+    def session(self):
+        session = ShellSession(self.device)
+        self.sessions.append(session)
+        return session
+
+
+class TestShellSession(ShellTestCase):
+
+    def test_output(self):
+        session = self.session()
+        self.assertEquals((0, ["a", "b"]), session.run("echo a; echo b", 10))
+        self.assertEquals((0, []), session.run("true", 10))
+        self.assertEquals((0, ["c"]), session.run("echo c;", 10))
+        self.assertTrue(session.alive)
+
+    def test_no_trailing_newline(self):
+        session = self.session()
+        self.assertEquals((0, ["abc"]), session.run("printf abc", 10))
+        self.assertEquals((0, ["a", "b"]), session.run("printf 'a\\nb'", 10))
+        self.assertEquals((0, []), session.run("printf ''", 10))
+
+    def test_exit_code(self):
+        session = self.session()
+        self.assertEquals((3, ["x"]), session.run("echo x; exit 3", 10))
+        self.assertEquals((1, []), session.run("false", 10))
+        # the command ran in a subshell, so the shell is still usable
+        self.assertEquals((0, ["y"]), session.run("echo y", 10))
+        self.assertTrue(session.alive)
+
+    def test_stale_markers(self):
+        session = self.session()
+        session.run("true", 10)
+        # markers of other commands are output like any other line
+        self.assertEquals((0, ["__mcts_shell_1_start", "__mcts_shell_1_0",
+                               "x__mcts_shell_7_2"]),
+                          session.run("echo __mcts_shell_1_start; echo __mcts_shell_1_0; "
+                                      "echo x__mcts_shell_7_2", 10))
+        self.assertEquals((0, ["z"]), session.run("echo z", 10))
+
+    def test_timeout(self):
+        session = self.session()
+        self.assertRaises(adb.ADBTimeoutError, session.run, "sleep 10", 0.3)
+
+    def test_shell_dies(self):
+        session = self.session()
+        # $$ is the shell itself, not the subshell running the command
+        with self.assertRaises(adb.ADBError) as cm:
+            session.run("echo before; kill -9 $$; sleep 1", 10)
+        self.assertFalse(isinstance(cm.exception, ShellUnavailableError))
+        self.assertFalse(session.alive)
+
+    def test_shell_gone(self):
+        session = self.session()
+        session.proc.kill()
+        session.proc.wait()
+        self.assertFalse(session.alive)
+        self.assertRaises(ShellUnavailableError, session.run, "echo a", 10)
+
+
+class TestShellChannel(ShellTestCase):
+
+    def setUp(self):
+        ShellTestCase.setUp(self)
+        self.channel = ShellChannel(self.device, max_sessions=2)
+
+    def tearDown(self):
+        self.channel.close()
+        ShellTestCase.tearDown(self)
+
+    def test_shell(self):
+        for i in range(3):
+            process = self.channel.shell("echo a; echo b >&2; exit 2", 10)
+            self.assertEquals("a\nb", process.stdout)
+            self.assertEquals("", process.stderr)
+            self.assertEquals(2, process.exitcode)
+            self.assertFalse(process.timedout)
+        stats = self.channel.stats()
+        self.assertEquals(3, stats['commands'])
+        self.assertEquals(1, stats['sessions'])
+
+    def test_timeout(self):
+        process = self.channel.shell("sleep 10", 0.3)
+        self.assertTrue(process.timedout)
+        self.assertEquals(None, process.exitcode)
+        # the shell still running the command isn't reused
+        self.assertEquals([], self.channel.idle)
+        self.assertEquals(0, self.channel.open_sessions)
+        self.assertEquals("a", self.channel.shell("echo a", 10).stdout)
+        self.assertEquals(1, self.channel.stats()['timeouts'])
+        self.assertEquals(2, self.channel.stats()['sessions'])
+
+    def test_shell_dies(self):
+        self.assertRaises(adb.ADBError, self.channel.shell, "kill -9 $$", 10)
+        self.assertEquals(0, self.channel.open_sessions)
+        self.assertEquals("a", self.channel.shell("echo a", 10).stdout)
+
+    def test_dead_idle_shell(self):
+        self.channel.shell("true", 10)
+        session = self.channel.idle[0]
+        session.proc.kill()
+        session.proc.wait()
+        self.assertEquals("a", self.channel.shell("echo a", 10).stdout)
+        self.assertEquals(2, self.channel.stats()['sessions'])
+        self.assertEquals(1, self.channel.open_sessions)
+
+    def test_no_adb(self):
+        self.device._adb_path = os.path.join(self.temp_dir, "missing")
+        self.assertRaises(ShellUnavailableError, self.channel.shell, "echo a", 10)
+        self.assertEquals(0, self.channel.open_sessions)
+
+
+class TestADBB2GShell(ShellTestCase):
+
+    def setUp(self):
+        ShellTestCase.setUp(self)
+        # an ADBB2G without the adb commands ADBDevice.__init__ runs
+        self.adb = ADBB2G.__new__(ADBB2G)
+        self.adb._adb_path = self.adb_path
+        self.adb._adb_host = None
+        self.adb._adb_port = None
+        self.adb._device_serial = None
+        self.adb._timeout = 10
+        self.adb._logger = logging.getLogger("test_adb_b2g")
+        self.adb._have_root_shell = False
+        self.adb._have_su = True
+        self.adb._have_android_su = False
+        self.adb.shell_channel = ShellChannel(self.adb)
+
+        # commands that fall back to an adb process of their own
+        self.fallbacks = []
+        self.adb_shell = adb.ADBDevice.shell
+
+        def fallback_shell(device, cmd, env=None, cwd=None, timeout=None, root=False):
+            self.fallbacks.append((cmd, root))
+        adb.ADBDevice.shell = fallback_shell
+
+    def tearDown(self):
+        adb.ADBDevice.shell = self.adb_shell
+        self.adb.close()
+        ShellTestCase.tearDown(self)
+
+    def test_shell(self):
+        process = self.adb.shell("echo $A; pwd", env={"A": "1"}, cwd="/")
+        self.assertEquals("1\n/", process.stdout)
+        self.assertEquals([], self.fallbacks)
+
+    def test_shell_command(self):
+        self.assertEquals('su -c "LD_LIBRARY_PATH=/vendor/lib:/system/lib id"',
+                          self.adb._shell_command("id", root=True))
+        self.adb._have_su = False
+        self.assertRaises(adb.ADBRootError, self.adb._shell_command, "id", root=True)
+        self.adb._have_android_su = True
+        self.assertEquals('su 0 "LD_LIBRARY_PATH=/vendor/lib:/system/lib id"',
+                          self.adb._shell_command("id", root=True))
+
+    def test_unavailable(self):
+        self.adb._adb_path = os.path.join(self.temp_dir, "missing")
+        self.adb.shell("echo a")
+        self.assertEquals([("echo a", False)], self.fallbacks)
+
+    def test_shell_dies(self):
+        # the command may have run, so it isn't run again
+        self.assertRaises(adb.ADBError, self.adb.shell, "kill -9 $$")
+        self.assertEquals([], self.fallbacks)
+
+    def test_no_root_detection(self):
+        del self.adb._have_su
+        self.adb.shell("id", root=True)
+        self.assertEquals([("id", True)], self.fallbacks)
+        self.assertEquals("a", self.adb.shell("echo a").stdout)
+
+    def test_disabled(self):
+        self.adb.close()
+        self.adb.shell("echo a")
+        self.assertEquals([("echo a", False)], self.fallbacks)
+
+class FileDevice(object):
+    """A device whose filesystem is a local directory, with the commands
+    DeviceBackup uses, counting the transfers and deletions"""
+
+    _scan = re.compile(r"^find (\S+) -type d && find (\S+) -type f -exec md5sum \{\} \+$")
+
+    def __init__(self, root, md5sum=True):
+        self.root = root
+        self.md5sum = md5sum
+        self._device_serial = "0123"
+        self._logger = logging.getLogger("test_adb_b2g")
+        self.pulls = []
+        self.pushes = []
+        self.removed = []
+        self.closed = False
+
+    def path(self, remote):
+        return os.path.join(self.root, remote.lstrip("/"))
+
+    def shell_output(self, cmd):
+        m = self._scan.match(cmd)
+        if m is None or not self.md5sum:
+            raise adb.ADBError("%s failed" % cmd)
+        lines = []
+        for dirpath, dirnames, filenames in os.walk(self.path(m.group(1))):
+            lines.append("/" + os.path.relpath(dirpath, self.root))
+        for dirpath, dirnames, filenames in os.walk(self.path(m.group(2))):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                with open(path) as f:
+                    digest = hashlib.md5(f.read()).hexdigest()
+                lines.append("%s  /%s" % (digest, os.path.relpath(path, self.root)))
+        return "\n".join(lines)
+
+    def pull(self, remote, local):
+        self.pulls.append(remote)
+        copy(self.path(remote), local)
+
+    def push(self, local, remote):
+        self.pushes.append(remote)
+        copy(local, self.path(remote))
+
+    def rm(self, path, recursive=False, force=False):
+        self.removed.append(path)
+        path = self.path(path)
+        if os.path.isdir(path) and recursive:
+            shutil.rmtree(path)
+        elif os.path.isfile(path):
+            os.unlink(path)
+        elif not force:
+            raise adb.ADBError("rm %s failed" % path)
+
+    def mkdir(self, path, parents=False):
+        os.makedirs(self.path(path))
+
+    def remount(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def copy(src, dest):
+    """Copy src to dest, or the contents of the directory src into dest,
+    like adb push and pull"""
+    if os.path.isdir(src):
+        if not os.path.exists(dest):
+            os.makedirs(dest)
+        for name in os.listdir(src):
+            copy(os.path.join(src, name), os.path.join(dest, name))
+    else:
+        if not os.path.exists(os.path.dirname(dest)):
+            os.makedirs(os.path.dirname(dest))
+        shutil.copy(src, dest)
+
+
+def tree(root):
+    """The directories and file contents below root"""
+    rv = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        rv[os.path.relpath(dirpath, root)] = None
+        for name in filenames:
+            with open(os.path.join(dirpath, name)) as f:
+                rv[os.path.relpath(os.path.join(dirpath, name), root)] = f.read()
+    return rv
+
+
+class TestDeviceBackup(unittest.TestCase):
+
+    files = {"data/local/a.txt": "a",
+             "data/local/dir/b.txt": "b",
+             "data/local/empty/": None,
+             "data/local/gone/c.txt": "c",
+             "data/b2g/mozilla/profile/prefs.js": "prefs",
+             "data/b2g/mozilla/profile/cookies.sqlite": "cookies",
+             "system/etc/hosts": "127.0.0.1 localhost"}
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.device_root = os.path.join(self.temp_dir, "device")
+        self.cache_root = os.path.join(self.temp_dir, "cache")
+        for path, data in self.files.iteritems():
+            self.write(path, data)
+        self.original = tree(self.device_root)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, path, data):
+        path = os.path.join(self.device_root, path)
+        dirname = path if data is None else os.path.dirname(path)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        if data is not None:
+            with open(path, "w") as f:
+                f.write(data)
+
+    def remove(self, path):
+        path = os.path.join(self.device_root, path)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.unlink(path)
+
+    def backup(self, **kwargs):
+        self.device = FileDevice(self.device_root, **kwargs)
+        return DeviceBackup(device=self.device, cache_root=self.cache_root)
+
+    def change_device(self):
+        self.write("data/local/a.txt", "changed")
+        self.write("data/local/added.txt", "added")
+        self.write("data/local/new/dir/d.txt", "d")
+        self.write("data/local/new/empty/", None)
+        self.write("data/b2g/mozilla/profile/sessionstore.js", "session")
+        self.remove("data/local/dir/b.txt")
+        self.remove("data/local/empty")
+        self.remove("data/local/gone")
+        self.write("system/etc/hosts", "changed")
+
+    def test_backup_restore(self):
+        with self.backup() as backup:
+            # the first backup pulls whole directories
+            self.assertEquals(["/data/local", "/data/b2g/mozilla", "/system/etc/hosts"],
+                              self.device.pulls)
+            self.assertEquals(0700, os.stat(self.cache_root).st_mode & 0777)
+            self.change_device()
+            backup.restore()
+        self.assertEquals(self.original, tree(self.device_root))
+        self.assertTrue(self.device.closed)
+        # only what changed is transferred back
+        self.assertEquals(sorted(["/system/etc/hosts", "/data/local/a.txt",
+                                  "/data/local/dir/b.txt", "/data/local/gone/c.txt"]),
+                          sorted(self.device.pushes))
+        self.assertFalse("/data/local" in self.device.removed)
+        self.assertTrue("/data/local/new" in self.device.removed)
+        self.assertFalse("/data/local/new/dir/d.txt" in self.device.removed)
+
+    def test_incremental_backup(self):
+        with self.backup():
+            pass
+        self.write("data/local/a.txt", "changed")
+        self.remove("data/b2g/mozilla/profile/cookies.sqlite")
+        self.original = tree(self.device_root)
+
+        with self.backup() as backup:
+            self.assertEquals(["/data/local/a.txt", "/system/etc/hosts"], self.device.pulls)
+            self.assertFalse(os.path.exists(backup.local_dir(
+                "/data/b2g/mozilla/profile/cookies.sqlite")))
+            self.change_device()
+            backup.restore()
+        self.assertEquals(self.original, tree(self.device_root))
+
+    def test_old_cache(self):
+        with self.backup() as backup:
+            pass
+        # caches without the directories are pulled again
+        with open(backup.manifest_path, "w") as f:
+            f.write('{"/data/local": {"/data/local/a.txt": "0cc175b9c0f1b6a831c399e269772661"}}')
+        with self.backup():
+            self.assertEquals(["/data/local", "/data/b2g/mozilla", "/system/etc/hosts"],
+                              self.device.pulls)
+
+    def test_many_changes(self):
+        with self.backup() as backup:
+            backup.max_file_transfers = 2
+            self.change_device()
+            backup.restore()
+        self.assertEquals(self.original, tree(self.device_root))
+        self.assertTrue("/data/local" in self.device.removed)
+        self.assertTrue("/data/local" in self.device.pushes)
+        self.assertFalse("/data/b2g/mozilla" in self.device.removed)
+
+    def test_no_md5sum(self):
+        with self.backup(md5sum=False) as backup:
+            self.change_device()
+            backup.restore()
+        self.assertEquals(self.original, tree(self.device_root))
+        self.assertEquals(["/system/etc/hosts", "/data/local", "/data/b2g/mozilla"],
+                          self.device.pushes)
+
+    def test_clear_backup_cache(self):
+        with self.backup() as backup:
+            pass
+        self.assertTrue(os.path.exists(backup.manifest_path))
+        self.assertTrue(clear_backup_cache(self.cache_root))
+        self.assertFalse(os.path.exists(self.cache_root))
+        self.assertFalse(clear_backup_cache(self.cache_root))
+
+    def test_outermost_innermost(self):
+        dirs = ["/a", "/a-x", "/a/b", "/a/b/c", "/a-x/d", "/e/f"]
+        self.assertEquals(["/a", "/a-x", "/e/f"], DeviceBackup.outermost(dirs))
+        self.assertEquals(["/a-x/d", "/a/b/c", "/e/f"], DeviceBackup.innermost(dirs))
+        self.assertEquals([], DeviceBackup.outermost([]))
+
+if __name__ == '__main__':
+    unittest.main()
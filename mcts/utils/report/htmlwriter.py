@@ -0,0 +1,154 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import base64
+import cgi
+from contextlib import contextmanager
+
+# a multiple of 3, so the base64 of consecutive chunks can be concatenated
+DATA_CHUNK_SIZE = 3 * 16 * 1024
+
+
+def escape(value):
+    if not isinstance(value, basestring):
+        value = unicode(value)
+    return cgi.escape(value, quote=True)
+
+
+class raw(object):
+    """Content that HTMLWriter writes without escaping it, like py.xml's raw."""
+    def __init__(self, content):
+        self.content = content
+
+
+class HTMLWriter(object):
+    """Writes an HTML document to a file object while it is generated,
+    instead of building it as a py.xml tree and serializing that.
+
+    Attribute names follow the py.xml convention, so class_='x' and
+    id_='y' are written as class="x" and id="y".
+    """
+
+    def __init__(self, f, indent=2):
+        self.f = f
+        self.indent = indent
+        self.depth = 0
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        self.f.write(data)
+
+    def attrs(self, attrs):
+        for name, value in sorted(attrs.iteritems()):
+            if value is not None:
+                self.write(' %s="' % name.rstrip('_'))
+                self.write(escape(value))
+                self.write('"')
+
+    def newline(self):
+        if self.indent:
+            self.write('\n' + ' ' * (self.indent * self.depth))
+
+    def doctype(self):
+        self.write('<!DOCTYPE html>')
+
+    def start(self, tag, **attrs):
+        self.newline()
+        self.write('<%s' % tag)
+        self.attrs(attrs)
+        self.write('>')
+        self.depth += 1
+
+    def end(self, tag):
+        self.depth -= 1
+        self.newline()
+        self.write('</%s>' % tag)
+
+    @contextmanager
+    def element(self, tag, **attrs):
+        self.start(tag, **attrs)
+        yield self
+        self.end(tag)
+
+    def leaf(self, tag, content=u'', **attrs):
+        """Write an element with the given text, or raw, content on a line
+        of its own."""
+        self.newline()
+        self.inline(tag, content, **attrs)
+
+    def inline(self, tag, content=u'', **attrs):
+        """Write an element with the given text, or raw, content at the
+        current position, e.g. within a pre."""
+        self.write('<%s' % tag)
+        self.attrs(attrs)
+        self.write('>')
+        self.content(content)
+        self.write('</%s>' % tag)
+
+    def empty(self, tag, **attrs):
+        self.newline()
+        self.write('<%s' % tag)
+        self.attrs(attrs)
+        self.write('/>')
+
+    def content(self, content):
+        if isinstance(content, raw):
+            self.write(content.content)
+        else:
+            self.write(escape(content))
+
+    def data_link(self, text, f, mimetype='text/plain', **attrs):
+        """Write a link to a data: URI holding the contents of the file
+        object f, base64 encoded a chunk at a time."""
+        self.newline()
+        self.write('<a href="data:%s;charset=utf-8;base64,' % mimetype)
+        while True:
+            chunk = f.read(DATA_CHUNK_SIZE)
+            if not chunk:
+                break
+            self.write(base64.b64encode(chunk))
+        self.write('"')
+        self.attrs(attrs)
+        self.write('>')
+        self.content(text)
+        self.write('</a>')
+
+
+def write_log_line(w, line):
+    if line.startswith(' ' * 10):  # separator
+        w.content(line[:80])
+    elif line.lower().find("error") != -1 or line.lower().find("exception") != -1:
+        w.inline('span', line, class_='error')
+    else:
+        w.content(line)
+
+
+def write_log(w, message):
+    """Write a log message in a div.log, highlighting its lines that
+    mention errors."""
+    with w.element('div', class_='log'):
+        for line in message.splitlines():
+            w.newline()
+            write_log_line(w, line)
+            w.write('<br/>')
+
+
+def write_pre_log(w, message):
+    """Like write_log, but as a pre, in which the writer mustn't indent."""
+    w.newline()
+    w.write('<pre>')
+    for line in message.splitlines():
+        write_log_line(w, line)
+        w.write('\n')
+    w.write('</pre>')
+
+
+def write_errors_table(w, errors):
+    with w.element('table', id_='errors'):
+        for error in errors:
+            with w.element('tr'):
+                w.leaf('td', error["level"], class_="log_%s" % error["level"])
+                with w.element('td', class_='log'):
+                    write_log(w, error.get("message", ""))
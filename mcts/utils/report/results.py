@@ -2,6 +2,10 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import json
+import os
+import sqlite3
+import tempfile
 from collections import defaultdict
 
 from mozlog.structured import reader
@@ -11,6 +15,28 @@ result_status = dict((v,k) for k,v in
                      enumerate(["PASS", "FAIL", "OK", "SKIP", "ERROR", "TIMEOUT", "CRASH"]))
 
 KEY_MAIN = 'MAIN'
+# statuses of the results kept in memory, for retrying them
+failing_statuses = ('FAIL', 'ERROR', 'TIMEOUT', 'CRASH')
+# field of a result's extra data holding a link to show in the reports,
+# as {'text': ..., 'href': ..., 'target': ...}; target is optional
+KEY_LINK = 'link'
+
+def link_extra(text, href, target='_blank'):
+    """Return extra data for a test_status or test_end message, that makes
+    the subsuite report show a link instead of the message."""
+    link = {'text': text, 'href': href}
+    if target is not None:
+        link['target'] = target
+    return {KEY_LINK: link}
+
+def get_link(data):
+    extra = data.get('extra')
+    if not extra:
+        return None
+    link = extra.get(KEY_LINK)
+    if not isinstance(link, dict) or 'text' not in link or 'href' not in link:
+        return None
+    return link
 
 def is_skip(data):
     return data['status'] == 'SKIP'
@@ -40,7 +66,7 @@ class LogHandler(reader.LogHandler):
         if data["status"] == 'FAIL':
             self.results.fails = self.results.fails + 1
 
-        self.results.regressions[test_id][data["subtest"]] = data
+        self.results.add(test_id, data["subtest"], data)
 
     def test_end(self, data):
         test_id = self.test_id(data)
@@ -48,27 +74,102 @@ class LogHandler(reader.LogHandler):
         if data["status"] == 'FAIL':
             self.results.fails = self.results.fails + 1
 
-        self.results.regressions[test_id][KEY_MAIN] = data
+        self.results.add(test_id, KEY_MAIN, data)
 
     def log(self, data):
         if data["level"] in ("ERROR", "CRITICAL"):
             self.results.errors.append(data)
 
+class ResultStore(object):
+    """The results of a subsuite's tests, kept in a temporary SQLite
+    database rather than in memory, so that the memory a subsuite needs
+    doesn't grow with its number of tests. The database is only created
+    once a result is added, and deleted by close."""
+
+    def __init__(self):
+        self.path = None
+        self.conn = None
+
+    def _connect(self):
+        fd, self.path = tempfile.mkstemp(prefix='mcts_results_', suffix='.sqlite')
+        os.close(fd)
+        # results are added by the thread reading the subsuite's output, and
+        # read once it has finished
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.execute("CREATE TABLE results (test TEXT, subtest TEXT, data TEXT, "
+                          "PRIMARY KEY (test, subtest))")
+
+    def add(self, test_id, subtest, data):
+        if self.conn is None:
+            self._connect()
+        self.conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                          (json.dumps(test_id), subtest, json.dumps(data)))
+
+    def count(self):
+        """Return the number of results."""
+        if self.conn is None:
+            return 0
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def iteritems(self):
+        """Iterate over (test id, {subtest: data}) a test at a time, in
+        order of test id."""
+        if self.conn is None:
+            return
+        test, test_data = None, None
+        for key, subtest, data in self.conn.execute(
+                "SELECT test, subtest, data FROM results ORDER BY test, subtest"):
+            if key != test:
+                if test is not None:
+                    yield self._test_id(test), test_data
+                test, test_data = key, {}
+            test_data[subtest] = json.loads(data)
+        if test is not None:
+            yield self._test_id(test), test_data
+
+    def _test_id(self, key):
+        test_id = json.loads(key)
+        return tuple(test_id) if isinstance(test_id, list) else test_id
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+            os.unlink(self.path)
+
+
 class Results(object):
     def __init__(self):
         self.name = None
-        self.regressions = defaultdict(dict)
+        # every result, for the subsuite report
+        self.regressions = ResultStore()
+        # the results with a failing status, by test id and subtest
+        self.failures = defaultdict(dict)
         self.errors = []
         self.map = {}
         self.fails = 0
 
+    def add(self, test_id, subtest, data):
+        self.regressions.add(test_id, subtest, data)
+        if data["status"] in failing_statuses:
+            self.failures[test_id][subtest] = data
+        elif test_id in self.failures:
+            self.failures[test_id].pop(subtest, None)
+            if not self.failures[test_id]:
+                del self.failures[test_id]
+
+    def close(self):
+        """Delete the results kept on disk."""
+        self.regressions.close()
+
     @property
     def is_pass(self):
         return not (self.has_regressions or self.has_errors)
 
     @property
     def has_regressions(self):
-        return len(self.regressions) > 0
+        return self.regressions.count() > 0
 
     @property
     def has_fails(self):
@@ -79,10 +180,33 @@ class Results(object):
         return len(self.errors) > 0
 
     def has(self, key):
-        return key in self.map.keys()
+        return key in self.map
 
     def set(self, key, value):
         self.map[key] = value
 
     def get(self, key):
         return self.map[key] if self.has(key) else None
+
+
+class ResultsSummary(object):
+    """The counts of a subsuite's Results that the summary report shows,
+    kept for the rest of the run instead of the Results themselves."""
+
+    def __init__(self, results):
+        self.name = results.name
+        self.num_errors = len(results.errors)
+        self.num_regressions = results.regressions.count()
+        self.fails = results.fails
+
+    @property
+    def has_regressions(self):
+        return self.num_regressions > 0
+
+    @property
+    def has_fails(self):
+        return self.fails > 0
+
+    @property
+    def has_errors(self):
+        return self.num_errors > 0
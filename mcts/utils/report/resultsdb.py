@@ -0,0 +1,350 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Index of the result zips of past runs, in an SQLite database.
+
+Each result zip is ingested once: the structured log of every subsuite in
+it is read into a row per test and subtest, along with the device it ran
+on and that device's build properties, as reported by the cert suite.
+Builds can then be compared without unpacking and parsing the zips again.
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+import zipfile
+from collections import namedtuple
+from datetime import datetime
+
+from mozlog.structured import reader
+
+from results import KEY_MAIN
+
+DEFAULT_PATH = 'certsuite-results.sqlite'
+
+_schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    time TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS devices (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    serial TEXT NOT NULL,
+    build TEXT
+);
+CREATE INDEX IF NOT EXISTS devices_build ON devices(build);
+CREATE INDEX IF NOT EXISTS devices_run ON devices(run_id);
+CREATE TABLE IF NOT EXISTS build_props (
+    device_id INTEGER NOT NULL REFERENCES devices(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS build_props_value ON build_props(value, name);
+CREATE INDEX IF NOT EXISTS build_props_device ON build_props(device_id);
+CREATE TABLE IF NOT EXISTS results (
+    device_id INTEGER NOT NULL REFERENCES devices(id) ON DELETE CASCADE,
+    suite TEXT NOT NULL,
+    test TEXT NOT NULL,
+    subtest TEXT NOT NULL,
+    status TEXT NOT NULL,
+    expected TEXT,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS results_device ON results(device_id, suite, test, subtest);
+CREATE INDEX IF NOT EXISTS results_test ON results(suite, test, subtest);
+"""
+
+# build properties that identify a build, most specific first
+BUILD_KEYS = ['ro.build.fingerprint', 'ro.build.display.id', 'ro.build.version.incremental']
+
+GOOD_STATUSES = ('PASS', 'OK')
+BAD_STATUSES = ('FAIL', 'ERROR', 'TIMEOUT', 'CRASH')
+
+_zip_time = re.compile(r'_(\d{14})\.zip$')
+_structured_log = re.compile(r'^(.+)_structured(_.*)?\.log$')
+
+Result = namedtuple('Result', ['suite', 'test', 'subtest', 'status', 'expected', 'message'])
+Change = namedtuple('Change', ['suite', 'test', 'subtest', 'old_status', 'new_status', 'message'])
+HistoryEntry = namedtuple('HistoryEntry', ['time', 'serial', 'build', 'subtest', 'status', 'message'])
+
+
+def test_string(test_id):
+    if isinstance(test_id, basestring):
+        return test_id
+    else:
+        return " ".join(test_id)
+
+
+class ResultRowHandler(reader.LogHandler):
+    """Collects a Result for each test_status and test_end message of a
+    structured log; a test_end is recorded with KEY_MAIN as its subtest,
+    like in Results."""
+
+    def __init__(self, suite):
+        self.suite = suite
+        self.rows = []
+
+    def add(self, data, subtest):
+        self.rows.append(Result(self.suite, test_string(data["test"]), subtest,
+                                data["status"], data.get("expected"),
+                                data.get("message")))
+
+    def test_status(self, data):
+        self.add(data, data["subtest"])
+
+    def test_end(self, data):
+        self.add(data, KEY_MAIN)
+
+
+def split_entry(name):
+    """Split the name of a structured log in a result zip into the serial
+    of the device it ran on, or '' for single device runs, the directory
+    of its subsuite and the suite. Returns None for other entries."""
+    parts = name.split('/')
+    if len(parts) not in (2, 3):
+        return None
+    m = _structured_log.match(parts[-1])
+    if m is None:
+        return None
+    serial = parts[0] if len(parts) == 3 else ''
+    return serial, '/'.join(parts[:-1]), m.group(1)
+
+
+def get_build(buildprops):
+    for key in BUILD_KEYS:
+        if buildprops.get(key):
+            return buildprops[key]
+    return None
+
+
+class ResultsDB(object):
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(_schema)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+    def ingest(self, zip_path):
+        """Add the results in the result zip at zip_path, unless it was
+        already ingested and hasn't changed since. Returns whether the zip
+        was read."""
+        zip_path = os.path.abspath(zip_path)
+        stat = os.stat(zip_path)
+        row = self.conn.execute("SELECT id, size, mtime FROM runs WHERE path = ?",
+                                (zip_path,)).fetchone()
+        if row is not None and (row[1], row[2]) == (stat.st_size, stat.st_mtime):
+            return False
+
+        m = _zip_time.search(zip_path)
+        if m:
+            run_time = datetime.strptime(m.group(1), "%Y%m%d%H%M%S")
+        else:
+            run_time = datetime.fromtimestamp(stat.st_mtime)
+
+        with zipfile.ZipFile(zip_path) as zip_file, self.conn:
+            if row is not None:
+                self.conn.execute("DELETE FROM runs WHERE id = ?", (row[0],))
+            cursor = self.conn.execute(
+                "INSERT INTO runs (path, size, mtime, time) VALUES (?, ?, ?, ?)",
+                (zip_path, stat.st_size, stat.st_mtime,
+                 run_time.strftime("%Y-%m-%d %H:%M:%S")))
+            run_id = cursor.lastrowid
+
+            names = zip_file.namelist()
+            logs = {}
+            buildprops = {}
+            for name in names:
+                entry = split_entry(name)
+                if entry is not None:
+                    logs.setdefault(entry[0], []).append((name, entry[2]))
+            for serial in logs:
+                prefix = serial + '/' if serial else ''
+                for name in names:
+                    if (name.startswith(prefix) and name.endswith('/cert_results.json') and
+                        name.count('/') == prefix.count('/') + 1):
+                        with zip_file.open(name) as f:
+                            try:
+                                buildprops[serial] = json.load(f).get('buildprops', {})
+                            except ValueError:
+                                pass
+                        break
+
+            for serial, serial_logs in sorted(logs.iteritems()):
+                props = buildprops.get(serial, {})
+                cursor = self.conn.execute(
+                    "INSERT INTO devices (run_id, serial, build) VALUES (?, ?, ?)",
+                    (run_id, serial, get_build(props)))
+                device_id = cursor.lastrowid
+                self.conn.executemany(
+                    "INSERT INTO build_props (device_id, name, value) VALUES (?, ?, ?)",
+                    ((device_id, k, v) for k, v in props.iteritems()))
+                for name, suite in serial_logs:
+                    handler = ResultRowHandler(suite)
+                    with zip_file.open(name) as f:
+                        reader.handle_log(reader.read(f), handler)
+                    self.conn.executemany(
+                        "INSERT INTO results (device_id, suite, test, subtest, status, expected, message) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        ((device_id,) + tuple(r) for r in handler.rows))
+        return True
+
+    def builds(self):
+        """Return (build, number of runs, time of the last run) tuples,
+        most recent first."""
+        return self.conn.execute(
+            "SELECT devices.build, COUNT(DISTINCT runs.id), MAX(runs.time) "
+            "FROM devices JOIN runs ON runs.id = devices.run_id "
+            "WHERE devices.build IS NOT NULL "
+            "GROUP BY devices.build ORDER BY MAX(runs.time) DESC").fetchall()
+
+    def latest_results(self, build):
+        """Return the most recent result of each test and subtest run on
+        build, keyed by (suite, test, subtest). build is either the build
+        identifier of a device, or the value of one of its build
+        properties."""
+        # SQLite takes the bare columns from the row holding MAX(time)
+        rows = self.conn.execute(
+            "SELECT results.suite, results.test, results.subtest, results.status, "
+            "results.expected, results.message, MAX(runs.time) "
+            "FROM results "
+            "JOIN devices ON devices.id = results.device_id "
+            "JOIN runs ON runs.id = devices.run_id "
+            "WHERE results.device_id IN ("
+            "  SELECT id FROM devices WHERE build = ? "
+            "  UNION SELECT device_id FROM build_props WHERE value = ?) "
+            "GROUP BY results.suite, results.test, results.subtest",
+            (build, build))
+        return dict(((row[0], row[1], row[2]), Result(*row[:6])) for row in rows)
+
+    def compare(self, old_build, new_build):
+        """Return the Changes of the tests and subtests that passed on
+        old_build and fail on new_build, and of those that did the
+        opposite, as a (regressions, fixes) tuple."""
+        old = self.latest_results(old_build)
+        new = self.latest_results(new_build)
+        regressions = []
+        fixes = []
+        for key in sorted(new.viewkeys() & old.viewkeys()):
+            old_status = old[key].status
+            new_status = new[key].status
+            if old_status in GOOD_STATUSES and new_status in BAD_STATUSES:
+                regressions.append(Change(*(key + (old_status, new_status, new[key].message))))
+            elif old_status in BAD_STATUSES and new_status in GOOD_STATUSES:
+                fixes.append(Change(*(key + (old_status, new_status, new[key].message))))
+        return regressions, fixes
+
+    def regressions(self, old_build, new_build):
+        return self.compare(old_build, new_build)[0]
+
+    def history(self, suite, test, subtest=None):
+        """Return the HistoryEntries of a test across all runs, oldest
+        first."""
+        query = ("SELECT runs.time, devices.serial, devices.build, results.subtest, "
+                 "results.status, results.message "
+                 "FROM results "
+                 "JOIN devices ON devices.id = results.device_id "
+                 "JOIN runs ON runs.id = devices.run_id "
+                 "WHERE results.suite = ? AND results.test = ?")
+        args = [suite, test]
+        if subtest is not None:
+            query += " AND results.subtest = ?"
+            args.append(subtest)
+        query += " ORDER BY runs.time, results.subtest"
+        return [HistoryEntry(*row) for row in self.conn.execute(query, args)]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Index and query the results of past certification runs")
+    parser.add_argument("--db", default=DEFAULT_PATH,
+                        help="Path of the results database (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest="command")
+
+    ingest = subparsers.add_parser("ingest", help="Add result zips to the database")
+    ingest.add_argument("paths", nargs="+", metavar="PATH",
+                        help="Result zips, or directories to search for them")
+
+    subparsers.add_parser("builds", help="List the builds in the database")
+
+    regressions = subparsers.add_parser("regressions",
+                                        help="List the subtests that regressed between two builds")
+    regressions.add_argument("old_build", help="Build, or build property value, to compare against")
+    regressions.add_argument("new_build", help="Build, or build property value, to compare")
+    regressions.add_argument("--fixes", action="store_true",
+                             help="Also list the subtests that were fixed")
+
+    history = subparsers.add_parser("history", help="Show the results of a test across runs")
+    history.add_argument("suite")
+    history.add_argument("test")
+    history.add_argument("subtest", nargs="?")
+    return parser
+
+
+def iter_zips(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    if filename.endswith('.zip'):
+                        yield os.path.join(dirpath, filename)
+        else:
+            yield path
+
+
+def print_changes(title, changes):
+    print "%s (%d):" % (title, len(changes))
+    for change in changes:
+        print "  %s %s %s: %s -> %s" % (change.suite, change.test, change.subtest,
+                                        change.old_status, change.new_status)
+
+
+def main():
+    args = get_parser().parse_args()
+
+    with ResultsDB(args.db) as db:
+        if args.command == "ingest":
+            for path in iter_zips(args.paths):
+                start = time.time()
+                try:
+                    read = db.ingest(path)
+                except (zipfile.BadZipfile, IOError, OSError) as e:
+                    print >> sys.stderr, "Failed to ingest %s: %s" % (path, e)
+                    continue
+                if read:
+                    print "Ingested %s in %.2fs" % (path, time.time() - start)
+                else:
+                    print "Skipped %s, already ingested" % path
+        elif args.command == "builds":
+            for build, runs, last_run in db.builds():
+                print "%s\t%d run(s)\tlast run %s" % (build, runs, last_run)
+        elif args.command == "regressions":
+            regressions, fixes = db.compare(args.old_build, args.new_build)
+            print_changes("Regressions", regressions)
+            if args.fixes:
+                print_changes("Fixes", fixes)
+        elif args.command == "history":
+            for entry in db.history(args.suite, args.test, args.subtest):
+                print "%s\t%s\t%s\t%s\t%s" % (entry.time, entry.serial or '-', entry.build,
+                                              entry.subtest, entry.status)
+
+
+if __name__ == '__main__':
+    main()
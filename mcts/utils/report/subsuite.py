@@ -3,112 +3,67 @@
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import os
-import base64
 import marionette.runner.mixins
 import sys
 import json
-import cgi
-import pickle
+from cStringIO import StringIO
 
-from py.xml import html, raw
-from results import KEY_MAIN
+from htmlwriter import HTMLWriter, raw, write_errors_table, write_pre_log
+from results import KEY_MAIN, get_link
 
 here = os.path.split(__file__)[0]
 rcname = marionette.runner.mixins.__name__
 
 
 class HTMLBuilder(object):
-    def make_report(self, results):
+    """Writes the report of a subsuite with an HTMLWriter, a regression
+    row at a time."""
+
+    def write_report(self, f, results):
         self.results = results
-        return html.html(
-            self.make_head(),
-            self.make_body()
-        )
-
-    def make_head(self):
-        with open(os.path.join(here, "report.css")) as f:
-            style = html.style(raw(f.read()))
-
-        return html.head(
-            html.meta(charset="utf-8"),
-            html.title("FirefoxOS Certification Suite Report: %s" % self.results.name),
-            style
-        )
-
-    def make_body(self):
-        body_parts = [
-            html.h1("FirefoxOS Certification Suite Report: %s"
-                % self.results.name),
-            ]
-
-        if self.results.has_errors:
-            body_parts.append(html.h2("Errors During Run"))
-            body_parts.append(self.make_errors_table(self.results.errors))
-        if self.results.has_regressions:
-            body_parts.append(html.h2("Test Regressions"))
-            body_parts.append(self.make_regression_table())
-        #if self.results.has('files'):
-        #    body_parts.append(html.h2("Details information"))
-        #    details = []
-        #    files = self.results.get('files')
-        #    for key in files.keys():
-        #        href = '#'
-        #        if key[-4:] == 'html' or key[-3:] == 'htm':
-        #            href = 'data:text/html;charset=utf-8;base64,%s' % base64.b64encode(files[key])
-        #        else:
-        #            href = 'data:text/plain;charset=utf-8;base64,%s' % base64.b64encode(files[key])
-        #        details.append(html.li(html.a(key, href=href, target='_blank')))
-        #    body_parts.append(html.ul(details))
-
-        return html.body(body_parts)
-
-    def make_errors_table(self, errors):
-        rows = []
-        for error in errors:
-            error_message = error.get("message", "")
-            log = html.div(class_='log')
-            for line in error_message.splitlines():
-                separator = line.startswith(' ' * 10)
-                if separator:
-                    log.append(line[:80])
-                else:
-                    if line.lower().find("error") != -1 or line.lower().find("exception") != -1:
-                        log.append(html.span(raw(cgi.escape(line)), class_='error'))
-                    else:
-                        log.append(raw(cgi.escape(line)))
-                log.append(html.br())
-            rows.append(html.tr(
-                html.td(error["level"],
-                        class_="log_%s" % error["level"]),
-                html.td(log, class_='log')
-            ))
-        return html.table(rows, id_="errors")
-
-    def make_regression_table(self):
-        return html.table(
-            html.thead(
-                html.tr(
-                    html.th("Parent Test", col='parent'),
-                    html.th("Subtest", col='subtest'),
-                    html.th("Expected", col='expected'),
-                    html.th("Result", col='result'),
-                ), id='results-table-head'
-            ),
-            html.tbody(*self.make_table_rows(), id='results-table-body'),
-            id='results-table'
-        )
-
-    def make_table_rows(self):
-        regressions = self.results.regressions
-
-        rv = []
-        tests = sorted(regressions.keys())
-        for i, test in enumerate(tests):
+
+        w = HTMLWriter(f)
+        w.doctype()
+        with w.element('html'):
+            self.write_head(w)
+            self.write_body(w)
+
+    def write_head(self, w):
+        with w.element('head'):
+            w.empty('meta', charset="utf-8")
+            w.leaf('title', "FirefoxOS Certification Suite Report: %s" % self.results.name)
+            with open(os.path.join(here, "report.css")) as f:
+                w.leaf('style', raw(f.read()))
+
+    def write_body(self, w):
+        with w.element('body'):
+            w.leaf('h1', "FirefoxOS Certification Suite Report: %s"
+                % self.results.name)
+
+            if self.results.has_errors:
+                w.leaf('h2', "Errors During Run")
+                write_errors_table(w, self.results.errors)
+            if self.results.has_regressions:
+                w.leaf('h2', "Test Regressions")
+                self.write_regression_table(w)
+
+    def write_regression_table(self, w):
+        with w.element('table', id='results-table'):
+            with w.element('thead', id='results-table-head'):
+                with w.element('tr'):
+                    w.leaf('th', "Parent Test", col='parent')
+                    w.leaf('th', "Subtest", col='subtest')
+                    w.leaf('th', "Expected", col='expected')
+                    w.leaf('th', "Result", col='result')
+            with w.element('tbody', id='results-table-body'):
+                self.write_table_rows(w)
+
+    def write_table_rows(self, w):
+        # the results are read back from disk a test at a time
+        for i, (test, test_data) in enumerate(self.results.regressions.iteritems()):
             odd_or_even = "even" if i % 2 else "odd"
-            test_data = regressions[test]
             test_name = self.get_test_name(test, test_data)
             for subtest in sorted(test_data.keys()):
-                cells = []
                 sub_name = self.get_sub_name(test, test_data, subtest)
 
                 subtest_data = test_data[subtest]
@@ -116,51 +71,35 @@ class HTMLBuilder(object):
                 class_expected = self.get_class_expected(subtest_data)
                 cell_message = subtest_data.get("message", "")
                 cell_status = subtest_data["status"]
+                link = get_link(subtest_data)
 
-                if cell_message != "":
-                    try:
-                        # if cell_message is dict obj, then it will be {'text': HTML_A_TEXT, 'href': HTML_A_HREF, 'target': HTML_A_TARGET}
-                        link = pickle.loads(cell_message)
-                        if 'text' in link and 'href' in link:
-                            if 'target' in link:
-                                cell_message = html.div(html.pre(html.a(link['text'], href=link['href'], target=link['target'])), class_='log')
-                            else:
-                                cell_message = html.div(html.pre(html.a(link['text'], href=link['href'])), class_='log')
-                    except:
-                        log = html.pre()
-                        for line in cell_message.splitlines():
-                            separator = line.startswith(' ' * 10)
-                            if separator:
-                                log.append(line[:80])
-                            else:
-                                if line.lower().find("error") != -1 or line.lower().find("exception") != -1:
-                                    log.append(html.span(raw(cgi.escape(line)), class_='error'))
-                                else:
-                                    log.append(raw(cgi.escape(line)))
-                        cell_message = html.div(log, class_='log')
-
-                href = 'data:text/plain;charset=utf-8;base64,%s' % base64.b64encode(json.dumps(subtest_data))
-
-                cells.extend([
-                    html.td(test_name, class_="parent_test %s col-parent" % odd_or_even),
-                    html.td(
-                        html.a(sub_name, class_='test col-subtest', href=href, target='_blank'),
-                        class_="parent_test %s" % odd_or_even),
-                    html.td(cell_expected,
-                        class_="condition col-expected %s %s" % (class_expected, odd_or_even)),
-                    html.td(cell_status.title(),
-                        class_="condition col-result %s %s" % (cell_status, odd_or_even))
-                ])
-                if cell_message == "":
-                    rv.append(
-                        html.tr(cells, class_='passed results-table-row %s %s' % (cell_status, odd_or_even))
-                        )
+                if cell_message == "" and link is None:
+                    row_class = 'passed results-table-row %s %s' % (cell_status, odd_or_even)
                 else:
-                   rv.extend([
-                        html.tr(cells, class_='error results-table-row %s %s' % (cell_status, odd_or_even)),
-                        html.tr(html.td(cell_message, class_='debug {}'.format(odd_or_even), colspan=5))
-                        ])
-        return rv
+                    row_class = 'error results-table-row %s %s' % (cell_status, odd_or_even)
+
+                with w.element('tr', class_=row_class):
+                    w.leaf('td', test_name, class_="parent_test %s col-parent" % odd_or_even)
+                    with w.element('td', class_="parent_test %s" % odd_or_even):
+                        w.data_link(sub_name, StringIO(json.dumps(subtest_data)),
+                                    class_='test col-subtest', target='_blank')
+                    w.leaf('td', cell_expected,
+                        class_="condition col-expected %s %s" % (class_expected, odd_or_even))
+                    w.leaf('td', cell_status.title(),
+                        class_="condition col-result %s %s" % (cell_status, odd_or_even))
+
+                if cell_message != "" or link is not None:
+                    with w.element('tr'):
+                        with w.element('td', class_='debug {}'.format(odd_or_even), colspan=5):
+                            with w.element('div', class_='log'):
+                                if link is not None:
+                                    w.newline()
+                                    w.write('<pre>')
+                                    w.inline('a', link['text'], href=link['href'],
+                                             target=link.get('target'))
+                                    w.write('</pre>')
+                                else:
+                                    write_pre_log(w, cell_message)
 
     def get_cell_expected(self, subtest_data):
         if  'expected' in subtest_data:
@@ -203,9 +142,14 @@ class HTMLBuilder(object):
         return sub_name
 
 
+def write_report(f, results):
+    HTMLBuilder().write_report(f, results)
+
+
 def make_report(results):
-    doc = HTMLBuilder().make_report(results)
-    return u"<!DOCTYPE html>\n" + doc.unicode(indent=2)
+    f = StringIO()
+    write_report(f, results)
+    return f.getvalue().decode('utf-8')
 
 
 def make_file_report(path):
@@ -213,7 +157,8 @@ def make_file_report(path):
     results = parse_log(path)
     with open('/tmp/test.html', 'w') as f:
         print 'write file /tmp/test.html'
-        f.write(make_report(results))
+        write_report(f, results)
+    results.close()
 
 if __name__ == "__main__":
     import sys
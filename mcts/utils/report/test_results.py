@@ -0,0 +1,96 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import unittest
+from cStringIO import StringIO
+
+import subsuite
+from results import KEY_MAIN, LogHandler, ResultsSummary
+
+
+def messages():
+    yield {"action": "suite_start", "source": "webapi", "tests": []}
+    for test, statuses in [(u"test_b.py TestB.test_x", ["PASS", "FAIL"]),
+                           (u"test_a.py TestA.test_y", ["PASS", "PASS"]),
+                           (u"test_c.py TestC.test_z", ["TIMEOUT"])]:
+        for i, status in enumerate(statuses):
+            yield {"action": "test_status", "test": test, "subtest": "sub%d" % i,
+                   "status": status, "expected": "PASS", "message": "%s %d" % (status, i)}
+        yield {"action": "test_end", "test": test, "status": "OK", "expected": "OK"}
+    yield {"action": "test_end", "test": ["reftest.html", "==", "ref.html"],
+           "status": "ERROR", "expected": "OK"}
+    yield {"action": "log", "level": "ERROR", "message": "broken"}
+
+
+class TestResults(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = LogHandler()
+        for data in messages():
+            self.handler(data)
+        self.results = self.handler.results
+
+    def tearDown(self):
+        self.results.close()
+
+    def test_counts(self):
+        self.assertEquals("webapi", self.results.name)
+        self.assertEquals(9, self.results.regressions.count())
+        self.assertEquals(1, self.results.fails)
+        self.assertEquals(1, len(self.results.errors))
+        summary = ResultsSummary(self.results)
+        self.assertEquals((9, 1, 1), (summary.num_regressions, summary.num_errors, summary.fails))
+        self.assertTrue(summary.has_regressions)
+
+    def test_failures(self):
+        # only the failing results are kept in memory
+        self.assertEquals({u"test_b.py TestB.test_x": ["sub1"],
+                           u"test_c.py TestC.test_z": ["sub0"],
+                           ("reftest.html", "==", "ref.html"): [KEY_MAIN]},
+                          dict((test, test_data.keys())
+                               for test, test_data in self.results.failures.iteritems()))
+
+        # a result reported again replaces the one before
+        self.handler({"action": "test_status", "test": u"test_b.py TestB.test_x",
+                      "subtest": "sub1", "status": "PASS", "expected": "PASS"})
+        self.assertFalse(u"test_b.py TestB.test_x" in self.results.failures)
+        self.assertEquals(9, self.results.regressions.count())
+
+    def test_iteritems(self):
+        items = list(self.results.regressions.iteritems())
+        self.assertEquals([u"test_a.py TestA.test_y", u"test_b.py TestB.test_x",
+                           u"test_c.py TestC.test_z"],
+                          sorted(test for test, test_data in items if not isinstance(test, tuple)))
+        self.assertTrue((("reftest.html", "==", "ref.html"), {KEY_MAIN: {
+            "action": "test_end", "test": ["reftest.html", "==", "ref.html"],
+            "status": "ERROR", "expected": "OK"}}) in items)
+        test_data = dict(items)[u"test_b.py TestB.test_x"]
+        self.assertEquals(["MAIN", "sub0", "sub1"], sorted(test_data))
+        self.assertEquals("FAIL 1", test_data["sub1"]["message"])
+
+    def test_report(self):
+        f = StringIO()
+        subsuite.write_report(f, self.results)
+        report = f.getvalue()
+        self.assertTrue("TestA.test_y" in report)
+        self.assertEquals(9, report.count('class="test col-subtest"'))
+
+    def test_close(self):
+        path = self.results.regressions.path
+        self.assertTrue(os.path.exists(path))
+        self.results.close()
+        self.assertFalse(os.path.exists(path))
+        self.results.close()
+
+    def test_empty(self):
+        results = LogHandler().results
+        self.assertEquals(0, results.regressions.count())
+        self.assertEquals([], list(results.regressions.iteritems()))
+        self.assertFalse(results.has_regressions)
+        self.assertEquals(None, results.regressions.path)
+        results.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from resultsdb import ResultsDB, split_entry, get_build
+
+KEY_MAIN = 'MAIN'
+
+
+def structured_log(source, results):
+    """A structured log of source with a test_status message for each
+    (test, subtest, status) of results, and a test_end for each test."""
+    lines = [{"action": "suite_start", "tests": [], "source": source}]
+    tests = []
+    for test, subtest, status in results:
+        if test not in tests:
+            tests.append(test)
+            lines.append({"action": "test_start", "test": test, "source": source})
+        if subtest != KEY_MAIN:
+            lines.append({"action": "test_status", "test": test, "subtest": subtest,
+                          "status": status, "message": "%s %s" % (subtest, status),
+                          "source": source})
+    for test in tests:
+        status = dict((t, s) for t, subtest, s in results if subtest == KEY_MAIN).get(test, "OK")
+        lines.append({"action": "test_end", "test": test, "status": status, "source": source})
+    lines.append({"action": "suite_end", "source": source})
+    for line in lines:
+        line.update({"time": 0, "thread": "MainThread", "pid": 1})
+    return "".join(json.dumps(line) + "\n" for line in lines)
+
+
+class TestResultsDB(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = ResultsDB(os.path.join(self.temp_dir, "results.sqlite"))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+
+    def make_zip(self, name, build, results, serial=None):
+        path = os.path.join(self.temp_dir, name)
+        prefix = serial + "/" if serial else ""
+        with zipfile.ZipFile(path, "w") as zip_file:
+            zip_file.writestr(prefix + "cert/cert_structured.log",
+                              structured_log("cert", results))
+            zip_file.writestr(prefix + "cert/cert_results.json",
+                              json.dumps({"buildprops": {"ro.build.display.id": build,
+                                                         "ro.product.model": "model"}}))
+            zip_file.writestr(prefix + "report.html", "")
+        return path
+
+    def test_split_entry(self):
+        self.assertEquals(("", "cert", "cert"), split_entry("cert/cert_structured.log"))
+        self.assertEquals(("0123", "0123/security_a", "security"),
+                          split_entry("0123/security_a/security_structured_a.log"))
+        self.assertEquals(None, split_entry("cert/cert_results.json"))
+        self.assertEquals(None, split_entry("cert_structured.log"))
+        self.assertEquals(None, split_entry("a/b/c/cert_structured.log"))
+
+    def test_get_build(self):
+        self.assertEquals("fp", get_build({"ro.build.fingerprint": "fp",
+                                           "ro.build.display.id": "id"}))
+        self.assertEquals("id", get_build({"ro.build.fingerprint": "",
+                                           "ro.build.display.id": "id"}))
+        self.assertEquals(None, get_build({}))
+
+    def test_ingest(self):
+        path = self.make_zip("firefox-os-certification_20150101120000.zip", "build1",
+                             [("a", "s1", "PASS")])
+        self.assertTrue(self.db.ingest(path))
+        self.assertFalse(self.db.ingest(path))
+        self.assertEquals([("build1", 1, "2015-01-01 12:00:00")], self.db.builds())
+
+        # a changed zip replaces the results read from it before
+        path = self.make_zip("firefox-os-certification_20150101120000.zip", "build1",
+                             [("a", "s1", "FAIL"), ("b", "s1", "PASS")])
+        os.utime(path, (0, 0))
+        self.assertTrue(self.db.ingest(path))
+        results = self.db.latest_results("build1")
+        self.assertEquals(["FAIL", "OK", "PASS", "OK"],
+                          [results[key].status for key in [("cert", "a", "s1"),
+                                                           ("cert", "a", KEY_MAIN),
+                                                           ("cert", "b", "s1"),
+                                                           ("cert", "b", KEY_MAIN)]])
+        self.assertEquals(4, len(results))
+        # a build property value selects the build too
+        self.assertEquals(results, self.db.latest_results("model"))
+
+    def test_compare(self):
+        self.db.ingest(self.make_zip("firefox-os-certification_20150101120000.zip", "build1",
+                                     [("a", "s1", "PASS"), ("a", "s2", "FAIL"),
+                                      ("b", "s1", "PASS"), ("c", "s1", "PASS")]))
+        self.db.ingest(self.make_zip("firefox-os-certification_20150102120000.zip", "build2",
+                                     [("a", "s1", "FAIL"), ("a", "s2", "PASS"),
+                                      ("b", "s1", "PASS"), ("d", "s1", "FAIL")],
+                                     serial="0123"))
+        regressions, fixes = self.db.compare("build1", "build2")
+        self.assertEquals([("cert", "a", "s1", "PASS", "FAIL", "s1 FAIL")],
+                          [tuple(change) for change in regressions])
+        self.assertEquals([("cert", "a", "s2", "FAIL", "PASS", "s2 PASS")],
+                          [tuple(change) for change in fixes])
+        self.assertEquals(regressions, self.db.regressions("build1", "build2"))
+        self.assertEquals(["build2", "build1"], [row[0] for row in self.db.builds()])
+
+        history = self.db.history("cert", "a", "s1")
+        self.assertEquals([("2015-01-01 12:00:00", "", "build1", "s1", "PASS"),
+                           ("2015-01-02 12:00:00", "0123", "build2", "s1", "FAIL")],
+                          [tuple(entry)[:5] for entry in history])
+        # s1, s2 and the test status itself, from both runs
+        self.assertEquals(6, len(self.db.history("cert", "a")))
+
+    def test_latest_results(self):
+        self.db.ingest(self.make_zip("firefox-os-certification_20150101120000.zip", "build1",
+                                     [("a", "s1", "FAIL")]))
+        self.db.ingest(self.make_zip("firefox-os-certification_20150103120000.zip", "build1",
+                                     [("a", "s1", "PASS")]))
+        self.db.ingest(self.make_zip("firefox-os-certification_20150102120000.zip", "build1",
+                                     [("a", "s1", "ERROR")]))
+        self.assertEquals("PASS", self.db.latest_results("build1")[("cert", "a", "s1")].status)
+        self.assertEquals({}, self.db.latest_results("build2"))
+
+if __name__ == '__main__':
+    unittest.main()
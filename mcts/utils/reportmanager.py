@@ -3,17 +3,24 @@
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 import report
 import zipfile
+import shutil
 import sys
 import os
+import tempfile
 
 from datetime import datetime
 
 class ReportManager(object):
-    def __init__(self):
+    def __init__(self, inline=False):
         reload(sys)
         sys.setdefaultencoding('utf-8')
+        # whether the summary embeds the subsuite reports and logs, rather
+        # than linking to them in the zip
+        self.inline = inline
         self.zip_file = None
         self.subsuite_results = {}
+        # device_info() of the DeviceFacts of each device, by serial
+        self.device_info = {}
         self.structured_path = None
 
     def setup_report(self, profile_path, zip_file = None,
@@ -30,37 +37,94 @@ class ReportManager(object):
         if self.structured_path:
             self.add_summary_report(self.structured_path)
 
-    def add_subsuite_report(self, path, result_files):
-        results = report.parse_log(path)
+    def add_subsuite_report(self, path, result_files, name=None, results=None):
+        """Add the report of a subsuite run. results are the Results collected
+        from its structured log at path while it ran; if not given, the log is
+        parsed for them. Returns the results of the subsuite's tests that
+        failed, if any."""
+        if results is None:
+            results = report.parse_log(path)
+        try:
+            return self.write_subsuite_report(results, result_files, name)
+        finally:
+            results.close()
 
-        # prepare embeded file data
+    def write_subsuite_report(self, results, result_files, name):
+        if name is not None:
+            results.name = name
+
+        # files are copied into the zip from disk, in chunks; the reports
+        # only need to know their names in the zip
         files_map = {}
         for path in result_files:
             if os.path.exists(path):
                 file_name = os.path.split(path)[1]
-                with open(path, 'r') as f:
-                    files_map[file_name] = f.read()
-                self.zip_file.writestr("%s/%s" % (results.name, os.path.basename(path)), files_map[file_name])
+                files_map[file_name] = "%s/%s" % (results.name, file_name)
+                self.zip_file.write(path, files_map[file_name])
         results.set('files', files_map)
 
+        # only the counts the summary shows are kept once the subsuite
+        # report is written, so the run's memory use doesn't grow with the
+        # number of tests
         self.subsuite_results[results.name] = {}
         self.subsuite_results[results.name]['files'] = files_map
-        self.subsuite_results[results.name]['results'] = results
-        self.subsuite_results[results.name]['html_str'] = report.subsuite.make_report(results)
-
+        self.subsuite_results[results.name]['results'] = report.results.ResultsSummary(results)
         path = "%s/report.html" % results.name
-        self.zip_file.writestr(path, self.subsuite_results[results.name]['html_str'])
-        
-        if results.has_regressions:
-            return results.regressions
+        if self.inline:
+            html_str = report.subsuite.make_report(results)
+            self.subsuite_results[results.name]['html_str'] = html_str
+            self.zip_file.writestr(path, html_str)
+        else:
+            with tempfile.NamedTemporaryFile() as f:
+                report.subsuite.write_report(f, results)
+                f.flush()
+                self.zip_file.write(f.name, path)
+
+        if results.failures:
+            return results.failures
         else:
             return None
 
+    def add_device_facts(self, serial, facts):
+        """Record the DeviceFacts of a device the tests ran on, to be shown
+        in the summary report."""
+        if facts is not None:
+            self.device_info[serial] = facts.device_info()
+
+    def add_device_report(self, serial, report_manager, zip_path):
+        """Merge the subsuite reports of a per device ReportManager, written
+        to its own zip at zip_path, into this report under serial/."""
+        with zipfile.ZipFile(zip_path) as device_zip:
+            for name in device_zip.namelist():
+                with device_zip.open(name) as entry:
+                    self.write_entry("%s/%s" % (serial, name), entry)
+
+        for name, subsuite in report_manager.subsuite_results.iteritems():
+            self.subsuite_results["%s/%s" % (serial, name)] = subsuite
+
     def add_summary_report(self, path):
         summary_results = report.parse_log(path)
-        html_str = report.summary.make_report(self.time,
-                                              summary_results,
-                                              self.subsuite_results,
-                                              [path, self.profile_path])
-        path = "report.html"
-        self.zip_file.writestr(path, html_str)
+        logs = [path, self.profile_path]
+        if not self.inline and self.profile_path:
+            # the run log is added to the zip by the LogManager
+            self.zip_file.write(self.profile_path, os.path.basename(self.profile_path))
+
+        try:
+            with tempfile.NamedTemporaryFile() as f:
+                report.summary.write_report(f, self.time,
+                                            summary_results,
+                                            self.subsuite_results,
+                                            logs, inline=self.inline,
+                                            device_info=self.device_info)
+                f.flush()
+                self.zip_file.write(f.name, "report.html")
+        finally:
+            summary_results.close()
+
+    def write_entry(self, name, f):
+        """Copy the file object f to the zip entry name without reading
+        it into memory as a whole."""
+        with tempfile.NamedTemporaryFile() as tmp:
+            shutil.copyfileobj(f, tmp)
+            tmp.flush()
+            self.zip_file.write(tmp.name, name)
@@ -0,0 +1,116 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from catalog import TestCatalog, source_signature
+
+
+class Listing(object):
+    '''A compute function for TestCatalog.get that counts its calls'''
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+class TestTestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.temp_dir, 'tests')
+        os.makedirs(os.path.join(self.source_dir, 'sub'))
+        self.write('test_a.py', 'a')
+        self.write('sub/test_b.py', 'bb')
+        self.path = os.path.join(self.temp_dir, 'catalog', 'test-catalog.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, name, data):
+        with open(os.path.join(self.source_dir, name), 'w') as f:
+            f.write(data)
+
+    def test_source_signature(self):
+        signature = source_signature([self.source_dir])
+        self.assertEquals(2, signature[0])
+        self.assertEquals(3, signature[2])
+
+        # compiled files don't change the signature
+        self.write('test_a.pyc', 'compiled')
+        self.assertEquals(signature, source_signature([self.source_dir]))
+
+        self.write('sub/test_c.py', 'c')
+        self.assertEquals([3, 4], source_signature([self.source_dir])[::2])
+        self.assertEquals([0, 0, 0], source_signature([os.path.join(self.temp_dir, 'none')]))
+
+    def test_get(self):
+        listing = Listing(['test_a', 'test_b'])
+        catalog = TestCatalog(self.path)
+        self.assertEquals(listing.value, catalog.get('key', [self.source_dir], listing))
+        self.assertEquals(listing.value, catalog.get('key', [self.source_dir], listing))
+        self.assertEquals(1, listing.calls)
+        self.assertTrue(os.path.exists(self.path))
+
+        # a new catalog reads the listing back from disk
+        catalog = TestCatalog(self.path)
+        self.assertEquals(listing.value, catalog.get('key', [self.source_dir], listing))
+        self.assertEquals(1, listing.calls)
+
+        # other keys are listed separately
+        other = Listing(['test_c'])
+        self.assertEquals(other.value, catalog.get('other', [self.source_dir], other))
+        self.assertEquals(1, other.calls)
+        self.assertEquals(['key', 'other'], sorted(json.load(open(self.path))))
+
+    def test_changed_sources(self):
+        listing = Listing(['test_a'])
+        catalog = TestCatalog(self.path)
+        catalog.get('key', [self.source_dir], listing)
+        self.write('test_a.py', 'changed')
+        catalog.get('key', [self.source_dir], listing)
+        self.assertEquals(2, listing.calls)
+
+    def test_uncached(self):
+        listing = Listing(['test_a'])
+        catalog = TestCatalog(self.path)
+        catalog.get('key', None, listing)
+        catalog.get('key', None, listing)
+        self.assertEquals(2, listing.calls)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_bad_file(self):
+        os.makedirs(os.path.dirname(self.path))
+        for data in ['not json', '["a list"]']:
+            with open(self.path, 'w') as f:
+                f.write(data)
+            self.assertEquals({}, TestCatalog(self.path).load())
+
+        listing = Listing(['test_a'])
+        self.assertEquals(listing.value,
+                          TestCatalog(self.path).get('key', [self.source_dir], listing))
+        self.assertEquals(listing.value,
+                          TestCatalog(self.path).get('key', [self.source_dir], listing))
+        self.assertEquals(1, listing.calls)
+
+    def test_unwritable(self):
+        # a catalog that can't be saved still lists the tests
+        with open(os.path.join(self.temp_dir, 'catalog'), 'w') as f:
+            f.write('a file where the directory should be')
+        listing = Listing(['test_a'])
+        catalog = TestCatalog(self.path)
+        self.assertEquals(listing.value, catalog.get('key', [self.source_dir], listing))
+        self.assertEquals(listing.value, catalog.get('key', [self.source_dir], listing))
+        self.assertEquals(1, listing.calls)
+
+if __name__ == '__main__':
+    unittest.main()
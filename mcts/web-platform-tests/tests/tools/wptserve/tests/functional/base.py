@@ -29,12 +29,16 @@ class Request(urllib2.Request):
         urllib2.Request.add_data(self, data)
 
 class TestUsingServer(unittest.TestCase):
+    #Server class the tests run against, or None for the default
+    server_cls = None
+
     def setUp(self):
         self.server = wptserve.server.WebTestHttpd(host="localhost",
                                                    port=0,
                                                    use_ssl=False,
                                                    certificate=None,
-                                                   doc_root=doc_root)
+                                                   doc_root=doc_root,
+                                                   server_cls=self.server_cls)
         self.server.start(False)
 
     def tearDown(self):
@@ -0,0 +1,95 @@
+import httplib
+import os
+import socket
+import threading
+import time
+import unittest
+
+import wptserve
+from wptserve.eventloop import EventLoopServer
+from base import TestUsingServer, doc_root
+
+import test_cookies
+import test_handlers
+import test_pipes
+import test_request
+import test_response
+import test_server
+import test_stash
+
+
+def event_loop_tests(module):
+    """Run each TestUsingServer test case in module against EventLoopServer"""
+    for name, value in vars(module).items():
+        if (isinstance(value, type) and issubclass(value, TestUsingServer) and
+            value is not TestUsingServer):
+            prefix = "EventLoop%s" % module.__name__[len("test_"):].title()
+            cls = type(prefix + name, (value,), {"server_cls": EventLoopServer,
+                                                 "__module__": __name__})
+            globals()[cls.__name__] = cls
+
+for module in [test_cookies, test_handlers, test_pipes, test_request, test_response,
+               test_server, test_stash]:
+    event_loop_tests(module)
+
+
+class SingleWorkerServer(EventLoopServer):
+    def __init__(self, *args, **kwargs):
+        kwargs["max_workers"] = 1
+        EventLoopServer.__init__(self, *args, **kwargs)
+
+
+class TestEventLoop(TestUsingServer):
+    server_cls = SingleWorkerServer
+
+    def test_trickle_releases_worker(self):
+        #Each response pauses for a second, which would take the single
+        #worker three seconds if it waited out each pause
+        results = []
+
+        def fetch():
+            resp = self.request("/document.txt", query="pipe=trickle(1:d1)")
+            results.append(resp.read())
+
+        threads = [threading.Thread(target=fetch) for i in range(3)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLess(time.time() - start, 2.5)
+
+        expected = open(os.path.join(doc_root, "document.txt"), "rb").read()
+        self.assertEquals([expected] * 3, results)
+
+    def test_keep_alive(self):
+        conn = httplib.HTTPConnection(self.server.host, self.server.port)
+        expected = open(os.path.join(doc_root, "document.txt"), "rb").read()
+        try:
+            for i in range(3):
+                conn.request("GET", "/document.txt")
+                resp = conn.getresponse()
+                self.assertEquals(200, resp.status)
+                self.assertEquals(expected, resp.read())
+        finally:
+            conn.close()
+
+    def test_pipelined(self):
+        sock = socket.create_connection((self.server.host, self.server.port))
+        try:
+            sock.sendall("GET /document.txt HTTP/1.1\r\nHost: localhost\r\n\r\n" * 2 +
+                         "GET /document.txt HTTP/1.1\r\nHost: localhost\r\n"
+                         "Connection: close\r\n\r\n")
+            data = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data.append(chunk)
+        finally:
+            sock.close()
+        self.assertEquals(3, "".join(data).count("HTTP/1.1 200 OK"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -81,6 +81,31 @@ class TestFileHandler(TestUsingServer):
             self.request("/document.txt", headers={"Range":"bytes=%i-%i" % (len(expected), len(expected) + 10)})
         self.assertEquals(cm.exception.code, 416)
 
+    def test_large_file(self):
+        path = os.path.join(doc_root, "large.bin")
+        expected = "".join(chr(i % 251) for i in xrange(3 * 1024 * 1024 + 17))
+        with open(path, "wb") as f:
+            f.write(expected)
+        try:
+            resp = self.request("/large.bin")
+            self.assertEquals(200, resp.getcode())
+            self.assertEquals(str(len(expected)), resp.info()['Content-Length'])
+            self.assertEquals(expected, resp.read())
+
+            resp = self.request("/large.bin", headers={"Range":"bytes=70000-1200000"})
+            self.assertEquals(206, resp.getcode())
+            self.assertEquals("bytes 70000-1200000/%i" % len(expected), resp.info()['Content-Range'])
+            self.assertEquals(expected[70000:1200001], resp.read())
+        finally:
+            os.unlink(path)
+
+    def test_HEAD(self):
+        resp = self.request("/document.txt", method="HEAD")
+        expected = open(os.path.join(doc_root, "document.txt")).read()
+        self.assertEquals(200, resp.getcode())
+        self.assertEquals(str(len(expected)), resp.info()['Content-Length'])
+        self.assertEquals("", resp.read())
+
 
 class TestFunctionHandler(TestUsingServer):
     def test_string_rv(self):
@@ -192,6 +217,33 @@ class TestPythonHandler(TestUsingServer):
         self.assertEquals("PASS", resp.info()["X-Test"])
         self.assertEquals("PASS", resp.read())
 
+    def test_cache(self):
+        name = "test_cache_%s.py" % uuid.uuid4().hex
+        path = os.path.join(doc_root, name)
+        handler = wptserve.handlers.python_script_handler
+        script = "count = [0]\ndef main(request, response):\n    count[0] += 1\n    return '%s' + str(count[0])"
+        with open(path, "w") as f:
+            f.write(script % "a")
+        try:
+            for i in range(2):
+                resp = self.request("/" + name)
+                self.assertEquals("a1", resp.read())
+            self.assertEquals(1, handler.stats()[path]["hits"])
+            self.assertEquals(1, handler.stats()[path]["misses"])
+
+            with open(path, "w") as f:
+                f.write(script % "bb")
+            resp = self.request("/" + name)
+            self.assertEquals("bb1", resp.read())
+            self.assertEquals(2, handler.stats()[path]["misses"])
+
+            handler.invalidate(path)
+            resp = self.request("/" + name)
+            self.assertEquals("bb1", resp.read())
+            self.assertEquals(3, handler.stats()[path]["misses"])
+        finally:
+            os.unlink(path)
+
 class TestDirectoryHandler(TestUsingServer):
     def test_directory(self):
         resp = self.request("/")
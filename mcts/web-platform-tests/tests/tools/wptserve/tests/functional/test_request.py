@@ -48,6 +48,39 @@ class TestInputFile(TestUsingServer):
         self.assertEquals(200, resp.getcode())
         self.assertEquals(["12345\n", "abcdef\r\n", "zyxwv"], resp.read().split(" "))
 
+    def test_large_multipart_body(self):
+        @wptserve.handlers.handler
+        def handler(request, response):
+            f = request.raw_input
+            lines = [len(line) for line in f]
+            f.seek(0)
+            return json.dumps({"lines": lines,
+                               "value": request.POST.first("value"),
+                               "body": request.body == f.read()})
+
+        # spill the body to disk, and read its lines in several blocks
+        self.addCleanup(setattr, wptserve.request.InputFile, "max_buffer_size",
+                        wptserve.request.InputFile.max_buffer_size)
+        self.addCleanup(setattr, wptserve.request.InputFile, "block_size",
+                        wptserve.request.InputFile.block_size)
+        wptserve.request.InputFile.max_buffer_size = 1024
+        wptserve.request.InputFile.block_size = 100
+
+        value = "".join(str(i % 10) for i in xrange(5000))
+        body = ("--boundary\r\n"
+                "Content-Disposition: form-data; name=\"value\"\r\n\r\n"
+                "%s\r\n"
+                "--boundary--\r\n") % value
+        route = ("POST", "/test/test_large_multipart_body", handler)
+        self.server.router.register(*route)
+        resp = self.request(route[1], method="POST", body=body,
+                            headers={"Content-Type": "multipart/form-data; boundary=boundary"})
+        self.assertEquals(200, resp.getcode())
+        data = json.loads(resp.read())
+        self.assertEquals([len(line) for line in body.splitlines(True)], data["lines"])
+        self.assertEquals(value, data["value"])
+        self.assertTrue(data["body"])
+
 class TestRequest(TestUsingServer):
     def test_body(self):
         @wptserve.handlers.handler
@@ -0,0 +1,92 @@
+import itertools
+import unittest
+import urlparse
+
+from wptserve.router import Router, any_method
+
+
+class Request(object):
+    def __init__(self, method, path):
+        self.method = method
+        self.url_parts = urlparse.urlsplit(path)
+
+
+def linear_match(router, method, path):
+    """The route the router used to find by trying each in turn"""
+    for route_method, regexp, handler in reversed(router.routes):
+        if (method == route_method or
+            route_method is any_method or
+            (method == "HEAD" and route_method == "GET")):
+            if regexp.match(path):
+                return handler
+    return None
+
+
+class TestRouter(unittest.TestCase):
+    routes = [(any_method, "*.py", "python"),
+              ("GET", "*.asis", "asis"),
+              ("GET", "*", "file"),
+              ("POST", "/api/{resource}/*.json", "api"),
+              ("GET", "/static/*", "static"),
+              ("GET", "/static/index.html", "index"),
+              (["GET", "POST"], "/results", "results"),
+              ("PUT", "/{name}.sub.js", "sub"),
+              ("GET", "/a.b/*", "dotted"),
+              ("DELETE", "*", "delete")]
+
+    paths = ["/", "/test.py", "/dir/test.py", "/test.asis", "/api/foo/a/b.json",
+             "/api/foo/b.json", "/api/b.json", "/static/index.html", "/static/",
+             "/static/x.py", "/results", "/results/", "/x.sub.js", "/a/x.sub.js",
+             "/a.b/c", "/a.b/c.py", "/no.ext/path", "/.py", "/x.json"]
+
+    def check(self, router):
+        for method, path in itertools.product(["GET", "HEAD", "POST", "PUT", "DELETE"],
+                                              self.paths):
+            self.assertEquals(linear_match(router, method, path),
+                              router.get_handler(Request(method, path)),
+                              "%s %s" % (method, path))
+
+    def test_precedence(self):
+        self.check(Router("/", self.routes))
+
+    def test_register(self):
+        router = Router("/", self.routes)
+        self.assertEquals("file", router.get_handler(Request("GET", "/static/index.html")))
+        router.register("GET", "/static/*.html", "html")
+        self.assertEquals("html", router.get_handler(Request("GET", "/static/index.html")))
+        self.check(router)
+
+    def test_cache(self):
+        router = Router("/", self.routes, cache_size=4)
+        for i in range(2):
+            self.check(router)
+        self.assertEquals(4, len(router._cache))
+        router.register("GET", "*.py", "python-get")
+        self.assertEquals(0, len(router._cache))
+        self.assertEquals("python-get", router.get_handler(Request("GET", "/test.py")))
+
+    def test_register_during_lookup(self):
+        router = Router("/", self.routes, cache_size=4)
+        table = router._table
+
+        def table_then_register(method):
+            rv = table(method)
+            router.register("GET", "*.py", "python-get")
+            return rv
+
+        router._table = table_then_register
+        self.assertEquals("python", router.get_handler(Request("GET", "/test.py")))
+        del router._table
+        self.assertEquals(0, len(router._cache))
+        self.assertEquals("python-get", router.get_handler(Request("GET", "/test.py")))
+
+    def test_route_match(self):
+        router = Router("/", self.routes, cache_size=4)
+        for i in range(2):
+            request = Request("POST", "/api/foo/a/b.json")
+            self.assertEquals("api", router.get_handler(request))
+            self.assertEquals({"resource": "foo", "*": "a/b"}, request.route_match)
+
+
+if __name__ == "__main__":
+    unittest.main()
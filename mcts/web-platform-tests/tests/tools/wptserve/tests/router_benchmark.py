@@ -0,0 +1,119 @@
+import argparse
+import os
+import sys
+import time
+import urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from wptserve.router import Router, any_method, logger
+from wptserve.routes import routes as default_routes
+
+
+class Request(object):
+    def __init__(self, method, path):
+        self.method = method
+        self.url_parts = urlparse.urlsplit(path)
+
+
+def make_routes(count):
+    """count per-test routes, like those a test harness registers, on top of
+    the default file and script routes"""
+    routes = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            routes.append(("POST", "/tests/%i/results" % i, "results"))
+        elif kind == 1:
+            routes.append(("GET", "/tests/%i/{name}/*.json" % i, "json"))
+        elif kind == 2:
+            routes.append((any_method, "/apps/%i/*" % i, "app"))
+        else:
+            routes.append(("GET", "/tests/%i/*.sub.js" % i, "sub"))
+    return routes + default_routes
+
+
+def make_requests(count):
+    requests = []
+    for i in range(0, count, max(count // 16, 1)):
+        requests.extend([Request("POST", "/tests/%i/results" % i),
+                         Request("GET", "/tests/%i/foo/data.json" % i),
+                         Request("GET", "/apps/%i/index.html" % i),
+                         Request("GET", "/tests/%i/test.sub.js" % i)])
+    requests.extend([Request("GET", "/resources/testharness.js"),
+                     Request("GET", "/webapi/test.py"),
+                     Request("GET", "/webapi/test.html"),
+                     Request("HEAD", "/media/video.webm")])
+    return requests
+
+
+def linear_get_handler(router, request):
+    """How the router used to find handlers, for comparison"""
+    for method, regexp, handler in reversed(router.routes):
+        if (request.method == method or
+            method is any_method or
+            (request.method == "HEAD" and method == "GET")):
+            m = regexp.match(request.url_parts.path)
+            if m:
+                if not hasattr(handler, "__class__"):
+                    name = handler.__name__
+                else:
+                    name = handler.__class__.__name__
+                logger.debug("Found handler %s" % name)
+
+                match_parts = m.groupdict().copy()
+                if len(match_parts) < len(m.groups()):
+                    match_parts["*"] = m.groups()[-1]
+                request.route_match = match_parts
+
+                return handler
+    return None
+
+
+def measure(get_handler, requests, duration):
+    count = 0
+    start = time.time()
+    while True:
+        for request in requests:
+            get_handler(request)
+        count += len(requests)
+        elapsed = time.time() - start
+        if elapsed >= duration:
+            return count / elapsed
+
+
+def main(argv):
+    """
+    Measure how many requests per second the router finds handlers for, by
+    number of registered routes.
+
+    usage: router_benchmark.py [--routes N ...] [--duration SECONDS] [--cache-size N]
+    """
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--routes", type=int, nargs="+", default=[10, 100, 1000],
+                           help="numbers of routes to measure with")
+    argparser.add_argument("--duration", type=float, default=1.0,
+                           help="seconds to measure each configuration for")
+    argparser.add_argument("--cache-size", type=int, default=1024,
+                           help="size of the router's path cache for the cached run")
+    args = argparser.parse_args(argv[1:])
+
+    print "%-8s %14s %14s %14s" % ("routes", "linear", "compiled", "cached")
+    for count in args.routes:
+        routes = make_routes(count)
+        requests = make_requests(count)
+        router = Router("/", routes)
+        cached_router = Router("/", routes, cache_size=args.cache_size)
+        for request in requests:
+            assert router.get_handler(request) == linear_get_handler(router, request)
+
+        rates = [measure(lambda request: linear_get_handler(router, request),
+                         requests, args.duration),
+                 measure(router.get_handler, requests, args.duration),
+                 measure(cached_router.get_handler, requests, args.duration)]
+        print "%-8i %12.0f/s %12.0f/s %12.0f/s" % tuple([len(routes)] + rates)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,632 @@
+"""Alternative server core, serving all connections from a single event loop.
+
+WebTestServer uses a thread per connection, blocking on its socket for as
+long as the connection stays open. EventLoopServer instead multiplexes the
+sockets of all connections on one thread, which reads each request in full
+before it is processed and writes out the responses as the sockets accept
+them.
+
+Processing a request is unchanged: the same WebTestRequestHandler parses
+it, and routes it to a handler working on Request and Response objects,
+but this happens on one of a bounded pool of worker threads, as handlers
+may block. What the handler writes is queued for the event loop to send.
+Delay items in the response content, as added by the trickle pipe, are
+timers on the event loop rather than sleeping workers.
+
+Use it by passing server_cls=EventLoopServer to WebTestHttpd. SSL isn't
+supported.
+"""
+
+import errno
+import heapq
+import itertools
+import logging
+import Queue
+import re
+import select
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import types
+from collections import deque
+
+from request import InputFile
+from response import Delay
+from server import WebTestServer, set_server_config
+
+logger = logging.getLogger("wptserve")
+
+# Most bytes of request headers accepted, as for the request line in
+# WebTestRequestHandler
+max_header_size = 65536
+
+header_end = re.compile(r"\r?\n\r?\n")
+content_length = re.compile(r"^content-length:[ \t]*(\d+)[ \t]*\r?$", re.I | re.M)
+
+
+class EpollSelector(object):
+    """Wait for file descriptors to become readable or writable"""
+    def __init__(self):
+        self.epoll = select.epoll()
+
+    def register(self, fd, read, write):
+        self.epoll.register(fd, self._events(read, write))
+
+    def modify(self, fd, read, write):
+        self.epoll.modify(fd, self._events(read, write))
+
+    def unregister(self, fd):
+        self.epoll.unregister(fd)
+
+    def select(self, timeout):
+        """Returns a list of (fd, readable, writable) tuples"""
+        try:
+            events = self.epoll.poll(-1 if timeout is None else timeout)
+        except IOError as e:
+            if e.errno == errno.EINTR:
+                return []
+            raise
+        # errors and hang ups are reported as readable, so that the next
+        # read finds out what happened
+        return [(fd,
+                 bool(mask & (select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP)),
+                 bool(mask & select.EPOLLOUT))
+                for fd, mask in events]
+
+    def close(self):
+        self.epoll.close()
+
+    def _events(self, read, write):
+        return (select.EPOLLIN if read else 0) | (select.EPOLLOUT if write else 0)
+
+
+class SelectSelector(object):
+    """Wait for file descriptors to become readable or writable, for
+    platforms without epoll"""
+    def __init__(self):
+        self.readers = set()
+        self.writers = set()
+
+    def register(self, fd, read, write):
+        self.modify(fd, read, write)
+
+    def modify(self, fd, read, write):
+        for fds, wanted in [(self.readers, read), (self.writers, write)]:
+            if wanted:
+                fds.add(fd)
+            else:
+                fds.discard(fd)
+
+    def unregister(self, fd):
+        self.readers.discard(fd)
+        self.writers.discard(fd)
+
+    def select(self, timeout):
+        try:
+            readable, writable, _ = select.select(self.readers, self.writers, [], timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+        readable, writable = set(readable), set(writable)
+        return [(fd, fd in readable, fd in writable) for fd in readable | writable]
+
+    def close(self):
+        pass
+
+
+def socket_pair():
+    """Connected pair of sockets, for waking up the event loop"""
+    if hasattr(socket, "socketpair"):
+        return socket.socketpair()
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client.connect(listener.getsockname())
+        server, _ = listener.accept()
+        return server, client
+    finally:
+        listener.close()
+
+
+class EventLoop(object):
+    """Single threaded loop calling back on socket readiness and timers.
+
+    Only call_soon_threadsafe and stop may be called from other threads."""
+    def __init__(self):
+        self.selector = EpollSelector() if hasattr(select, "epoll") else SelectSelector()
+        self.handlers = {}
+        self.timers = []
+        self.timer_ids = itertools.count()
+        self.callbacks = deque()
+        self.running = False
+        self.stopped = threading.Event()
+        self.stopped.set()
+
+        self._wake_read, self._wake_write = socket_pair()
+        self._wake_read.setblocking(0)
+        self._wake_write.setblocking(0)
+        self.add(self._wake_read.fileno(), self)
+
+    def add(self, fd, handler, read=True, write=False):
+        """Call handler.handle_read() or handler.handle_write() when fd
+        becomes readable or writable"""
+        self.handlers[fd] = handler
+        self.selector.register(fd, read, write)
+
+    def update(self, fd, read, write):
+        if fd in self.handlers:
+            self.selector.modify(fd, read, write)
+
+    def remove(self, fd):
+        if self.handlers.pop(fd, None) is not None:
+            self.selector.unregister(fd)
+
+    def call_later(self, delay, callback):
+        heapq.heappush(self.timers, (time.time() + delay, next(self.timer_ids), callback))
+
+    def call_soon_threadsafe(self, callback):
+        self.callbacks.append(callback)
+        try:
+            self._wake_write.send("x")
+        except socket.error:
+            # already awake, with the buffer full of wake ups
+            pass
+
+    def handle_read(self):
+        try:
+            while self._wake_read.recv(4096):
+                pass
+        except socket.error:
+            pass
+
+    def run(self):
+        self.running = True
+        self.stopped.clear()
+        try:
+            while self.running:
+                self._run_once()
+        finally:
+            self.stopped.set()
+
+    def stop(self):
+        def stop():
+            self.running = False
+        self.call_soon_threadsafe(stop)
+
+    def close(self):
+        self.remove(self._wake_read.fileno())
+        self._wake_read.close()
+        self._wake_write.close()
+        self.selector.close()
+
+    def _run_once(self):
+        timeout = None
+        if self.callbacks:
+            timeout = 0
+        elif self.timers:
+            timeout = max(0, self.timers[0][0] - time.time())
+
+        for fd, readable, writable in self.selector.select(timeout):
+            if readable and fd in self.handlers:
+                self._call(self.handlers[fd].handle_read)
+            if writable and fd in self.handlers:
+                self._call(self.handlers[fd].handle_write)
+
+        now = time.time()
+        while self.timers and self.timers[0][0] <= now:
+            _, _, callback = heapq.heappop(self.timers)
+            self._call(callback)
+
+        for i in xrange(len(self.callbacks)):
+            self._call(self.callbacks.popleft())
+
+    def _call(self, callback):
+        try:
+            callback()
+        except Exception:
+            logger.error(traceback.format_exc())
+
+
+class WorkerPool(object):
+    """Fixed number of threads running functions submitted to it"""
+    def __init__(self, size):
+        self.tasks = Queue.Queue()
+        self.threads = []
+        for i in range(size):
+            thread = threading.Thread(target=self._work, name="wptserve-worker-%i" % i)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, func, *args):
+        self.tasks.put((func, args))
+
+    def stop(self):
+        for thread in self.threads:
+            self.tasks.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def _work(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            func, args = task
+            try:
+                func(*args)
+            except Exception:
+                logger.error(traceback.format_exc())
+
+
+class ConnectionWriter(object):
+    """wfile of the request handlers of a Connection, queueing what they
+    write for the event loop to send"""
+    def __init__(self, connection):
+        self.connection = connection
+
+    def write(self, data):
+        self.connection.send(str(data))
+
+    def flush(self):
+        pass
+
+
+class Connection(object):
+    """A client connection served by the event loop.
+
+    The loop reads requests into a buffer, one at a time, and hands each
+    complete request to a worker, which writes the response into the
+    output queue that the loop sends. The next request is read once the
+    response to the last one has been queued in full.
+    """
+
+    # Workers writing a response wait for the output queue to drop below
+    # this many bytes
+    max_queued = 1024 * 1024
+
+    def __init__(self, server, sock, client_address):
+        self.server = server
+        self.loop = server.loop
+        self.socket = sock
+        self.fd = sock.fileno()
+        self.client_address = client_address
+
+        # state of the request being read
+        self.buffer = ""
+        self.body = None
+        self.body_remaining = 0
+        self.processing = False
+        self.read_closed = False
+
+        self.output = deque()
+        self.queued = 0
+        self.output_lock = threading.Condition()
+        self.close_when_sent = False
+        self.closed = False
+
+        # parts of the request still to finish, the handler and any
+        # content scheduled on the event loop
+        self.outstanding = 0
+        self.request_handler = None
+
+        sock.setblocking(0)
+        self.loop.add(self.fd, self)
+
+    # Event loop side
+
+    def handle_read(self):
+        try:
+            data = self.socket.recv(65536)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            data = ""
+        if not data:
+            if self.processing or self.read_closed:
+                # reading is only enabled between requests, so this is
+                # an error or hang up reported by epoll regardless
+                self.close()
+            else:
+                # the client won't send another request, but may still
+                # be reading the response to the last one
+                self.read_closed = True
+                self.close_when_sent = True
+                self._update()
+                self._close_if_sent()
+            return
+        self._received(data)
+
+    def _received(self, data):
+        if self.body is not None:
+            body_data = data[:self.body_remaining]
+            self.body.write(body_data)
+            self.body_remaining -= len(body_data)
+            self.buffer += data[len(body_data):]
+        else:
+            self.buffer += data
+            self._parse_headers()
+
+        if self.body is not None and self.body_remaining == 0:
+            self._dispatch()
+
+    def _parse_headers(self):
+        # ignore empty lines before the request, as after a POST body
+        self.buffer = self.buffer.lstrip("\r\n")
+        m = header_end.search(self.buffer)
+        if m is None:
+            if len(self.buffer) > 2 * max_header_size:
+                self.close()
+            return
+
+        headers = self.buffer[:m.end()]
+        self.buffer = self.buffer[m.end():]
+
+        length = content_length.search(headers)
+        length = int(length.group(1)) if length else 0
+        self.body = tempfile.SpooledTemporaryFile(max_size=InputFile.max_buffer_size)
+        self.body.write(headers)
+        self.body_remaining = length
+
+        data, self.buffer = self.buffer, ""
+        if data:
+            self._received(data)
+
+    def _dispatch(self):
+        rfile, self.body = self.body, None
+        rfile.seek(0)
+        self.processing = True
+        self.outstanding = 1
+        self._update()
+        self.server.pool.submit(self.process, rfile)
+
+    def _request_done(self):
+        self.processing = False
+        if self.request_handler is None or self.request_handler.close_connection:
+            self.close_when_sent = True
+        self.request_handler = None
+        if self.close_when_sent:
+            self._update()
+            self._close_if_sent()
+            return
+        self._update()
+        data, self.buffer = self.buffer, ""
+        if data:
+            self._received(data)
+
+    def handle_write(self):
+        with self.output_lock:
+            while self.output:
+                data = self.output[0]
+                try:
+                    sent = self.socket.send(data)
+                except socket.error as e:
+                    if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                        break
+                    self.close()
+                    return
+                self.queued -= sent
+                if sent < len(data):
+                    self.output[0] = data[sent:]
+                    break
+                self.output.popleft()
+            self.output_lock.notify_all()
+        self._update()
+        self._close_if_sent()
+
+    def _close_if_sent(self):
+        if self.close_when_sent and not self.processing and not self.output:
+            self.close()
+
+    def _update(self):
+        if not self.closed:
+            self.loop.update(self.fd, not (self.processing or self.read_closed),
+                             bool(self.output))
+
+    def close(self):
+        if self.closed:
+            return
+        with self.output_lock:
+            self.closed = True
+            self.output.clear()
+            self.queued = 0
+            self.output_lock.notify_all()
+        self.loop.remove(self.fd)
+        self.server.connections.discard(self)
+        try:
+            self.socket.close()
+        except socket.error:
+            pass
+
+    # Worker side
+
+    def send(self, data):
+        """Queue data to be sent, waiting while too much is queued already"""
+        if not data:
+            return
+        with self.output_lock:
+            while self.queued > self.max_queued and not self.closed:
+                self.output_lock.wait()
+            if self.closed:
+                raise socket.error(errno.EPIPE, "Connection closed")
+            was_empty = not self.output
+            self.output.append(data)
+            self.queued += len(data)
+        if was_empty:
+            self.loop.call_soon_threadsafe(self._update)
+
+    def make_request_handler(self, rfile):
+        #The handler is set up here rather than by its constructor, which
+        #would go on to handle the requests on a blocking socket
+        handler_cls = self.server.RequestHandlerClass
+        if isinstance(handler_cls, types.ClassType):
+            request_handler = types.InstanceType(handler_cls)
+        else:
+            request_handler = handler_cls.__new__(handler_cls)
+        request_handler.server = self.server
+        request_handler.client_address = self.client_address
+        request_handler.request = None
+        request_handler.connection = None
+        request_handler.rfile = rfile
+        request_handler.wfile = ConnectionWriter(self)
+        request_handler.close_connection = 1
+        request_handler.event_loop_connection = self
+        return request_handler
+
+    def process(self, rfile):
+        try:
+            self.request_handler = self.make_request_handler(rfile)
+            self.request_handler.handle_one_request()
+        except socket.error:
+            self.close_when_sent = True
+        except Exception:
+            self.close_when_sent = True
+            self.server.handle_error(None, self.client_address)
+        finally:
+            self.part_done()
+
+    def write_content(self, response, items):
+        """Write content items, scheduling the rest of them on the event
+        loop at a Delay; returns False if it did so"""
+        for item in items:
+            if isinstance(item, Delay):
+                with self.output_lock:
+                    self.outstanding += 1
+
+                def resume():
+                    self.server.pool.submit(self.resume_content, response, items)
+
+                self.loop.call_soon_threadsafe(
+                    lambda: self.loop.call_later(item.seconds, resume))
+                return False
+            if hasattr(item, "__call__"):
+                item = item()
+            if item:
+                response.writer.write_content(item)
+        return True
+
+    def resume_content(self, response, items):
+        try:
+            self.write_content(response, items)
+        except socket.error:
+            self.close_when_sent = True
+        except Exception:
+            self.close_when_sent = True
+            self.server.handle_error(None, self.client_address)
+        finally:
+            self.part_done()
+
+    def part_done(self):
+        with self.output_lock:
+            self.outstanding -= 1
+            done = self.outstanding == 0
+        if done:
+            self.loop.call_soon_threadsafe(self._request_done)
+
+
+class EventLoopServer(object):
+    allow_reuse_address = True
+    request_queue_size = 128
+    acceptable_errors = WebTestServer.acceptable_errors
+
+    def __init__(self, server_address, RequestHandlerClass, router, rewriter, bind_hostname,
+                 config=None, use_ssl=False, certificate=None, max_workers=16, **kwargs):
+        """Server for HTTP Requests running on an event loop
+
+        Takes the same parameters as WebTestServer, except that use_ssl
+        isn't supported, and:
+
+        :param max_workers: Number of threads processing requests
+        """
+        if use_ssl:
+            raise ValueError("EventLoopServer doesn't support SSL")
+
+        self.RequestHandlerClass = RequestHandlerClass
+        self.router = router
+        self.rewriter = rewriter
+        self.scheme = "http"
+
+        if bind_hostname:
+            hostname_port = server_address
+        else:
+            hostname_port = ("", server_address[1])
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if self.allow_reuse_address:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(hostname_port)
+        self.socket.listen(self.request_queue_size)
+        self.server_address = self.socket.getsockname()
+        host, port = self.server_address[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+
+        set_server_config(config, server_address[0], self.server_address[1])
+
+        self.loop = EventLoop()
+        self.pool = WorkerPool(max_workers)
+        self.connections = set()
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def handle_read(self):
+        while True:
+            try:
+                sock, client_address = self.socket.accept()
+            except socket.error as e:
+                if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    logger.error("Error accepting connection: %s" % e)
+                return
+            self.connections.add(Connection(self, sock, client_address))
+
+    def serve_forever(self):
+        self.socket.setblocking(0)
+        self.loop.add(self.socket.fileno(), self)
+        try:
+            self.loop.run()
+        finally:
+            self.loop.remove(self.socket.fileno())
+            for connection in list(self.connections):
+                connection.close()
+
+    def shutdown(self):
+        """Stop serve_forever, and wait for it to return"""
+        self.loop.stop()
+        self.loop.stopped.wait()
+
+    def server_close(self):
+        self.socket.close()
+        self.pool.stop()
+        self.loop.close()
+
+    def write_response(self, request_handler, response):
+        """Write a response whose content the handler didn't write itself,
+        leaving any part following a Delay to the event loop"""
+        response.write_status_headers()
+        if response.request.method == "HEAD" and not response.send_body_for_head_request:
+            return
+        content = response.content
+        if type(content) in types.StringTypes:
+            content = [content]
+        request_handler.event_loop_connection.write_content(response, iter(content))
+
+    def handle_error(self, request, client_address):
+        error = sys.exc_value
+
+        if ((isinstance(error, socket.error) and
+             isinstance(error.args, tuple) and
+             error.args[0] in self.acceptable_errors)
+            or
+            (isinstance(error, IOError) and
+             error.errno in self.acceptable_errors)):
+            pass  # remote hang up before the result is sent
+        else:
+            logger.error(traceback.format_exc())
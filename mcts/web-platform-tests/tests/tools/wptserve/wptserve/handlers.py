@@ -2,6 +2,8 @@ import cgi
 import json
 import logging
 import os
+import threading
+import time
 import traceback
 import urllib
 import urlparse
@@ -9,7 +11,7 @@ import urlparse
 from constants import content_types
 from pipes import Pipeline, template
 from ranges import RangeParser
-from response import MultipartContent
+from response import FileContent, MultipartContent
 from utils import HTTPException
 
 logger = logging.getLogger("wptserve")
@@ -86,8 +88,6 @@ class FileHandler(object):
                         raise
             else:
                 byte_ranges = None
-            data = self.get_data(response, path, byte_ranges)
-            response.content = data
             query = urlparse.parse_qs(request.url_parts.query)
 
             pipeline = None
@@ -95,6 +95,14 @@ class FileHandler(object):
                 pipeline = Pipeline(query["pipe"][-1])
             elif os.path.splitext(path)[0].endswith(".sub"):
                 pipeline = Pipeline("sub")
+
+            if pipeline is None and (byte_ranges is None or len(byte_ranges) == 1):
+                # Nothing needs the data itself, so send it straight from the file
+                response.content = self.get_file_content(response, path, file_size, byte_ranges)
+                return response
+
+            data = self.get_data(response, path, byte_ranges)
+            response.content = data
             if pipeline is not None:
                 response = pipeline(request, response)
 
@@ -127,6 +135,17 @@ class FileHandler(object):
             return [tuple(item.strip() for item in line.split(":", 1))
                     for line in data.splitlines() if line]
 
+    def get_file_content(self, response, path, file_size, byte_ranges):
+        if byte_ranges is None:
+            offset, length = 0, file_size
+        else:
+            response.status = 206
+            response.headers.set("Content-Range", byte_ranges[0].header_value())
+            offset = byte_ranges[0].lower
+            length = byte_ranges[0].upper - byte_ranges[0].lower
+        response.headers.set("Content-Length", length)
+        return FileContent(path, offset, length)
+
     def get_data(self, response, path, byte_ranges):
         with open(path, 'rb') as f:
             if byte_ranges is None:
@@ -167,19 +186,96 @@ class FileHandler(object):
 file_handler = FileHandler()
 
 
-def python_script_handler(request, response):
-    path = request.filesystem_path
+class ScriptStats(object):
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.compile_time = 0.
+        self.run_time = 0.
+
+    def to_dict(self):
+        requests = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "compile_time": self.compile_time,
+                "run_time": self.run_time,
+                "mean_run_time": self.run_time / requests if requests else 0.}
+
+
+class PythonScriptHandler(object):
+    def __init__(self):
+        """Handler for .py scripts, which are run for every request. The
+        compiled code of each script is cached until the script's mtime or
+        size changes, but the script itself is executed afresh each time so
+        that module-level state isn't shared between requests."""
+        self._cache = {}
+        self._stats = {}
+        self._lock = threading.Lock()
 
-    try:
-        environ = {"__file__": path}
-        execfile(path, environ, environ)
-        if "main" in environ:
-            handler = FunctionHandler(environ["main"])
-            handler(request, response)
-        else:
-            raise HTTPException(500)
-    except IOError:
-        raise HTTPException(404)
+    def __call__(self, request, response):
+        path = request.filesystem_path
+
+        try:
+            code = self.get_code(path)
+        except (OSError, IOError):
+            raise HTTPException(404)
+
+        start = time.time()
+        try:
+            environ = {"__file__": path}
+            exec code in environ, environ
+            if "main" in environ:
+                handler = FunctionHandler(environ["main"])
+                handler(request, response)
+            else:
+                raise HTTPException(500)
+        except IOError:
+            raise HTTPException(404)
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                self._stats[path].run_time += elapsed
+
+    def get_code(self, path):
+        """Get the compiled code for the script at path, compiling it if
+        it isn't cached or has changed since it was cached."""
+        st = os.stat(path)
+        key = (st.st_mtime, st.st_size)
+        with self._lock:
+            stats = self._stats.setdefault(path, ScriptStats())
+            cached = self._cache.get(path)
+            if cached is not None and cached[0] == key:
+                stats.hits += 1
+                return cached[1]
+
+        start = time.time()
+        with open(path, "rU") as f:
+            source = f.read()
+        code = compile(source + "\n", path, "exec", 0, True)
+        elapsed = time.time() - start
+
+        with self._lock:
+            self._cache[path] = (key, code)
+            stats.misses += 1
+            stats.compile_time += elapsed
+        return code
+
+    def invalidate(self, path=None):
+        """Drop the cached code for path, or for all scripts if path is None"""
+        with self._lock:
+            if path is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(path, None)
+
+    def stats(self):
+        """Hit, miss and timing counters for each script that has been requested,
+        keyed by path"""
+        with self._lock:
+            return dict((path, stats.to_dict()) for path, stats in self._stats.iteritems())
+
+
+python_script_handler = PythonScriptHandler()
 
 
 def FunctionHandler(func):
@@ -2,11 +2,12 @@ from cgi import escape
 import gzip as gzip_module
 import logging
 import re
-import time
 import types
 import uuid
 from cStringIO import StringIO
 
+from response import Delay
+
 logger = logging.getLogger("wptserve")
 
 
@@ -238,19 +239,13 @@ def trickle(request, response, delays):
     modified_content = []
     offset = [0]
 
-    def sleep(seconds):
-        def inner():
-            time.sleep(seconds)
-            return ""
-        return inner
-
     def add_content(delays, repeat=False):
         for i, (item_type, value) in enumerate(delays):
             if item_type == "bytes":
                 modified_content.append(content[offset[0]:offset[0] + value])
                 offset[0] += value
             elif item_type == "delay":
-                modified_content.append(sleep(value))
+                modified_content.append(Delay(value))
             elif item_type == "repeat":
                 assert i == len(delays) - 1
                 while offset[0] < len(content):
@@ -3,7 +3,6 @@ import cgi
 import Cookie
 import logging
 import os
-import StringIO
 import tempfile
 import urlparse
 
@@ -35,94 +34,97 @@ class Server(object):
 
 class InputFile(object):
     max_buffer_size = 1024*1024
+    block_size = 64*1024
 
     def __init__(self, rfile, length):
-        """File-like object used to provide a seekable view of request body data"""
+        """File-like object used to provide a seekable view of request body data
+
+        Everything read from rfile is kept so that it can be read again
+        after seeking back; it is held in memory up to max_buffer_size
+        bytes and spilled to a temporary file beyond that."""
         self._file = rfile
         self.length = length
 
+        # Number of bytes read from rfile so far, all of which are in _buf
         self._file_position = 0
-
-        if length > self.max_buffer_size:
-            self._buf = tempfile.TemporaryFile(mode="rw+b")
-        else:
-            self._buf = StringIO.StringIO()
-
-    @property
-    def _buf_position(self):
-        rv = self._buf.tell()
-        assert rv <= self._file_position
-        return rv
+        self._position = 0
+        self._buf = tempfile.SpooledTemporaryFile(max_size=self.max_buffer_size)
+
+    def _append(self, data):
+        self._buf.seek(self._file_position)
+        self._buf.write(data)
+        self._file_position += len(data)
+        self._position = self._file_position
+
+    def _read_buffered(self, bytes, readline=False):
+        self._buf.seek(self._position)
+        bytes = min(bytes, self._file_position - self._position)
+        data = self._buf.readline(bytes) if readline else self._buf.read(bytes)
+        self._position += len(data)
+        return data
 
     def read(self, bytes=-1):
-        assert self._buf_position <= self._file_position
-
-        if bytes < 0:
-            bytes = self.length - self._buf_position
-        bytes_remaining = min(bytes, self.length - self._buf_position)
-
-        if bytes_remaining == 0:
+        bytes_available = self.length - self._position
+        if bytes < 0 or bytes > bytes_available:
+            bytes = bytes_available
+        if bytes == 0:
             return ""
 
-        if self._buf_position != self._file_position:
-            buf_bytes = min(bytes_remaining, self._file_position - self._buf_position)
-            old_data = self._buf.read(buf_bytes)
-            bytes_remaining -= buf_bytes
-        else:
-            old_data = ""
+        chunks = []
+        if self._position < self._file_position:
+            chunks.append(self._read_buffered(bytes))
+            bytes -= len(chunks[-1])
 
-        assert self._buf_position == self._file_position
-        new_data = self._file.read(bytes_remaining)
-        self._buf.write(new_data)
-        self._file_position += bytes_remaining
-        assert self._buf_position == self._file_position
+        while bytes > 0:
+            data = self._file.read(bytes)
+            if not data:
+                break
+            self._append(data)
+            chunks.append(data)
+            bytes -= len(data)
 
-        return old_data + new_data
+        return "".join(chunks)
 
     def tell(self):
-        return self._buf_position
+        return self._position
 
     def seek(self, offset):
         if offset > self.length or offset < 0:
             raise ValueError
         if offset <= self._file_position:
-            self._buf.seek(offset)
+            self._position = offset
         else:
+            self._position = self._file_position
             self.read(offset - self._file_position)
 
     def readline(self, max_bytes=None):
-        if max_bytes is None:
-            max_bytes = self.length - self._buf_position
+        bytes_available = self.length - self._position
+        if max_bytes is None or max_bytes < 0 or max_bytes > bytes_available:
+            max_bytes = bytes_available
+        if max_bytes == 0:
+            return ""
 
-        if self._buf_position < self._file_position:
-            data = self._buf.readline(max_bytes)
-            if data.endswith("\n") or len(data) == max_bytes:
+        chunks = []
+        if self._position < self._file_position:
+            data = self._read_buffered(max_bytes, readline=True)
+            max_bytes -= len(data)
+            if data.endswith("\n") or max_bytes == 0:
                 return data
-        else:
-            data = ""
-
-        assert self._buf_position == self._file_position
-
-        initial_position = self._file_position
-        found = False
-        buf = []
-        max_bytes -= len(data)
-        while not found:
-            readahead = self.read(min(2, max_bytes))
-            max_bytes -= len(readahead)
-            for i, c in enumerate(readahead):
-                if c == "\n":
-                    buf.append(readahead[:i+1])
-                    found = True
-                    break
-            if not found:
-                buf.append(readahead)
-            if not readahead or not max_bytes:
+            chunks.append(data)
+
+        # rfile does its own buffering and scanning for the line end, so
+        # this takes a call per line, or per block of a long line
+        while max_bytes > 0:
+            data = self._file.readline(min(max_bytes, self.block_size))
+            if not data:
                 break
-        new_data = "".join(buf)
-        data += new_data
-        self.seek(initial_position + len(new_data))
-        return data
+            self._append(data)
+            chunks.append(data)
+            max_bytes -= len(data)
+            if data.endswith("\n"):
+                break
+
+        return "".join(chunks)
 
     def readlines(self):
         rv = []
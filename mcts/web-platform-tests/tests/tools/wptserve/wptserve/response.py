@@ -3,6 +3,9 @@ from datetime import datetime, timedelta
 import Cookie
 import json
 import logging
+import mmap
+import os
+import time
 import types
 import uuid
 
@@ -193,6 +196,9 @@ class Response(object):
     def write_content(self):
         """Write out the response content"""
         if self.request.method != "HEAD" or self.send_body_for_head_request:
+            if isinstance(self.content, FileContent):
+                self.writer.write_file(self.content)
+                return
             for item in self.iter_content():
                 self.writer.write_content(item)
 
@@ -215,6 +221,57 @@ class Response(object):
             logger.error(message)
 
 
+class Delay(object):
+    """Response content item that pauses the response before the items
+    following it are written.
+
+    :param seconds: Length of the pause
+
+    Calling it sleeps for the pause and returns no content, so it can be
+    written like any other callable item; servers that write responses
+    from an event loop schedule the rest of the response instead."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self):
+        time.sleep(self.seconds)
+        return ""
+
+
+class FileContent(object):
+    """Response content taken from a part of a file on disk, which is sent
+    without reading the file into memory.
+
+    :param path: Path of the file
+    :param offset: Offset of the first byte to send
+    :param length: Number of bytes to send
+
+    Iterating over it yields the data in chunks."""
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, path, offset, length):
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            for chunk in self.iter_chunks(f):
+                yield chunk
+
+    def iter_chunks(self, f):
+        f.seek(self.offset)
+        remaining = self.length
+        while remaining > 0:
+            data = f.read(min(self.chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
 class MultipartContent(object):
     def __init__(self, boundary=None, default_content_type=None):
         self.items = []
@@ -346,6 +403,10 @@ class ResponseWriter(object):
     After each part of the response is written, the output is
     flushed unless response.explicit_flush is False, in which case
     the user must call .flush() explicitly."""
+
+    # how much of a mapped file is handed to the socket at once
+    file_chunk_size = 1024 * 1024
+
     def __init__(self, handler, response):
         self._wfile = handler.wfile
         self._response = response
@@ -414,6 +475,43 @@ class ResponseWriter(object):
         if not self._response.explicit_flush:
             self.flush()
 
+    def write_file(self, content):
+        """Write a FileContent as the body of the response.
+
+        The file is mapped into memory and the mapping handed to the socket,
+        rather than read into strings; if it can't be mapped it is written
+        in chunks. Flushes the output."""
+        self.flush()
+        self.content_written = True
+        if content.length <= 0:
+            return
+
+        sock = getattr(self._handler, "connection", None)
+        with open(content.path, "rb") as f:
+            # mappings have to start at a multiple of the allocation granularity
+            start = content.offset - content.offset % mmap.ALLOCATIONGRANULARITY
+            try:
+                data = mmap.mmap(f.fileno(), content.offset + content.length - start,
+                                 access=mmap.ACCESS_READ, offset=start)
+            except (mmap.error, ValueError, OverflowError):
+                data = None
+
+            if data is None or sock is None:
+                for chunk in content.iter_chunks(f):
+                    self._wfile.write(chunk)
+                self.flush()
+                return
+
+            try:
+                pos = content.offset - start
+                end = pos + content.length
+                while pos < end:
+                    size = min(self.file_chunk_size, end - pos)
+                    sock.sendall(buffer(data, pos, size))
+                    pos += size
+            finally:
+                data.close()
+
     def write(self, data):
         """Write directly to the response, converting unicode to bytes
         according to response.encoding. Does not flush."""
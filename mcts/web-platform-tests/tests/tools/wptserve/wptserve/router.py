@@ -1,7 +1,9 @@
 import itertools
 import logging
 import re
+import threading
 import types
+from collections import OrderedDict
 
 logger = logging.getLogger("wptserve")
 logger.setLevel(logging.DEBUG)
@@ -72,7 +74,7 @@ class RouteCompiler(object):
         self.star_seen = True
         return "(.*)"
 
-def compile_path_match(route_pattern):
+def tokenize_path_match(route_pattern):
     """tokens: / or literal or match or *"""
 
     tokenizer = RouteTokenizer()
@@ -80,9 +82,116 @@ def compile_path_match(route_pattern):
 
     assert unmatched is "", unmatched
 
+    if not tokens or tokens[0][0] != "slash":
+        tokens = [("slash", None)] + tokens
+
+    return tokens
+
+def compile_path_match(route_pattern):
     compiler = RouteCompiler()
 
-    return compiler.compile(tokens)
+    return compiler.compile(tokenize_path_match(route_pattern))
+
+def path_extension(path):
+    """The extension of the last path segment, including the dot, or None"""
+    dot = path.rfind(".")
+    if dot == -1 or path.find("/", dot) != -1:
+        return None
+    return path[dot:]
+
+class Route(object):
+    """A registered route, along with the literal text any path it matches
+    must start and end with.
+
+    .. attribute:: index
+
+    Position of the route in the order of registration; later routes take
+    precedence over earlier ones.
+
+    .. attribute:: literal
+
+    True if the pattern contains no groups or star, so that it only
+    matches the path equal to prefix.
+
+    .. attribute:: extension
+
+    Extension that the paths the route matches end with, or None.
+    """
+    def __init__(self, index, method, path, handler):
+        self.index = index
+        self.method = method
+        self.handler = handler
+
+        tokens = tokenize_path_match(path)
+        self.regexp = RouteCompiler().compile(tokens)
+
+        texts = ["/" if kind == "slash" else value for kind, value in tokens]
+        variable = [i for i, (kind, _) in enumerate(tokens)
+                    if kind in ("group", "star")]
+        self.literal = not variable
+        if self.literal:
+            self.prefix = "".join(texts)
+            self.suffix = ""
+        else:
+            self.prefix = "".join(texts[:variable[0]])
+            self.suffix = "".join(texts[variable[-1] + 1:])
+        self.extension = path_extension(self.suffix) if self.suffix else None
+
+    def handles(self, method):
+        return (method == self.method or
+                self.method is any_method or
+                (method == "HEAD" and self.method == "GET"))
+
+    def match(self, path):
+        if not (path.startswith(self.prefix) and path.endswith(self.suffix)):
+            return None
+        return self.regexp.match(path)
+
+class RouteTable(object):
+    """The routes for a single request method, arranged so that a path is
+    only matched against the routes it could match.
+
+    Routes with no groups or star are looked up by path. The others are
+    grouped by the directory their literal prefix ends in and by the
+    extension they end with, if any, so that only the groups for the
+    directories containing the path are tried.
+    """
+    def __init__(self, routes):
+        self.exact = {}
+        self.buckets = {}
+        #Each bucket is kept in order of precedence
+        for route in sorted(routes, key=lambda route: -route.index):
+            if route.literal:
+                self.exact.setdefault(route.prefix, route)
+            else:
+                directory = route.prefix[:route.prefix.rfind("/") + 1]
+                self.buckets.setdefault((directory, route.extension), []).append(route)
+
+    def lookup(self, path):
+        """Find the route of highest precedence matching path.
+
+        :returns: (route, match) or (None, None)"""
+        best = self.exact.get(path)
+        best_match = best.regexp.match(path) if best is not None else None
+
+        extensions = [None]
+        extension = path_extension(path)
+        if extension is not None:
+            extensions.append(extension)
+
+        end = path.find("/") + 1
+        while end:
+            directory = path[:end]
+            for extension in extensions:
+                for route in self.buckets.get((directory, extension), ()):
+                    if best is not None and route.index < best.index:
+                        break
+                    m = route.match(path)
+                    if m:
+                        best, best_match = route, m
+                        break
+            end = path.find("/", end) + 1
+        return best, best_match
 
 class Router(object):
     """Object for matching handler functions to requests.
@@ -92,11 +201,22 @@ class Router(object):
     :param routes: Initial routes to add; a list of three item tuples
                    (method, path_pattern, handler_function), defined
                    as for register()
+    :param cache_size: Number of recently requested (method, path) pairs
+                       whose handlers are remembered, or 0 not to cache
+                       them
     """
 
-    def __init__(self, doc_root, routes):
+    def __init__(self, doc_root, routes, cache_size=0):
         self.doc_root = doc_root
         self.routes = []
+        self._routes = []
+        self.cache_size = cache_size
+        self._tables = {}
+        self._cache = OrderedDict()
+        # incremented by register, so that lookups that were made with
+        # the routes from before aren't cached
+        self._generation = 0
+        self._lock = threading.Lock()
         for route in reversed(routes):
             self.register(*route)
 
@@ -134,9 +254,43 @@ class Router(object):
         """
         if type(methods) in types.StringTypes or methods is any_method:
             methods = [methods]
-        for method in methods:
-            self.routes.append((method, compile_path_match(path), handler))
-            print self.routes[-1][1].pattern
+        with self._lock:
+            for method in methods:
+                route = Route(len(self.routes), method, path, handler)
+                self.routes.append((method, route.regexp, handler))
+                self._routes.append(route)
+            self._tables = {}
+            self._cache.clear()
+            self._generation += 1
+
+    def _table(self, method):
+        table = self._tables.get(method)
+        if table is None:
+            with self._lock:
+                table = RouteTable([route for route in self._routes
+                                    if route.handles(method)])
+                self._tables[method] = table
+        return table
+
+    def _lookup(self, method, path):
+        if not self.cache_size:
+            return self._table(method).lookup(path)
+
+        key = (method, path)
+        with self._lock:
+            rv = self._cache.pop(key, None)
+            if rv is not None:
+                self._cache[key] = rv
+                return rv
+            generation = self._generation
+        rv = self._table(method).lookup(path)
+        with self._lock:
+            if generation != self._generation:
+                return rv
+            self._cache[key] = rv
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return rv
 
     def get_handler(self, request):
         """Get a handler for a request or None if there is no handler.
@@ -144,22 +298,20 @@ class Router(object):
         :param request: Request to get a handler for.
         :rtype: Callable or None
         """
-        for method, regexp, handler in reversed(self.routes):
-            if (request.method == method or
-                method is any_method or
-                (request.method == "HEAD" and method == "GET")):
-                m = regexp.match(request.url_parts.path)
-                if m:
-                    if not hasattr(handler, "__class__"):
-                        name = handler.__name__
-                    else:
-                        name = handler.__class__.__name__
-                    logger.debug("Found handler %s" % name)
-
-                    match_parts = m.groupdict().copy()
-                    if len(match_parts) < len(m.groups()):
-                        match_parts["*"] = m.groups()[-1]
-                    request.route_match = match_parts
-
-                    return handler
-        return None
+        route, m = self._lookup(request.method, request.url_parts.path)
+        if route is None:
+            return None
+
+        handler = route.handler
+        if not hasattr(handler, "__class__"):
+            name = handler.__name__
+        else:
+            name = handler.__class__.__name__
+        logger.debug("Found handler %s" % name)
+
+        match_parts = m.groupdict().copy()
+        if len(match_parts) < len(m.groups()):
+            match_parts["*"] = m.groups()[-1]
+        request.route_match = match_parts
+
+        return handler
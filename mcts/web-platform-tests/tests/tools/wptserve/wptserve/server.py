@@ -103,6 +103,18 @@ class RequestRewriter(object):
                 request_handler.path = new_url
 
 
+def set_server_config(config, host, port):
+    """Set the environment configuration handlers read from Server.config,
+    defaulting to a single http server on host and port."""
+    if config is not None:
+        Server.config = config
+    else:
+        logger.debug("Using default configuration")
+        Server.config = {"host": host,
+                         "domains": {"": host},
+                         "ports": {"http": [port]}}
+
+
 class WebTestServer(ThreadingMixIn, BaseHTTPServer.HTTPServer):
     allow_reuse_address = True
     acceptable_errors = (errno.EPIPE, errno.ECONNABORTED)
@@ -147,19 +159,21 @@ class WebTestServer(ThreadingMixIn, BaseHTTPServer.HTTPServer):
         #super doesn't work here because BaseHTTPServer.HTTPServer is old-style
         BaseHTTPServer.HTTPServer.__init__(self, hostname_port, RequestHandlerClass, **kwargs)
 
-        if config is not None:
-            Server.config = config
-        else:
-            logger.debug("Using default configuration")
-            Server.config = {"host": server_address[0],
-                             "domains": {"": server_address[0]},
-                             "ports": {"http": [self.server_address[1]]}}
+        set_server_config(config, server_address[0], self.server_address[1])
 
         if use_ssl:
             self.socket = ssl.wrap_socket(self.socket,
                                           certfile=certificate,
                                           server_side=True)
 
+    def write_response(self, request_handler, response):
+        """Write a response whose content the handler didn't write itself
+
+        :param request_handler: WebTestRequestHandler for the request
+        :param response: Response to write
+        """
+        response.write()
+
     def handle_error(self, request, client_address):
         error = sys.exc_value
 
@@ -222,7 +236,7 @@ class WebTestRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
                                          request.request_path, request.headers.get('Referer'), request.raw_input.length))
 
             if not response.writer.content_written:
-                response.write()
+                self.server.write_response(self, response)
 
             # If we want to remove this in the future, a solution is needed for
             # scripts that produce a non-string iterable of content, since these
@@ -263,7 +277,9 @@ class WebTestHttpd(object):
     """
     :param host: Host from which to serve (default: 127.0.0.1)
     :param port: Port from which to serve (default: 8000)
-    :param server_cls: Class to use for the server (default depends on ssl vs non-ssl)
+    :param server_cls: Class to use for the server (default depends on ssl vs non-ssl);
+                       eventloop.EventLoopServer handles non-ssl requests on an
+                       event loop with a bounded pool of worker threads
     :param handler_cls: Class to use for the RequestHandler
     :param use_ssl: Use a SSL server if no explicit server_cls is supplied
     :param certificate: Certificate file to use if ssl is enabled
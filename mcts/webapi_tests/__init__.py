@@ -2,5 +2,6 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
-from mcts.webapi_tests import certapp
-from mcts.webapi_tests import semiauto
+# certapp and semiauto are imported by the tests that use them, rather than
+# here, so that the runner can list the tests without importing gaiatest,
+# fxos_appgen and tornado.
@@ -13,20 +13,30 @@ import json
 
 from fnmatch import fnmatch
 
-from mozdevice import DeviceManagerADB
 from mozlog.structured import commandline
 
-from mcts.webapi_tests import semiauto
-from mcts.webapi_tests.semiauto import environment
+from mcts.utils.catalog import TestCatalog
 
 stingray_test = ['apps', 'device_storage', 'geolocation',
                  'moztime', 'notification', 'tcp_socket']
 
 def iter_tests(start_dir, pattern="test_*.py", mode='phone'):
     """List available Web API tests and yield a tuple of (group, tests),
-    where tests is a list of test names."""
+    where tests is a list of test names. The listing is cached in the test
+    catalog until a file under start_dir changes, as it takes importing
+    every test module."""
 
     start_dir = os.path.abspath(start_dir)
+    key = "webapi %s %s %s" % (start_dir, pattern, mode)
+    listing = TestCatalog().get(key, [start_dir],
+                                lambda: list(find_tests(start_dir, pattern, mode)))
+    for group, tests in listing:
+        yield group, tests
+
+
+def find_tests(start_dir, pattern, mode):
+    from mcts.webapi_tests import semiauto
+
     visited = set()
 
     for root, dirs, files in os.walk(start_dir, followlinks=True):
@@ -83,6 +93,10 @@ def main():
     parser.add_argument("-i", "--include", metavar="GROUP", action="append", default=[],
                         help="Only include specified group(s) in run, include several "
                         "groups by repeating flag")
+    parser.add_argument("-t", "--test", metavar="TEST", action="append", default=[],
+                        help="Only run the specified test, given by its full id, e.g. "
+                        "mcts.webapi_tests.vibration.test_vibration.TestVibration.test_vibrate; "
+                        "run several tests by repeating flag")
     parser.add_argument("-n", "--no-browser", action="store_true",
                         help="Don't start a browser but wait for manual connection")
     parser.add_argument("--version", action="store", dest="version",
@@ -122,8 +136,13 @@ def main():
                 print("%s.%s" % (group, test))
         return 0
 
+    from mcts.utils.device.devicehelper import DeviceHelper
+    from mcts.webapi_tests import semiauto
+    from mcts.webapi_tests.semiauto import environment
+
     semiauto.testcase._host = args.host
     semiauto.testcase._port = int(args.port)
+    DeviceHelper.marionette_port = int(args.port)
 
     env = environment.get(environment.InProcessTestEnvironment)
     environment.env.device_profile = None
@@ -132,8 +151,11 @@ def main():
             environment.env.device_profile = json.load(device_profile_file)['result']
 
     test_loader = semiauto.TestLoader(version=args.version)
-    tests = test_loader.loadTestsFromNames(
-        map(lambda t: "mcts.webapi_tests.%s" % t, args.include or [g for g, _ in testgen]), None)
+    if args.test:
+        names = args.test
+    else:
+        names = map(lambda t: "mcts.webapi_tests.%s" % t, args.include or [g for g, _ in testgen])
+    tests = test_loader.loadTestsFromNames(names, None)
     results = semiauto.run(tests,
                            logger=logger,
                            spawn_browser=not args.no_browser,
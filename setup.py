@@ -26,4 +26,5 @@ setup(name='fxos-certsuite',
       entry_points={"console_scripts": ["runcertsuite = mcts:harness_main",
                                         "securityrunner = mcts.securitysuite:securitycli",
                                         "cert = mcts.certsuite:certcli",
-                                        "webapirunner = mcts.webapi_tests.runner:main"]})
+                                        "webapirunner = mcts.webapi_tests.runner:main",
+                                        "certresults = mcts.utils.report.resultsdb:main"]})